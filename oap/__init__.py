@@ -16,14 +16,12 @@ ____________________________________________________________________
 """
 
 # Importing the C++ extension (oap.core)
+from oap.core import build_index, decompress
 try:
-    from __oap_c.core import (
-        decompress,
-        OpticalArray
-    )
-except ModuleNotFoundError:
-    error_msg = "C extension of oap library is not compiled yet!"
-    print("Catching ModuleNotFoundError:", error_msg)
+    from oap.core import OpticalArray
+except ImportError:
+    # oap.core reports, that the C extension is not compiled yet.
+    pass
 
 from oap.__conf__ import (
     __version__,
@@ -37,6 +35,7 @@ from oap.__conf__ import (
     PLATE,
 )
 from oap.lib.imagefile import Imagefile, load_imagefile
+from oap.lib.campaign import decompress_many
 from oap.utils import (
     barycenter,
     adjust_y,
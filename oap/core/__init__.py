@@ -1,12 +1,248 @@
+import os
+
+import numpy as np
+
+from oap.lib.container import Container, is_container, write_container
+
 try:
     from __oap_c.core import (
         decompress as __decompress,
-        OpticalArray
+        arrays_to_records as __arrays_to_records,
+        records_to_arrays as __records_to_arrays,
+        tensors as __tensors,
+        index_buffers as __index_buffers,
+        detect_probe as __detect_probe,
+        attribute_version as __attribute_version,
+        OpticalArray,
+        BUFFER_INDEX_ENTRY_SIZE,
+        RECORD_SIZE,
+        SLICE_KERNEL,
     )
 except ModuleNotFoundError:
     error_msg = "C extension of oap library is not compiled yet!"
     print("Catching ModuleNotFoundError:", error_msg)
 
 
-def decompress(*args, **kwargs):
+# Size of the imagefile buffers (16 header bytes and 4096 data bytes, see imagefile.h). It
+# is also needed without the C extension, e.g. to follow a growing imagefile.
+BUFFER_SIZE = 4112
+
+
+# Layout of the native particle records of the C extension (see particles.h).
+PARTICLE_DTYPE = np.dtype([
+    ("second", np.uint32),
+    ("number", np.uint16),
+    ("millisecond", np.uint16),
+    ("microsecond", np.uint16),
+    ("pixel_one", np.uint16),
+    ("pixel_two", np.uint16),
+    ("pixel_thr", np.uint16),
+    ("y_dim", np.uint8),
+    ("x_bary", np.uint8),
+    ("y_bary", np.uint8),
+    ("min_idx", np.uint8),
+    ("max_idx", np.uint8),
+    ("poisson", np.uint8),
+    ("poisson_mono", np.uint8),
+    ("truncated", np.uint8),
+    ("cluster", np.uint8),
+    ("hit_ratio", np.float32),
+    ("axis_ratio", np.float32),
+    ("alpha", np.float32),
+    ("column", np.float32),
+    ("rosette", np.float32),
+], align=True)
+
+
+# Layout of the buffer index entries of the C extension (see bufferindex.h).
+BUFFER_INDEX_DTYPE = np.dtype([
+    ("min_second", np.uint32),
+    ("max_second", np.uint32),
+    ("particles", np.uint32),
+    ("biterrors", np.uint32),
+])
+
+# Default filename of the buffer index is the imagefile name with this suffix.
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 2
+
+
+def decompress(filename, timeframes=None, *args, include_buffers=None, probe="auto",
+               columnar=False, contiguous=False, index=True, **kwargs):
+    """
+    Returns the number of particles or, if columnar is True, a structured
+    array (PARTICLE_DTYPE) with one record per particle. The records are
+    written by the C extension and are not copied.
+
+    If contiguous is True, a tuple of the records, the particle images of
+    all particles in one uint8 array and the offsets (int64) of the images
+    is returned. Image i is pixels[offsets[i]:offsets[i+1]]. OpticalArray
+    objects of the arrays list are views into the same pixels.
+
+    The data format is given by probe ("grayscale" or "monoscale"). It is
+    detected from the first buffers of the imagefile by default ("auto").
+
+    If timeframes are given and the imagefile has a buffer index (see
+    build_index), only the buffers overlapping the timeframes are decoded.
+    The index is either the default sidecar file or the filename passed
+    as index. Set index to False to decode all buffers. The probe of an
+    indexed imagefile is stored in the index and is not detected again.
+    """
+    indexed = _read_index(filename, None if index is True else index) if index else None
+    if indexed is not None:
+        entries, attributes = indexed
+        if include_buffers is None:
+            include_buffers = _buffers_in_timeframes(filename, entries, timeframes)
+        if probe == "auto":
+            probe = attributes.get("probe", probe)
+
+    # Both are passed by name, so they can not be given by position as well.
+    if include_buffers is not None:
+        kwargs["include_buffers"] = include_buffers
+    if probe != "auto":
+        kwargs["probe"] = probe
+
+    args = (filename, timeframes) + args
+    if contiguous:
+        records, pixels, offsets = __decompress(*args, contiguous=True, **kwargs)
+        return (np.frombuffer(records, dtype=PARTICLE_DTYPE),
+                np.frombuffer(pixels, dtype=np.uint8),
+                np.frombuffer(offsets, dtype=np.int64))
+    if columnar:
+        return np.frombuffer(__decompress(*args, columnar=True, **kwargs), dtype=PARTICLE_DTYPE)
     return __decompress(*args, **kwargs)
+
+
+def arrays_to_records(arrays, images=True):
+    return __arrays_to_records(arrays, images=images)
+
+
+def records_to_arrays(records, pixels):
+    return __records_to_arrays(records, pixels)
+
+
+def attribute_version():
+    """
+    Returns a counter, which is incremented whenever an attribute of any
+    OpticalArray object is set. Cached attribute values stay valid as long
+    as the counter is unchanged.
+    """
+    return __attribute_version()
+
+
+def tensors(arrays, out=None):
+    """
+    Returns the centred classifier tensors of the particles as float32
+    array of shape (N, 64, 64, 1). The tensors are written into out, if
+    a preallocated array is given.
+    """
+    if out is None:
+        out = np.empty((len(arrays), 64, 64, 1), dtype=np.float32)
+    __tensors(arrays, out)
+    return out
+
+
+def detect_probe(filename):
+    """
+    Returns the probe ("grayscale" or "monoscale") of an imagefile, which is
+    detected from its first buffers like probe="auto" of decompress.
+    """
+    return __detect_probe(filename)
+
+
+def build_index(filename, index=None, probe="auto"):
+    """
+    Decodes all buffers of an imagefile and writes the time range, the
+    number of particles and the biterror status of every buffer into a
+    sidecar container (filename + INDEX_SUFFIX by default). Returns the
+    filename of the index.
+    """
+    index = index or filename + INDEX_SUFFIX
+    entries, probe = __index_buffers(filename, probe=probe)
+    entries = np.frombuffer(entries, dtype=BUFFER_INDEX_DTYPE)
+    size = len(entries) * BUFFER_SIZE
+    header, last_header = _buffer_headers(filename, size)
+    write_container(index, {"buffers": entries},
+                    attributes={"version": INDEX_VERSION, "size": size, "header": header,
+                                "last_header": last_header, "probe": probe})
+    return index
+
+
+def _buffer_headers(filename, size):
+    # Headers of the first and of the last buffer of the first size bytes as hex strings.
+    with open(filename, "rb") as file:
+        header = file.read(16).hex()
+        if size < BUFFER_SIZE:
+            return header, ""
+        file.seek(size - BUFFER_SIZE)
+        return header, file.read(16).hex()
+
+
+def load_index(filename, index=None):
+    """
+    Returns the buffer index entries (BUFFER_INDEX_DTYPE) of an imagefile or
+    None, if there is no index or it does not belong to the imagefile. The
+    index of a growing imagefile stays valid for the indexed buffers. The
+    headers of the first and of the last indexed buffer must be unchanged.
+    """
+    indexed = _read_index(filename, index)
+    return None if indexed is None else indexed[0]
+
+
+def _read_index(filename, index=None):
+    # Entries and attributes of the buffer index or None (see load_index).
+    index = index or filename + INDEX_SUFFIX
+    if not os.path.isfile(index) or not is_container(index):
+        return None
+    with Container(index) as container:
+        attributes = container.attributes
+        size = attributes.get("size", 0)
+        if attributes.get("version") != INDEX_VERSION or os.path.getsize(filename) < size:
+            return None
+        if _buffer_headers(filename, size) != (attributes.get("header"), attributes.get("last_header")):
+            return None
+        return container["buffers"].copy(), attributes
+
+
+def indexed_buffers(filename, timeframes, index=None):
+    """
+    Returns the include_buffers ranges of the buffers, which may contain
+    particles within the timeframes, or None if the buffer index can not be
+    used. Buffers, which were appended after the index was built, are
+    always included.
+    """
+    if not isinstance(timeframes, list) or not timeframes:
+        return None
+    return _buffers_in_timeframes(filename, load_index(filename, index), timeframes)
+
+
+def _buffers_in_timeframes(filename, entries, timeframes):
+    # Buffer ranges of the index entries, which overlap the timeframes (see indexed_buffers).
+    if entries is None or not isinstance(timeframes, list) or not timeframes:
+        return None
+
+    # Sorted and merged timeframes, like the boundaries of the C extension.
+    bounds = []
+    for minimum, maximum in sorted(t[:2] for t in timeframes if isinstance(t, tuple) and len(t) >= 2):
+        if minimum > maximum:
+            continue
+        if bounds and minimum <= bounds[-1][1] + 1:
+            bounds[-1][1] = max(bounds[-1][1], maximum)
+        else:
+            bounds.append([minimum, maximum])
+    bounds = np.array(bounds, dtype=np.int64).reshape(-1, 2)
+
+    # First timeframe ending at or after the earliest particle of every buffer.
+    position = np.searchsorted(bounds[:, 1], entries["min_second"])
+    overlaps = position < len(bounds)
+    overlaps[overlaps] = bounds[position[overlaps], 0] <= entries["max_second"][overlaps]
+    overlaps &= entries["particles"] > 0
+
+    # Runs of consecutive buffers as inclusive ranges.
+    changes = np.flatnonzero(np.diff(np.concatenate(([0], overlaps.view(np.int8), [0]))))
+    buffers = [(int(first), int(last) - 1) for first, last in zip(changes[::2], changes[1::2])]
+
+    n_buffers = os.path.getsize(filename) // BUFFER_SIZE
+    if n_buffers > len(entries):
+        buffers.append((len(entries), n_buffers - 1))
+    return buffers
@@ -9,23 +9,42 @@ Last Update:    March 2021
 #define PY_SSIZE_T_CLEAN
 #include <Python.h>
 #include <stdbool.h>
+#include <stdint.h>
 
 #define _USE_MATH_DEFINES
 #include <math.h>
 #include <structmember.h>
 
 #include "utils.h"
-#include "opticalarray.h"
+#include "arena.h"
+#include "bitstream.h"
+#include "kernels.h"
+#include "imagefile.h"
+#include "monoscale.h"
+#include "filters.h"
+#include "particles.h"
+#include "nativebuffer.h"
+#include "cluster.h"
 #include "poisson.h"
+#include "packedpixels.h"
+#include "opticalarray.h"
 #include "principal.h"
-#include "cluster.h"
 #include "processing.h"
 #include "decompress.h"
+#include "bufferindex.h"
+#include "records.h"
+#include "tensors.h"
 
 
 
 static PyMethodDef core_methods[] = {
     {"decompress", (PyCFunction) decompress, METH_VARARGS | METH_KEYWORDS, ""},
+    {"arrays_to_records", (PyCFunction) arrays_to_records, METH_VARARGS | METH_KEYWORDS, ""},
+    {"records_to_arrays", (PyCFunction) records_to_arrays, METH_VARARGS | METH_KEYWORDS, ""},
+    {"tensors", (PyCFunction) tensors, METH_VARARGS | METH_KEYWORDS, ""},
+    {"index_buffers", (PyCFunction) index_buffers, METH_VARARGS | METH_KEYWORDS, ""},
+    {"detect_probe", (PyCFunction) detect_imagefile_probe, METH_VARARGS | METH_KEYWORDS, ""},
+    {"attribute_version", (PyCFunction) attribute_version, METH_NOARGS, ""},
     {NULL}  /* Sentinel */
 };
 
@@ -48,6 +67,14 @@ PyMODINIT_FUNC PyInit_core(void)
     if (PyType_Ready(&OpticalArrayType) < 0)
         return NULL;
 
+    if (PyType_Ready(&NativeBufferType) < 0)
+        return NULL;
+
+    init_grayscale_tables();
+    init_slice_kernels();
+    init_monoscale_tables();
+    init_packed_pixel_table();
+
     Py_INCREF(&OpticalArrayType);
     if (PyModule_AddObject(m, "OpticalArray", (PyObject *) &OpticalArrayType) < 0) {
         Py_DECREF(&OpticalArrayType);
@@ -55,5 +82,24 @@ PyMODINIT_FUNC PyInit_core(void)
         return NULL;
     }
 
+    // Size of the native particle records in bytes.
+    if (PyModule_AddIntConstant(m, "RECORD_SIZE", sizeof(ParticleRecord)) < 0) {
+        Py_DECREF(m);
+        return NULL;
+    }
+
+    // Size of the imagefile buffers and of the buffer index entries in bytes.
+    if (PyModule_AddIntConstant(m, "BUFFER_SIZE", BUFFER_SIZE) < 0
+        || PyModule_AddIntConstant(m, "BUFFER_INDEX_ENTRY_SIZE", sizeof(BufferIndexEntry)) < 0) {
+        Py_DECREF(m);
+        return NULL;
+    }
+
+    // Name of the slice kernel, which is used by the grayscale decoder.
+    if (PyModule_AddStringConstant(m, "SLICE_KERNEL", slice_kernel_name) < 0) {
+        Py_DECREF(m);
+        return NULL;
+    }
+
     return m;
 }
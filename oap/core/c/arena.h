@@ -0,0 +1,101 @@
+/*
+Scratch memory of the decoder.
+
+Every decode task owns one arena. It is sized once per buffer for the
+decompressed bit stream and the largest possible particle, so that the
+particle analyses allocate their temporary memory with a simple bump
+pointer instead of malloc and free.
+*/
+
+// Alignment of all allocations in bytes.
+#define SCRATCH_ALIGNMENT 16
+
+
+
+typedef struct {
+    unsigned char *memory;
+    size_t capacity;
+    size_t used;
+} ScratchArena;
+
+
+
+void
+init_scratch_arena(ScratchArena *arena)
+{
+    memset(arena, 0, sizeof(ScratchArena));
+}
+
+
+
+void
+free_scratch_arena(ScratchArena *arena)
+{
+    free(arena->memory);
+    init_scratch_arena(arena);
+}
+
+
+
+static inline size_t
+scratch_aligned(size_t size)
+{
+    return (size + SCRATCH_ALIGNMENT-1) & ~((size_t) SCRATCH_ALIGNMENT-1);
+}
+
+
+
+bool
+reset_scratch_arena(ScratchArena *arena, size_t size)
+{
+    /*
+    Releases all allocations and makes sure that the arena holds at least
+    size bytes. The memory only grows, so it is reused by the next buffers.
+    */
+    arena->used = 0;
+    if (size <= arena->capacity)
+        return true;
+
+    size_t capacity = arena->capacity ? arena->capacity : 4096;
+    while (capacity < size)
+        capacity *= 2;
+
+    free(arena->memory);
+    arena->memory = (unsigned char*) malloc(capacity);
+    arena->capacity = arena->memory ? capacity : 0;
+    return arena->memory != NULL;
+}
+
+
+
+void *
+scratch_alloc(ScratchArena *arena, size_t size)
+{
+    /*
+    Returns aligned memory of the arena or NULL, if the arena is too small.
+    */
+    size = scratch_aligned(size);
+    if (size > arena->capacity - arena->used)
+        return NULL;
+
+    void *memory = arena->memory + arena->used;
+    arena->used += size;
+    return memory;
+}
+
+
+
+static inline size_t
+scratch_mark(const ScratchArena *arena)
+{
+    return arena->used;
+}
+
+
+
+static inline void
+scratch_release(ScratchArena *arena, size_t mark)
+{
+    // Frees all allocations since the mark.
+    arena->used = mark;
+}
@@ -0,0 +1,390 @@
+/*
+Packed bit stream of decompressed grayscale imagefile data.
+
+The decompressed bits are stored in 64 bit words (first bit in the most
+significant bit), so that a data slice of 128 bits can be read with two
+word loads at any bit offset. Header fields are extracted with masks and
+shifts and the shadow levels of a slice are classified a word at a time.
+*/
+
+#if defined(_MSC_VER)
+#include <intrin.h>
+#endif
+
+
+
+#define ALL_ONES  0xFFFFFFFFFFFFFFFFULL
+#define EVEN_BITS 0x5555555555555555ULL
+
+/*
+Number of padding words behind the decompressed bits. Slices are read
+with two word loads, which may touch the word behind the last bit.
+*/
+#define STREAM_PADDING 2
+
+
+
+static inline int
+popcount64(uint64_t x)
+{
+#if defined(_MSC_VER)
+    return (int) __popcnt64(x);
+#else
+    return __builtin_popcountll(x);
+#endif
+}
+
+
+
+static inline int
+leading_zeros64(uint64_t x)
+{
+    // x must not be zero.
+#if defined(_MSC_VER)
+    unsigned long index;
+    _BitScanReverse64(&index, x);
+    return 63 - (int) index;
+#else
+    return __builtin_clzll(x);
+#endif
+}
+
+
+
+static inline int
+trailing_zeros64(uint64_t x)
+{
+    // x must not be zero.
+#if defined(_MSC_VER)
+    unsigned long index;
+    _BitScanForward64(&index, x);
+    return (int) index;
+#else
+    return __builtin_ctzll(x);
+#endif
+}
+
+
+
+static inline uint64_t
+byteswap64(uint64_t x)
+{
+#if defined(_MSC_VER)
+    return _byteswap_uint64(x);
+#else
+    return __builtin_bswap64(x);
+#endif
+}
+
+
+
+/*
+Number of literal bits of every compressed byte. Bytes with the highest
+bit set repeat the last two bits and are marked with -1.
+*/
+static signed char GRAYSCALE_LITERAL_BITS[256];
+
+/*
+Shadow levels of the four pixels, which are stored in one byte of a slice.
+
+-> Bit pairs: (1,1) = 0, (0,1) = 1, (1,0) = 2, (0,0) = 3
+*/
+static unsigned char GRAYSCALE_LEVELS[256][4];
+
+// The last two bits repeated over a whole word.
+static const uint64_t PAIR_PATTERNS[4] = {0, EVEN_BITS, ~EVEN_BITS, ALL_ONES};
+
+
+
+void
+init_grayscale_tables(void)
+{
+    static const unsigned char level_of_pair[4] = {3, 1, 2, 0};
+
+    for (int byte=0; byte<256; byte++)
+    {
+        if      (byte&128) GRAYSCALE_LITERAL_BITS[byte] = -1;
+        else if (byte&64)  GRAYSCALE_LITERAL_BITS[byte] = 6;
+        else if (byte&16)  GRAYSCALE_LITERAL_BITS[byte] = 4;
+        else if (byte&4)   GRAYSCALE_LITERAL_BITS[byte] = 2;
+        else               GRAYSCALE_LITERAL_BITS[byte] = 0;
+
+        for (int j=0; j<4; j++)
+            GRAYSCALE_LEVELS[byte][j] = level_of_pair[(byte >> (6-2*j)) & 3];
+    }
+}
+
+
+
+size_t
+stream_words(size_t bit_count)
+{
+    /*
+    Number of words, which are needed to store the decompressed bits.
+    */
+    return (bit_count+63) / 64 + STREAM_PADDING;
+}
+
+
+
+static inline void
+push_bits(uint64_t **word, uint64_t *accumulator, int *accumulated, uint64_t value, int length)
+{
+    /*
+    Appends 1 to 64 bits to the bit stream. The value must not contain
+    any bits above its length.
+    */
+    int free_bits = 64 - *accumulated;
+
+    if (length < free_bits)
+    {
+        *accumulator = (*accumulator << length) | value;
+        *accumulated += length;
+        return;
+    }
+    int rest = length - free_bits;
+    *(*word)++ = (free_bits < 64 ? *accumulator << free_bits : 0) | (value >> rest);
+    // Bits above the rest are shifted out before the next word is written.
+    *accumulator = value;
+    *accumulated = rest;
+}
+
+
+
+size_t
+expand_grayscale_data(const unsigned char *data, uint64_t *words)
+{
+    /*
+    Decompresses a grayscale data block into the packed bit stream and
+    returns the number of bits. The words must provide stream_words() of
+    count_grayscale_bits() words. The padding words are set to zero.
+    */
+    uint64_t *word = words;
+    uint64_t accumulator = 0;
+    int accumulated = 0;
+    int last_2_bits = 0;
+    size_t bit_count = 0;
+
+    for (int i=0; i<4096; i++)
+    {
+        int literal_bits = GRAYSCALE_LITERAL_BITS[data[i]];
+
+        if (literal_bits < 0)
+        {
+            // Repeat the last two bits in chunks of at most 64 bits.
+            int no_of_repeats = (data[i] & 127);
+            bit_count += 2*no_of_repeats;
+            while (no_of_repeats)
+            {
+                int chunk = no_of_repeats < 32 ? no_of_repeats : 32;
+                push_bits(&word, &accumulator, &accumulated,
+                          PAIR_PATTERNS[last_2_bits] >> (64-2*chunk), 2*chunk);
+                no_of_repeats -= chunk;
+            }
+        }
+        else
+        {
+            last_2_bits = (data[i] & 3);
+            if (literal_bits)
+            {
+                push_bits(&word, &accumulator, &accumulated,
+                          data[i] & ((1 << literal_bits) - 1), literal_bits);
+                bit_count += literal_bits;
+            }
+        }
+    }
+    if (accumulated)
+        *word++ = accumulator << (64-accumulated);
+    for (int i=0; i<STREAM_PADDING; i++)
+        *word++ = 0;
+
+    return bit_count;
+}
+
+
+
+static inline uint64_t
+read_stream_word(const uint64_t *words, size_t offset)
+{
+    /*
+    Returns 64 bits of the bit stream starting at any bit offset.
+    */
+    size_t index = offset >> 6;
+    int shift = offset & 63;
+
+    if (! shift)
+        return words[index];
+    return (words[index] << shift) | (words[index+1] >> (64-shift));
+}
+
+
+
+long long
+find_grayscale_data_start(const uint64_t *words, size_t bit_count)
+{
+    /*
+    Returns the index of the first zero bit behind at least 256 successive
+    one bits or -1, if there is no such bit. Only the zero bits of the
+    stream are visited.
+    */
+    long long previous_zero = -1;
+    size_t n_words = (bit_count+63) / 64;
+
+    for (size_t w=0; w<n_words; w++)
+    {
+        uint64_t zeros = ~words[w];
+
+        // Ignore the unused bits of the last word.
+        if ((w+1)*64 > bit_count)
+            zeros &= ALL_ONES << ((w+1)*64 - bit_count);
+
+        while (zeros)
+        {
+            int lz = leading_zeros64(zeros);
+            long long zero = (long long) w*64 + lz;
+
+            if (zero - previous_zero - 1 >= 256)
+                return zero;
+
+            previous_zero = zero;
+            zeros &= ~((1ULL << 63) >> lz);
+        }
+    }
+    return -1;
+}
+
+
+
+static inline uint64_t
+reverse_bit_pairs(uint64_t x)
+{
+    /*
+    Reverses the order of the bit pairs in a word. Applied to the second
+    word of a header slice, this swaps the pairwise reversed header bits
+    and moves header bit 64+n to bit n of the result.
+    */
+    x = ((x >> 2) & 0x3333333333333333ULL) | ((x & 0x3333333333333333ULL) << 2);
+    x = ((x >> 4) & 0x0F0F0F0F0F0F0F0FULL) | ((x & 0x0F0F0F0F0F0F0F0FULL) << 4);
+    return byteswap64(x);
+}
+
+
+
+typedef struct {
+    int pixel_one;
+    int pixel_two;
+    int pixel_thr;
+    int min_index;
+    int max_index;
+    // sum_x and _y will be needed to calculate the particle barycenter.
+    int sum_x;
+    int sum_y;
+    // Second order moments. The sum of x*x is derived from the column counts.
+    int sum_yy;
+    int sum_xy;
+    // Number of shadowed pixels in every column (at most 255 slices).
+    unsigned char column_count[64];
+} PixelStats;
+
+
+
+void
+init_pixel_stats(PixelStats *stats)
+{
+    memset(stats, 0, sizeof(PixelStats));
+    stats->min_index = 63;
+}
+
+
+
+void
+pixel_stats_moments(const PixelStats *stats, ImageMoments *moments)
+{
+    /*
+    Returns the moments of the shadowed pixels, which were accumulated
+    while the slices were classified.
+    */
+    int sum_xx = 0;
+    for (int x=0; x<64; x++)
+        sum_xx += x*x*stats->column_count[x];
+
+    moments->number_of_pixels = stats->pixel_one + stats->pixel_two + stats->pixel_thr;
+    moments->sum_x = stats->sum_x;
+    moments->sum_y = stats->sum_y;
+    moments->sum_xx = sum_xx;
+    moments->sum_yy = stats->sum_yy;
+    moments->sum_xy = stats->sum_xy;
+}
+
+
+
+static inline int
+sum_of_pair_indices(uint64_t pixels)
+{
+    /*
+    Sum of the pair indices (0 for the lowest bit pair) of all set pixels.
+    Every bit of the index is weighted with the number of pixels whose
+    index contains this bit.
+    */
+    return popcount64(pixels & 0x4444444444444444ULL)
+         + popcount64(pixels & 0x5050505050505050ULL) * 2
+         + popcount64(pixels & 0x5500550055005500ULL) * 4
+         + popcount64(pixels & 0x5555000055550000ULL) * 8
+         + popcount64(pixels & 0x5555555500000000ULL) * 16;
+}
+
+
+
+static inline void
+classify_slice_word(uint64_t word, int x_offset, int y, unsigned char *row, PixelStats *stats)
+{
+    /*
+    Converts 32 bit pairs into shadow levels and updates the pixel counts,
+    the extents and the moments.
+    */
+    uint64_t second = word & EVEN_BITS;
+    uint64_t first = (word >> 1) & EVEN_BITS;
+
+    int pixel_one = popcount64(~first & second);
+    int pixel_two = popcount64(first & ~second);
+    int pixel_thr = popcount64(~(first | second) & EVEN_BITS);
+
+    stats->pixel_one += pixel_one;
+    stats->pixel_two += pixel_two;
+    stats->pixel_thr += pixel_thr;
+
+    uint64_t shadowed = ~(first & second) & EVEN_BITS;
+    if (shadowed)
+    {
+        int number_of_pixels = pixel_one + pixel_two + pixel_thr;
+        int min_index = x_offset + (leading_zeros64(shadowed) >> 1);
+        int max_index = x_offset + 31 - (trailing_zeros64(shadowed) >> 1);
+        int sum_x = (x_offset+31) * number_of_pixels - sum_of_pair_indices(shadowed);
+
+        if (stats->min_index > min_index) stats->min_index = min_index;
+        if (stats->max_index < max_index) stats->max_index = max_index;
+        stats->sum_x += sum_x;
+        stats->sum_y += y * number_of_pixels;
+        stats->sum_yy += y * y * number_of_pixels;
+        stats->sum_xy += y * sum_x;
+    }
+
+    for (int x=x_offset; x<x_offset+32; x+=4)
+    {
+        memcpy(row + x, GRAYSCALE_LEVELS[(word >> (56+2*(x_offset-x))) & 255], 4);
+        for (int j=0; j<4; j++)
+            stats->column_count[x+j] += (row[x+j] != 0);
+    }
+}
+
+
+
+void
+classify_grayscale_slice_scalar(uint64_t first_word, uint64_t second_word, int y, unsigned char *row, PixelStats *stats)
+{
+    /*
+    Writes the 64 shadow levels of an image slice into the row.
+    */
+    classify_slice_word(first_word, 0, y, row, stats);
+    classify_slice_word(second_word, 32, y, row, stats);
+}
@@ -0,0 +1,101 @@
+/*
+Index of the data buffers of an imagefile.
+
+Every buffer is decoded independently of the other buffers, so the time
+range of its particles is known once the buffer was decoded. The index
+stores it for every buffer, which allows time range queries to decode
+only the buffers which overlap the timeframes (see oap.core.build_index).
+*/
+
+typedef struct {
+    uint32_t min_second;    // earliest and latest second of day of the particles
+    uint32_t max_second;
+    uint32_t particles;     // number of decoded particles
+    uint32_t biterrors;     // 1 if the buffer is affected by biterrors
+} BufferIndexEntry;
+
+
+
+static PyObject *
+index_buffers(PyObject *module, PyObject *args, PyObject *kwargs)
+{
+    /*
+    Decodes the particle headers of all buffers of an imagefile and returns
+    a native buffer with one BufferIndexEntry per buffer and the name of the
+    decoded probe. Buffers without particles have a time range of (0, 0).
+    */
+    const char *filename;
+    const char *probe = "auto";
+    static char *kwlist[] = {"filename", "probe", NULL};
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "s|s", kwlist, &filename, &probe))
+        return NULL;
+
+    // Every particle is kept, but no images are stored or analysed.
+    DecodeOptions options;
+    memset(&options, 0, sizeof(DecodeOptions));
+    options.truncated = 1;
+    if (probe_from_name(probe, &options.probe) < 0)
+        return NULL;
+
+    MappedImagefile imagefile;
+    if (map_imagefile(filename, &imagefile) < 0)
+    {
+        PyErr_SetFromErrnoWithFilename(PyExc_OSError, filename);
+        return NULL;
+    }
+
+    unsigned int n_buffers = imagefile.size / BUFFER_SIZE;
+    BufferIndexEntry *entries = (BufferIndexEntry*) calloc(n_buffers + 1, sizeof(BufferIndexEntry));
+    if (entries == NULL)
+    {
+        unmap_imagefile(&imagefile);
+        return PyErr_NoMemory();
+    }
+
+    ParticleBatch batch;
+    init_particle_batch(&batch);
+    batch.store = true;
+    batch.store_images = false;
+    ScratchArena arena;
+    init_scratch_arena(&arena);
+
+    Py_BEGIN_ALLOW_THREADS
+    if (options.probe == PROBE_AUTO)
+        options.probe = detect_probe(&imagefile);
+
+    for (unsigned int i=0; i<n_buffers && ! batch.memory_error; i++)
+    {
+        clear_particle_batch(&batch);
+        batch.biterror_counter = 0;
+
+        const unsigned char *buffer = imagefile.data + (unsigned long long) i * BUFFER_SIZE + BUFFER_HEADER_SIZE;
+        decompress_buffer(buffer, &options, &batch, &arena);
+
+        BufferIndexEntry *entry = &entries[i];
+        entry->particles = batch.n_records;
+        entry->biterrors = batch.biterror_counter;
+        for (size_t r=0; r<batch.n_records; r++)
+        {
+            uint32_t second = batch.records[r].second;
+            if (r == 0 || second < entry->min_second)
+                entry->min_second = second;
+            if (r == 0 || second > entry->max_second)
+                entry->max_second = second;
+        }
+    }
+    Py_END_ALLOW_THREADS
+
+    bool memory_error = batch.memory_error;
+    free_particle_batch(&batch);
+    free_scratch_arena(&arena);
+    unmap_imagefile(&imagefile);
+
+    if (memory_error)
+    {
+        free(entries);
+        return PyErr_NoMemory();
+    }
+    return Py_BuildValue("(Ns)", NativeBuffer_from_memory(entries, n_buffers * sizeof(BufferIndexEntry)),
+                         PROBE_NAMES[options.probe]);
+}
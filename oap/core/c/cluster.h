@@ -1,47 +1,194 @@
 /*
-Very simple algorithm to detect whether a particle image contains
+Connected components of a particle image to detect whether it contains
 multiple particle clusters respectively multiple particles.
+
+Shadowed pixels (levels 1 to 3) are 8-connected. The components are
+labelled in two passes over the columns min_index..max_index with a
+union-find forest, without any recursion and without coloring the image.
 */
 
 
 
-void
-flood_fill(unsigned char *array, int x, int y, int y_dim, int x_min, int x_max, int marker)
+typedef struct {
+    int pixels;
+    int x_min;
+    int x_max;
+    int y_min;
+    int y_max;
+} ParticleComponent;
+
+
+
+size_t
+cluster_scratch_size(int y_dim, int x_min, int x_max)
 {
-    if (x >= x_min && x <= x_max && y >= 0 && y < y_dim)
+    /*
+    Number of integers, which are needed by label_components().
+    The provisional labels are limited by one label per two
+    columns in every slice.
+    */
+    if (y_dim <= 0 || x_max < x_min)
+        return 1;
+
+    size_t width = x_max - x_min + 1;
+    size_t max_labels = (width+1) / 2 * y_dim;
+    return y_dim * width + 2 * (max_labels+1);
+}
+
+
+
+static inline int
+find_root(int *parent, int label)
+{
+    while (parent[label] != label)
     {
-        if (array[y*64+x] == 1 || array[y*64+x] == 2 || array[y*64+x] == 3)
-        {
-            array[y*64+x] = marker;
-            flood_fill(array, x, y+1, y_dim, x_min, x_max, marker);
-            flood_fill(array, x, y-1, y_dim, x_min, x_max, marker);
-            flood_fill(array, x+1, y, y_dim, x_min, x_max, marker);
-            flood_fill(array, x-1, y, y_dim, x_min, x_max, marker);
-            flood_fill(array, x+1, y+1, y_dim, x_min, x_max, marker);
-            flood_fill(array, x-1, y-1, y_dim, x_min, x_max, marker);
-            flood_fill(array, x+1, y-1, y_dim, x_min, x_max, marker);
-            flood_fill(array, x-1, y+1, y_dim, x_min, x_max, marker);
-        }
+        // Path halving keeps the trees flat.
+        parent[label] = parent[parent[label]];
+        label = parent[label];
+    }
+    return label;
+}
+
+
+
+static inline int
+unite_labels(int *parent, int label_a, int label_b)
+{
+    /*
+    Merges both trees. The smaller label becomes the root.
+    */
+    int root_a = find_root(parent, label_a);
+    int root_b = find_root(parent, label_b);
+
+    if (root_a < root_b)
+    {
+        parent[root_b] = root_a;
+        return root_a;
     }
-    return;
+    parent[root_a] = root_b;
+    return root_b;
 }
 
 
 
 int
-particle_cluster(unsigned char *array, int y_dim, int x_min, int x_max)
+label_components(const unsigned char *array, int y_dim, int x_min, int x_max,
+                 int *scratch, ParticleComponent *components)
 {
-    int marker = 10;
+    /*
+    Returns the number of connected components within the columns
+    x_min..x_max. The scratch memory must provide cluster_scratch_size()
+    integers. If components is not NULL, it receives the pixel count and
+    the bounding box of every component and must hold as many components
+    as there are shadowed pixels.
+    */
+    if (y_dim <= 0 || x_max < x_min)
+        return 0;
+
+    int width = x_max - x_min + 1;
+    int *labels = scratch;
+    int *parent = labels + y_dim * width;
+    int n_labels = 0;
+
+    // --- First pass: provisional labels ------------------------------------------------------------------------------
+    parent[0] = 0;
+
     for (int y=0; y<y_dim; y++)
     {
-        for (int x=x_min; x<=x_max; x++)
+        const unsigned char *row = array + y*64 + x_min;
+        int *row_labels = labels + y*width;
+        const int *above = row_labels - width;
+
+        for (int x=0; x<width; x++)
         {
-            if (array[y*64+x] == 1 || array[y*64+x] == 2 || array[y*64+x] == 3)
+            if (row[x] < 1 || row[x] > 3)
             {
-                flood_fill(array, x, y, y_dim, x_min, x_max, marker);
-                marker += 1;
+                row_labels[x] = 0;
+                continue;
             }
+
+            // Neighbours, which are already labelled: W, NW, N, NE
+            int label = (x > 0) ? row_labels[x-1] : 0;
+            if (y > 0)
+            {
+                int neighbours[3] = {(x > 0) ? above[x-1] : 0, above[x], (x < width-1) ? above[x+1] : 0};
+                for (int k=0; k<3; k++)
+                {
+                    if (! neighbours[k])
+                        continue;
+                    label = label ? unite_labels(parent, label, neighbours[k]) : neighbours[k];
+                }
+            }
+            if (! label)
+            {
+                label = ++n_labels;
+                parent[label] = label;
+            }
+            row_labels[x] = label;
         }
     }
-    return (marker - 10);
+
+    // --- Resolve the labels into consecutive components --------------------------------------------------------------
+
+    /*
+    Roots are always smaller than the labels of their trees,
+    so the component of a root is known before its children.
+    */
+    int *component_of = parent + n_labels + 1;
+    int n_components = 0;
+
+    for (int label=1; label<=n_labels; label++)
+    {
+        int root = find_root(parent, label);
+        component_of[label] = (root == label) ? n_components++ : component_of[root];
+    }
+
+    // --- Second pass: sizes and bounding boxes -----------------------------------------------------------------------
+    if (components != NULL)
+    {
+        for (int i=0; i<n_components; i++)
+        {
+            components[i].pixels = 0;
+            components[i].x_min = 63;
+            components[i].x_max = 0;
+            components[i].y_min = y_dim;
+            components[i].y_max = 0;
+        }
+        for (int y=0; y<y_dim; y++)
+        {
+            for (int x=0; x<width; x++)
+            {
+                int label = labels[y*width+x];
+                if (! label)
+                    continue;
+
+                ParticleComponent *component = &components[component_of[label]];
+                component->pixels++;
+                if (component->x_min > x_min+x) component->x_min = x_min+x;
+                if (component->x_max < x_min+x) component->x_max = x_min+x;
+                if (component->y_min > y) component->y_min = y;
+                component->y_max = y;
+            }
+        }
+    }
+    return n_components;
+}
+
+
+
+int
+particle_cluster(const unsigned char *array, int y_dim, int x_min, int x_max, ScratchArena *arena)
+{
+    /*
+    Returns the number of connected components or -1, if the
+    arena is too small for the scratch memory.
+    */
+    size_t mark = scratch_mark(arena);
+    int *scratch = (int*) scratch_alloc(arena, cluster_scratch_size(y_dim, x_min, x_max) * sizeof(int));
+    if (scratch == NULL)
+        return -1;
+
+    int n_components = label_components(array, y_dim, x_min, x_max, scratch, NULL);
+    scratch_release(arena, mark);
+    return n_components;
 }
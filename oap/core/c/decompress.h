@@ -8,95 +8,87 @@ const char *MONTH[] = {"January", "February", "March", "April",
 
 
 
+/*
+Probes with different imagefile data formats. PROBE_AUTO is resolved
+by detect_probe() before the decoding starts.
+*/
+typedef enum {
+    PROBE_AUTO,
+    PROBE_GRAYSCALE,
+    PROBE_MONOSCALE,
+} Probe;
+
+const char *PROBE_NAMES[] = {"auto", "grayscale", "monoscale"};
+
+// Maximum number of buffers, which are decoded to detect the probe.
+#define PROBE_DETECTION_BUFFERS 16
+
+
+
+/*
+Options and filters of the decompression in native form.
+*/
+typedef struct {
+    Probe probe;
+    Boundaries timeframes;
+    Boundaries x_sizes;
+    Boundaries y_sizes;
+    BufferList exclude_buffers;
+    BufferList include_buffers;
+    int truncated;
+    int poisson;
+    int cluster;
+    int principal;
+} DecodeOptions;
+
+
+
 /*
  *      * --------------------------------------------------------------- *
  * ---  | DMT Cloud Imaging Probe: Monoscale Data Decompression Algorithm | --------------------------------------------
  *      * --------------------------------------------------------------- *
  */
 void
-decompress_monoscale_buffer(unsigned char *data)
+decompress_monoscale_buffer(const unsigned char *data, const DecodeOptions *options, ParticleBatch *batch,
+                            ScratchArena *arena)
 {
-    int byte_count = count_monoscale_bytes(data);
-    unsigned char *byte_array;
-    byte_array = (unsigned char*) malloc(byte_count * sizeof(unsigned char));
-
-    int i = 0;
-    int k = 0;
-
-    bool start_recording = false;
-    int boundary_count = 0;
-    int start_index = 0;
-
     /*
-    Its not likely but to make sure there is no boundary slice or
-    something else in the end of the stack memory, which can be falsely
-    interpreted as valid data, the memory will be set to 0.
+    Loop through compressed data to count the number of decompressed bytes.
+    The scratch arena is sized once for the decompressed bytes and the
+    temporary memory of the largest particle.
     */
-    for (int j=0; j<byte_count; j++) byte_array[j] = 0;
+    size_t byte_count = count_monoscale_bytes(data);
+    unsigned char *bytes = NULL;
 
-    while (i < 4096)
+    if (reset_scratch_arena(arena, scratch_aligned(byte_count+1) + particle_scratch_size()))
+        bytes = (unsigned char*) scratch_alloc(arena, byte_count+1);
+    if (bytes == NULL)
     {
-        int count = (data[i]&31);
-
-        if (data[i]&32) i++;
-
-        else if (data[i]&128)
-        {
-            for (int j=0; j<count+1; j++)
-            {
-                if (start_recording) byte_array[k++] = 0;
-                else start_index++;
-            }
-            i++;
-        }
-        else if (data[i]&64)
-        {
-            for (int j=0; j<count+1; j++)
-            {
-                if (start_recording) byte_array[k++] = 255;
-                else start_index++;
-            }
-            i++;
-        }
-        else
-        {
-            i++;
-            for (int j=0; j<count+1; j++)
-            {
-                if (!start_recording)
-                {
-                    start_index++;
-                    /*
-                    Count succesive 1 and 0 bits.
-                    -> 8 bytes equal to 170 dec and AA hex.
-                    */
-                    if (data[i+j]==170)
-                        boundary_count++;
-                    else
-                        boundary_count = 0;
-                    if (boundary_count == 8)
-                        start_recording = true;
-                }
-                else
-                {
-                    byte_array[k++] = data[i+j];
-                }
-            }
-            i += count+1;
-        }
+        batch->memory_error = true;
+        return;
     }
 
+    // --- Decompress monoscale imagefile data -------------------------------------------------------------------------
 
+    byte_count = expand_monoscale_data(data, bytes);
+
+    // --- Find first index of decompressed data -----------------------------------------------------------------------
 
     /*
-    After the decompression start with analyzing the
-    decompressed monoscale data.
+    Search for the first boundary slice (8 bytes 0xAA),
+    which is followed by the first particle header.
     */
+    long long start_index = find_monoscale_data_start(bytes, byte_count);
+    if (start_index < 0)
+        return;
 
-    int number_of_slices = (byte_count-start_index) / 8;
-    i = 0;
+    // --- Loop through particle data ----------------------------------------------------------------------------------
+
+    int number_of_slices = (byte_count-start_index) / MONOSCALE_SLICE_SIZE;
+    const unsigned char *slices = bytes + start_index;
+    int i = 0;
 
-    while (i < number_of_slices)
+    while (i<number_of_slices)
     {
         /*
         Translating the particle header. The monoscale particle header has a
@@ -110,23 +102,38 @@ decompress_monoscale_buffer(unsigned char *data)
                   |                |                        |            |
                   V                V                        V            V
            particle number     timestamp            number of slices    DOF
-
-
-        The timestamp is even stranger and probably better to understand by just
-        looking at the code.
         */
-        unsigned short b0 = byte_array[i*8+1];
-        unsigned short b1 = byte_array[i*8];
+        const unsigned char *header = slices + i*MONOSCALE_SLICE_SIZE;
 
-        unsigned short b2 = byte_array[i*8+2];
-        unsigned short b3 = byte_array[i*8+3];
-        unsigned short b4 = byte_array[i*8+4];
-        unsigned short b5 = byte_array[i*8+5];
-        unsigned short b6 = byte_array[i*8+6];
+        unsigned short b0 = header[1];
+        unsigned short b1 = header[0];
+        unsigned short b2 = header[2];
+        unsigned short b3 = header[3];
+        unsigned short b4 = header[4];
+        unsigned short b5 = header[5];
+        unsigned short b6 = header[6];
 
+        int particle_number = (b0 << 8) + b1;
+        int particle_slices = (header[7]&254) >> 1;
+
+        /*
+        Particle images can be broken at the end of OAP imagefile data.
+        These particles are not valid, because of the missing trailer slice.
+        */
+        if (i+particle_slices >= number_of_slices)
+            return;
 
-        //unsigned short particle_number = (b0 << 8) + b1;
-        unsigned short particle_slices = ((byte_array[i*8+7]&254)>>1);
+        /*
+        Every valid particle image must end with a boundary slice.
+        If not the whole data buffer is probably corrupted.
+        */
+        if (particle_slices < 1
+            || memcmp(slices + (i+particle_slices)*MONOSCALE_SLICE_SIZE,
+                      MONOSCALE_BOUNDARY_SLICE, MONOSCALE_SLICE_SIZE) != 0)
+        {
+            batch->biterror_counter += 1;
+            return;
+        }
 
         /*
         Timestamp (Header Bytes):
@@ -136,14 +143,15 @@ decompress_monoscale_buffer(unsigned char *data)
         -----|---------|---------|-------------|----------------
         Hour | Minute  |Second   |Millisecond  |Microsecond
 
+        The microseconds are counted in steps of 125 nanoseconds.
         */
-        unsigned short hour = (b6 >> 3) & 31;
-        unsigned short minute = (((b6 << 8) + b5) >> 5) & 63;
-        unsigned short second = (((b5 << 8) + b4) >> 7) & 63;
-        unsigned short millisecond = (((b4 << 8) + b3) >> 5) & 1023;
-        // multiply with 125 * 0.001 to covert it to microseconds.
-        unsigned short microsecond = (unsigned short) (((((b3 << 8) + b2) >> 5) & 8191)*125 * 0.001);
+        int hour = (b6 >> 3) & 31;
+        int minute = (((b6 << 8) + b5) >> 5) & 63;
+        int second = (((b5 << 8) + b4) >> 7) & 63;
+        int millisecond = (((b4 << 8) + b3) >> 5) & 1023;
+        int microsecond = ((((b3 << 8) + b2) & 8191) * 125) / 1000;
 
+        // The second of day is the particle timestamp in seconds.
         int second_of_day = hour*3600 + minute*60 + second;
 
         /*
@@ -152,37 +160,80 @@ decompress_monoscale_buffer(unsigned char *data)
         */
         i++;
 
+        // The last slice of the particle is the boundary slice.
         int img_height = particle_slices-1;
 
-        int min_index = 63;
-        int max_index = 0;
-        int number_of_pixels = 0;
+        bool do_stuff_with_particle = true;
+
+        // --- Check timeframes and particle size in Y-axis ------------------------------------------------------------
+
+        if (! value_in_boundaries(second_of_day, &options->timeframes)
+            || ! value_in_boundaries(img_height, &options->y_sizes))
+        {
+            i += particle_slices;
+            continue;
+        }
 
+        // --- Create the particle array -------------------------------------------------------------------------------
+
+        size_t mark = scratch_mark(arena);
         unsigned char *particle_array;
-        particle_array = (unsigned char*) calloc(img_height*64, sizeof(unsigned char));
+        particle_array = (unsigned char*) scratch_alloc(arena, img_height * 64 * sizeof(unsigned char));
+
+        PixelStats stats;
+        init_pixel_stats(&stats);
 
         for (int y=0; y<img_height; y++)
+            classify_monoscale_slice(slices + (i+y)*MONOSCALE_SLICE_SIZE, y, particle_array+y*64, &stats);
+
+        int min_index = stats.min_index;
+        int max_index = stats.max_index;
+        int number_of_pixels = stats.pixel_one;
+
+        ImageMoments moments;
+        pixel_stats_moments(&stats, &moments);
+
+        int particle_width = max_index-min_index+1;
+
+        if (! number_of_pixels)
         {
-            for (int x=7; x>=0; x--)
+            batch->zropxels_counter += 1;
+            do_stuff_with_particle = false;
+        }
+
+        // --- Exclude truncated images --------------------------------------------------------------------------------
+
+        int particle_truncated = 0;
+
+        if (min_index == 0 || max_index == 63)
+        {
+            batch->trncated_counter += 1;
+            particle_truncated = 1;
+
+            if (! options->truncated)
             {
-                for (int z=0; z<8; z++)
-                {
-                    if (byte_array[(y+i)*8+x] & ((unsigned char) pow(2, z)))
-                    {
-                        // Not necessary, because of calloc the value is already 0.
-                        // particle_array[j*64+l*8+(7-m)] = 0;
-                    }
-                    else
-                    {
-                        particle_array[y*64+x*8+(7-z)] = 1;
-                        if (min_index > x*8+(7-z)) min_index = x*8+(7-z);
-                        if (max_index < x*8+(7-z)) max_index = x*8+(7-z);
-                        number_of_pixels++;
-                    }
-                }
+                do_stuff_with_particle = false;
             }
         }
 
+        // --- Check particle size in X-axis ---------------------------------------------------------------------------
+
+        if (! value_in_boundaries(particle_width, &options->x_sizes))
+        {
+            do_stuff_with_particle = false;
+        }
+
+        if (! do_stuff_with_particle)
+        {
+            i += particle_slices;
+            scratch_release(arena, mark);
+            continue;
+        }
+
+        // Calculate the barycenter of the particle image.
+        int x_bary = (int) round(stats.sum_x / (float) number_of_pixels);
+        int y_bary = (int) round(stats.sum_y / (float) number_of_pixels);
+
 
 
         /*
@@ -191,29 +242,31 @@ decompress_monoscale_buffer(unsigned char *data)
          *        * ------------------------------------- *
          */
 
+        ParticleRecord particle = {0};
+        particle.second = second_of_day;
+        particle.number = particle_number;
+        particle.millisecond = millisecond;
+        particle.microsecond = microsecond;
+        particle.pixel_one = number_of_pixels;
+        particle.y_dim = img_height;
+        particle.x_bary = x_bary;
+        particle.y_bary = y_bary;
+        particle.min_idx = min_index;
+        particle.max_idx = max_index;
+        particle.truncated = particle_truncated;
+
         process_particle_array(particle_array,
                                64,
                                img_height,
-                               0,
-                               0,
-                               second_of_day,
-                               millisecond,
-                               microsecond,
-                               0,
-                               0,
-                               0,
-                               0,
+                               particle_width,
                                number_of_pixels,
-                               min_index,
-                               max_index,
-                               0,
-                               0,
-                               false,
-                               false,
-                               false,
-                               false,
-                               NULL,
-                               NULL);
+                               &moments,
+                               &particle,
+                               options->poisson,
+                               options->cluster,
+                               options->principal,
+                               batch,
+                               arena);
 
         /*
          *        * ------------------------------------ *
@@ -223,10 +276,14 @@ decompress_monoscale_buffer(unsigned char *data)
 
 
 
-        free(particle_array);
+        batch->particle_counter += 1;
+
+        // Release the scratch memory of the particle.
+        scratch_release(arena, mark);
+
+        // The image slices and the boundary slice of the particle.
         i += particle_slices;
     }
-    free(byte_array);
 }
 
 
@@ -239,32 +296,25 @@ decompress_monoscale_buffer(unsigned char *data)
  *      * --------------------------------------------------------------- *
  */
 void
-decompress_grayscale_buffer(unsigned char *data,
-                            unsigned int *particle_counter,
-                            unsigned int *biterror_counter,
-                            unsigned int *zropxels_counter,
-                            unsigned int *trncated_counter,
-                            PyObject *timeframes,
-                            PyObject *x_sizes,
-                            PyObject *y_sizes,
-                            int truncated,
-                            int poisson,
-                            int cluster,
-                            int principal,
-                            PyObject *arrays_list,
-                            PyObject *images_list)
+decompress_grayscale_buffer(const unsigned char *data, const DecodeOptions *options, ParticleBatch *batch,
+                            ScratchArena *arena)
 {
     /*
-    Loop through compressed data to count the number of decompressed bits and
-    create a stack memory with corresponding length to store the decompressed bits.
+    Loop through compressed data to count the number of decompressed bits.
+    The scratch arena is sized once for the packed bit stream with
+    corresponding length and the temporary memory of the largest particle.
     */
-    int bit_count = count_grayscale_bits(data);
-    unsigned char *bit_array;
-    bit_array = (unsigned char*) calloc(bit_count, sizeof(unsigned char));
+    size_t bit_count = count_grayscale_bits(data);
+    size_t stream_size = stream_words(bit_count) * sizeof(uint64_t);
+    uint64_t *bit_stream = NULL;
 
-    int no_of_repeats = 0;
-    int last_2_bits = 0;
-    int current_bit = 0;
+    if (reset_scratch_arena(arena, scratch_aligned(stream_size) + particle_scratch_size()))
+        bit_stream = (uint64_t*) scratch_alloc(arena, stream_size);
+    if (bit_stream == NULL)
+    {
+        batch->memory_error = true;
+        return;
+    }
 
     // --- Decompress grayscale imagefile data -------------------------------------------------------------------------
 
@@ -272,73 +322,8 @@ decompress_grayscale_buffer(unsigned char *data,
     Decompression algorithm of OAP grayscale imagefile data bytes.
     -> 128 bits per data slice
     */
-    for (int i=0; i<4096; i++)
-    {
-        if (data[i]&128)
-        {
-            if (data[i]&128)
-            {
-                no_of_repeats = (data[i] & 127);
-                for (int j=0; j<no_of_repeats; j++)
-                {
-                    if (last_2_bits == 3)
-                    {
-                        bit_array[current_bit++] = 1;
-                        bit_array[current_bit++] = 1;
-                    }
-                    else if (last_2_bits == 2)
-                    {
-                        bit_array[current_bit++] = 1;
-                        current_bit++;
-                    }
-                    else if (last_2_bits == 1)
-                    {
-                        current_bit++;
-                        bit_array[current_bit++] = 1;
-                    }
-                    else
-                    {
-                        current_bit++;
-                        current_bit++;
-                    }
-                }
-            }
-        }
-        else
-        {
-            last_2_bits = (data[i] & 3);
-            if (data[i]&64)
-            {
-                for (int j = 5; j >= 0; j--)
-                {
-                    if (((data[i]&63) & (1 << j)) != 0)
-                        bit_array[current_bit++] = 1;
-                    else
-                        current_bit++;
-                }
-            }
-            else if (data[i]&16)
-            {
-                for (int j = 3; j >= 0; j--)
-                {
-                    if (((data[i]&15) & (1 << j)) != 0)
-                        bit_array[current_bit++] = 1;
-                    else
-                        current_bit++;
-                }
-            }
-            else if (data[i]&4)
-            {
-                for (int j = 1; j >= 0; j--)
-                {
-                    if (((data[i]&3) & (1 << j)) != 0)
-                        bit_array[current_bit++] = 1;
-                    else
-                        current_bit++;
-                }
-            }
-        }
-    }
+    expand_grayscale_data(data, bit_stream);
+
     // --- Find first index of decompressed data -----------------------------------------------------------------------
 
     /*
@@ -346,34 +331,16 @@ decompress_grayscale_buffer(unsigned char *data,
     with the first particle image. Search for succesive 256 one bits
     and find the actual start of the first particle image.
     */
-    int start_index;
-    int succesive_ones = 0;
-    bool contains_particles = false;
+    long long start_index = find_grayscale_data_start(bit_stream, bit_count);
 
-    for (int i=0; i<bit_count; i++)
-    {
-        if (succesive_ones >= 256 && bit_array[i] == 0)
-        {
-            start_index = i;
-            contains_particles = true;
-            break;
-        }
-        if (bit_array[i] == 1)
-            succesive_ones++;
-        else
-            // Reset one counter.
-            succesive_ones = 0;
-    }
     /*
     There are data blocks in imagefiles, which do not contain any
     particles (mostly in the beginning and the end of an imagefile).
     If the data block contains particles continue with processing
     particle data.
     */
-    if (! contains_particles) {
-        free(bit_array);
+    if (start_index < 0)
         return;
-    }
 
     // --- Loop through particle data ----------------------------------------------------------------------------------
 
@@ -384,19 +351,14 @@ decompress_grayscale_buffer(unsigned char *data,
     {
         // --- Decoding particle header --------------------------------------------------------------------------------
 
-        /*
-        Imagefile data bits are pairwise reversed. To decode the
-        particle header it is necessary to swap the bits.
-        */
-        int swap_bit;
-        for (int j=56; j<128; j+=2)
-        {
-            swap_bit = bit_array[(i*128)+j+start_index];
-            bit_array[(i*128)+j+start_index] = bit_array[(i*128)+j+start_index+1];
-            bit_array[(i*128)+j+start_index+1] = swap_bit;
-        }
+        size_t header_offset = (size_t) i*128 + start_index;
+        uint64_t first_word = read_stream_word(bit_stream, header_offset);
 
         /*
+        Imagefile data bits are pairwise reversed. Reversing the order of
+        the bit pairs swaps the bits and moves the header fields of the
+        second word to their position counted from the lowest bit.
+
         -----------------------------------------
         Header Bits:
 
@@ -412,12 +374,9 @@ decompress_grayscale_buffer(unsigned char *data,
         120 - 127  8  bits slice count
         -----------------------------------------
         */
-        unsigned char binary[16];
+        uint64_t header = reverse_bit_pairs(read_stream_word(bit_stream, header_offset+64));
 
-        int k=0;
-        for (int j=120; j<128; j++)
-            binary[k++] = bit_array[(i*128)+j+start_index];
-        int particle_slices = bin_to_dec(binary, 8);
+        int particle_slices = (header >> 56) & 255;
 
 
 
@@ -425,84 +384,40 @@ decompress_grayscale_buffer(unsigned char *data,
         Particle images can be broken at the end of OAP imagefile data.
         These particles are not valid, because of the missing trailer slice.
         */
-        if ((i+particle_slices)*128+128+start_index >= bit_count) {
-            free(bit_array);
+        if ((size_t) (i+particle_slices)*128+128+start_index >= bit_count)
             return;
-        }
 
         /*
         Every valid particle image must have 56 succesive zeros in the
         beginning (start of particle header) and 128 succesive ones in
         the end. If not the whole data buffer is probably corrupted.
         */
-        for (int j=0; j<56; j++)
-        {
-            if (bit_array[(i*128)+j+start_index] != 0)
-            {
-                *biterror_counter += 1;
-                free(bit_array);
-                return;
-            }
-        }
-        for (int j=0; j<128; j++)
+        size_t trailer_offset = (size_t) (i+particle_slices)*128 + start_index;
+
+        if ((first_word >> 8)
+        || read_stream_word(bit_stream, trailer_offset) != ALL_ONES
+        || read_stream_word(bit_stream, trailer_offset+64) != ALL_ONES)
         {
-            if (bit_array[((i+particle_slices)*128)+j+start_index] != 1)
-            {
-                *biterror_counter += 1;
-                free(bit_array);
-                return;
-            }
+            batch->biterror_counter += 1;
+            return;
         }
 
 
 
-        // --- Timestamp and True Air Speed ----------------------------------------------------------------------------
-        k=0;
-        for (int j=115; j<120; j++)
-            binary[k++] = bit_array[(i*128)+j+start_index];
-        int hour = bin_to_dec(binary, 5);
-
-        k=0;
-        for (int j=109; j<115; j++)
-            binary[k++] = bit_array[(i*128)+j+start_index];
-        int minute = bin_to_dec(binary, 6);
-
-        k=0;
-        for (int j=103; j<109; j++)
-            binary[k++] = bit_array[(i*128)+j+start_index];
-        int second = bin_to_dec(binary, 6);
-
-        k=0;
-        for (int j=93; j<103; j++)
-            binary[k++] = bit_array[(i*128)+j+start_index];
-        int millisecond = bin_to_dec(binary, 10);
-
-        k=0;
-        for (int j=83; j<93; j++)
-            binary[k++] = bit_array[(i*128)+j+start_index];
-        int microsecond = bin_to_dec(binary, 10);
-
-        k=0;
-        for (int j=80; j<83; j++)
-            binary[k++] = bit_array[(i*128)+j+start_index];
-        int nanosecond = bin_to_dec(binary, 3);
-
-        k=0;
-        for (int j=64; j<80; j++)
-            binary[k++] = bit_array[(i*128)+j+start_index];
-        int particle_number = bin_to_dec(binary, 16);
-
-        k=0;
-        for (int j=56; j<64; j++)
-            binary[k++] = bit_array[(i*128)+j+start_index];
-        int true_air_speed = bin_to_dec(binary, 8);
+        // --- Timestamp -----------------------------------------------------------------------------------------------
+        int hour            = (header >> 51) & 31;
+        int minute          = (header >> 45) & 63;
+        int second          = (header >> 39) & 63;
+        int millisecond     = (header >> 29) & 1023;
+        int microsecond     = (header >> 19) & 1023;
+        int particle_number = header & 65535;
 
 
 
         // --- Increment Bit Array Index -------------------------------------------------------------------------------
         /*
         After reading the particle header increment the current data slice
-        to set the bit_array index to the current particle image data.
+        to set the bit stream offset to the current particle image data.
         */
         i++;
 
@@ -525,14 +440,14 @@ decompress_grayscale_buffer(unsigned char *data,
 
         // --- Check timeframes ----------------------------------------------------------------------------------------
 
-        if (! check_if_value_is_in_boundaries(second_of_day, timeframes))
+        if (! value_in_boundaries(second_of_day, &options->timeframes))
         {
             do_stuff_with_particle = false;
         }
 
         // --- Check particle size in Y-axis ---------------------------------------------------------------------------
 
-        if (! check_if_value_is_in_boundaries(img_height, y_sizes))
+        if (! value_in_boundaries(img_height, &options->y_sizes))
         {
             do_stuff_with_particle = false;
         }
@@ -551,67 +466,38 @@ decompress_grayscale_buffer(unsigned char *data,
         Translate the actual particle image into a 1 dimensional single array.
         Count pixels and find the minimum and maximum index.
         */
+        size_t mark = scratch_mark(arena);
         unsigned char *particle_array;
-        particle_array = (unsigned char*) calloc(img_height*64, sizeof(unsigned char));
-
-        int min_index = 63;
-        int max_index = 0;
-        int counter_1_pixels = 0;
-        int counter_2_pixels = 0;
-        int counter_3_pixels = 0;
+        particle_array = (unsigned char*) scratch_alloc(arena, img_height * 64 * sizeof(unsigned char));
 
-        // sum_x and _y will be needed to calculate the particle barycenter.
-        int sum_x = 0, sum_y = 0;
+        PixelStats stats;
+        init_pixel_stats(&stats);
 
         for (int y=0; y<img_height; y++)
         {
-            for (int x=0; x<64; x++)
-            {
-                if ((bit_array[(i+y)*128+(x*2)+start_index] == 1)
-                && (bit_array[(i+y)*128+(x*2)+start_index+1] == 1))
-                {
-                    // Not necessary, because of calloc the value is already 0.
-                    // particle_array[j*64+l] = 0;
-                }
-                else if ((bit_array[(i+y)*128+(x*2)+start_index] == 0)
-                && (bit_array[(i+y)*128+(x*2)+start_index+1] == 1))
-                {
-                    particle_array[y*64+x] = 1;
-                    counter_1_pixels++;
-                    if (min_index > x) min_index = x;
-                    if (max_index < x) max_index = x;
-                    sum_x += x;
-                    sum_y += y;
-                }
-                else if ((bit_array[(i+y)*128+(x*2)+start_index] == 1)
-                && (bit_array[(i+y)*128+(x*2)+start_index+1] == 0))
-                {
-                    particle_array[y*64+x] = 2;
-                    counter_2_pixels++;
-                    if (min_index > x) min_index = x;
-                    if (max_index < x) max_index = x;
-                    sum_x += x;
-                    sum_y += y;
-                }
-                else if ((bit_array[(i+y)*128+(x*2)+start_index] == 0)
-                && (bit_array[(i+y)*128+(x*2)+start_index+1] == 0))
-                {
-                    particle_array[y*64+x] = 3;
-                    counter_3_pixels++;
-                    if (min_index > x) min_index = x;
-                    if (max_index < x) max_index = x;
-                    sum_x += x;
-                    sum_y += y;
-                }
-            }
+            size_t slice_offset = (size_t) (i+y)*128 + start_index;
+            classify_grayscale_slice(read_stream_word(bit_stream, slice_offset),
+                                     read_stream_word(bit_stream, slice_offset+64),
+                                     y, particle_array+y*64, &stats);
         }
 
+        int min_index = stats.min_index;
+        int max_index = stats.max_index;
+        int counter_1_pixels = stats.pixel_one;
+        int counter_2_pixels = stats.pixel_two;
+        int counter_3_pixels = stats.pixel_thr;
+        int sum_x = stats.sum_x, sum_y = stats.sum_y;
+
+        // Moments of the shadowed pixels for the principal components.
+        ImageMoments moments;
+        pixel_stats_moments(&stats, &moments);
+
         int particle_width = max_index-min_index+1;
         int number_of_pixels = counter_1_pixels + counter_2_pixels + counter_3_pixels;
 
         if (! number_of_pixels)
         {
-            *zropxels_counter += 1;
+            batch->zropxels_counter += 1;
             do_stuff_with_particle = false;
         }
 
@@ -621,10 +507,10 @@ decompress_grayscale_buffer(unsigned char *data,
 
         if (min_index == 0 || max_index == 63)
         {
-            *trncated_counter += 1;
+            batch->trncated_counter += 1;
             particle_truncated = 1;
 
-            if (! truncated)
+            if (! options->truncated)
             {
                 do_stuff_with_particle = false;
             }
@@ -632,7 +518,7 @@ decompress_grayscale_buffer(unsigned char *data,
 
         // --- Check particle size in X-axis ---------------------------------------------------------------------------
 
-        if (! check_if_value_is_in_boundaries(particle_width, x_sizes))
+        if (! value_in_boundaries(particle_width, &options->x_sizes))
         {
             do_stuff_with_particle = false;
         }
@@ -640,7 +526,7 @@ decompress_grayscale_buffer(unsigned char *data,
         if (! do_stuff_with_particle)
         {
             i += particle_slices+1;
-            free(particle_array);
+            scratch_release(arena, mark);
             continue;
         }
 
@@ -656,29 +542,33 @@ decompress_grayscale_buffer(unsigned char *data,
          *        * ------------------------------------- *
          */
 
+        ParticleRecord particle = {0};
+        particle.second = second_of_day;
+        particle.number = particle_number;
+        particle.millisecond = millisecond;
+        particle.microsecond = microsecond;
+        particle.pixel_one = counter_1_pixels;
+        particle.pixel_two = counter_2_pixels;
+        particle.pixel_thr = counter_3_pixels;
+        particle.y_dim = img_height;
+        particle.x_bary = x_bary;
+        particle.y_bary = y_bary;
+        particle.min_idx = min_index;
+        particle.max_idx = max_index;
+        particle.truncated = particle_truncated;
+
         process_particle_array(particle_array,
                                64,
                                img_height,
                                particle_width,
-                               particle_number,
-                               second_of_day,
-                               millisecond,
-                               microsecond,
-                               nanosecond,
-                               counter_1_pixels,
-                               counter_2_pixels,
-                               counter_3_pixels,
                                number_of_pixels,
-                               min_index,
-                               max_index,
-                               x_bary,
-                               y_bary,
-                               particle_truncated,
-                               poisson,
-                               cluster,
-                               principal,
-                               arrays_list,
-                               images_list);
+                               &moments,
+                               &particle,
+                               options->poisson,
+                               options->cluster,
+                               options->principal,
+                               batch,
+                               arena);
 
         /*
          *        * ------------------------------------ *
@@ -688,10 +578,10 @@ decompress_grayscale_buffer(unsigned char *data,
 
 
 
-        *particle_counter += 1;
+        batch->particle_counter += 1;
 
-        // free memory of particle array
-        free(particle_array);
+        // Release the scratch memory of the particle.
+        scratch_release(arena, mark);
 
         /*
         +1 for the trailer boundary slice. Grayscale data has two, but
@@ -699,7 +589,294 @@ decompress_grayscale_buffer(unsigned char *data,
         */
         i += particle_slices+1;
     }
-    free(bit_array);
+}
+
+
+
+
+
+/*
+ *      * ------------------------------ *
+ * ---  | Decoding of any probe's buffer | -------------------------------------------------------------------------------
+ *      * ------------------------------ *
+ */
+int
+probe_from_name(const char *name, Probe *probe)
+{
+    /*
+    Converts the name of a probe. Returns -1 and sets an exception,
+    if the name is unknown.
+    */
+    for (int p=PROBE_AUTO; p<=PROBE_MONOSCALE; p++)
+    {
+        if (strcmp(name, PROBE_NAMES[p]) == 0)
+        {
+            *probe = (Probe) p;
+            return 0;
+        }
+    }
+    PyErr_Format(PyExc_ValueError, "unknown probe: %s", name);
+    return -1;
+}
+
+
+
+void
+decompress_buffer(const unsigned char *data, const DecodeOptions *options, ParticleBatch *batch, ScratchArena *arena)
+{
+    if (options->probe == PROBE_MONOSCALE)
+        decompress_monoscale_buffer(data, options, batch, arena);
+    else
+        decompress_grayscale_buffer(data, options, batch, arena);
+}
+
+
+
+Probe
+detect_probe(const MappedImagefile *imagefile)
+{
+    /*
+    Decodes the first buffers of the imagefile with the decoders of all
+    probes and returns the probe, whose decoder finds the most valid
+    particles. Grayscale is the default, if no decoder finds any particle.
+    */
+    DecodeOptions options;
+    memset(&options, 0, sizeof(DecodeOptions));
+    options.truncated = 1;
+
+    unsigned int n_buffers = imagefile->size / BUFFER_SIZE;
+    if (n_buffers > PROBE_DETECTION_BUFFERS)
+        n_buffers = PROBE_DETECTION_BUFFERS;
+
+    Probe probes[] = {PROBE_GRAYSCALE, PROBE_MONOSCALE};
+    unsigned int particles[] = {0, 0};
+    ScratchArena arena;
+    init_scratch_arena(&arena);
+
+    for (int p=0; p<2; p++)
+    {
+        ParticleBatch batch;
+        init_particle_batch(&batch);
+        options.probe = probes[p];
+
+        for (unsigned int i=0; i<n_buffers; i++)
+        {
+            const unsigned char *buffer = imagefile->data
+                                        + (unsigned long long) i * BUFFER_SIZE + BUFFER_HEADER_SIZE;
+            decompress_buffer(buffer, &options, &batch, &arena);
+        }
+        particles[p] = batch.particle_counter;
+        free_particle_batch(&batch);
+    }
+    free_scratch_arena(&arena);
+
+    return (particles[1] > particles[0]) ? PROBE_MONOSCALE : PROBE_GRAYSCALE;
+}
+
+
+
+static PyObject *
+detect_imagefile_probe(PyObject *module, PyObject *args, PyObject *kwargs)
+{
+    /*
+    Returns the name of the probe, which recorded the imagefile (see detect_probe).
+    */
+    const char *filename;
+    static char *kwlist[] = {"filename", NULL};
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "s", kwlist, &filename))
+        return NULL;
+
+    MappedImagefile imagefile;
+    if (map_imagefile(filename, &imagefile) < 0)
+    {
+        PyErr_SetFromErrnoWithFilename(PyExc_OSError, filename);
+        return NULL;
+    }
+
+    Probe probe;
+    Py_BEGIN_ALLOW_THREADS
+    probe = detect_probe(&imagefile);
+    Py_END_ALLOW_THREADS
+
+    unmap_imagefile(&imagefile);
+    return PyUnicode_FromString(PROBE_NAMES[probe]);
+}
+
+
+
+
+
+/*
+ *      * --------------------------------------------- *
+ * ---  | Parallel decoding of imagefile buffer ranges | --------------------------------------------------------------
+ *      * --------------------------------------------- *
+ */
+
+/*
+Number of buffers, which are decoded by one thread at once. After all
+threads have finished their buffer ranges, the particles are converted
+to Python objects in the original buffer order. This also limits the
+memory of the native particle batches.
+
+Every task except the first one has a worker thread, which is started
+once per decompression and decodes one task range per chunk.
+*/
+#define BUFFERS_PER_TASK 256
+
+typedef struct {
+    const MappedImagefile *imagefile;
+    const DecodeOptions *options;
+    // Range of buffer indices or of positions in the list of selected buffers.
+    unsigned int first_buffer;
+    unsigned int last_buffer;
+    const unsigned int *selected;
+    ParticleBatch batch;
+    // Temporary memory of the decoder, which is reused for every buffer.
+    ScratchArena arena;
+    // The worker decodes the range, when start is released, and releases finished afterwards.
+    PyThread_type_lock start;
+    PyThread_type_lock finished;
+    bool running;
+    bool stop;
+} DecodeTask;
+
+
+
+bool
+buffer_is_selected(unsigned int buffer, const DecodeOptions *options)
+{
+    // Explicitly exclude buffers or analyze only specific buffers.
+    if (options->exclude_buffers.active && value_in_buffer_list(buffer, &options->exclude_buffers))
+        return false;
+    if (options->include_buffers.active && ! value_in_buffer_list(buffer, &options->include_buffers))
+        return false;
+    return true;
+}
+
+
+
+void
+decode_buffer_range(DecodeTask *task)
+{
+    /*
+    Decodes all selected buffers of the task range. If the task has a
+    list of selected buffers, only the listed buffers are read from the
+    mapping. This function does not touch any Python objects.
+    */
+    for (unsigned int i=task->first_buffer; i<task->last_buffer; i++)
+    {
+        unsigned int index = i;
+        if (task->selected != NULL)
+            index = task->selected[i];
+        else if (! buffer_is_selected(i, task->options))
+            continue;
+
+        const unsigned char *buffer = task->imagefile->data
+                                    + (unsigned long long) index * BUFFER_SIZE + BUFFER_HEADER_SIZE;
+        decompress_buffer(buffer, task->options, &task->batch, &task->arena);
+    }
+}
+
+
+
+static void
+decode_worker_thread(void *argument)
+{
+    /*
+    Decodes the range of the task every time the start lock is released,
+    until the task is stopped.
+    */
+    DecodeTask *task = (DecodeTask *) argument;
+    while (true)
+    {
+        PyThread_acquire_lock(task->start, WAIT_LOCK);
+        if (task->stop)
+            break;
+        decode_buffer_range(task);
+        PyThread_release_lock(task->finished);
+    }
+    PyThread_release_lock(task->finished);
+}
+
+
+
+int
+start_decode_workers(DecodeTask *tasks, int n_tasks)
+{
+    /*
+    Starts the worker threads of all tasks except the first one. A task,
+    whose thread can not be started, is decoded by the calling thread.
+    Returns -1 if the locks can not be allocated.
+    */
+    for (int t=1; t<n_tasks; t++)
+    {
+        tasks[t].start = PyThread_allocate_lock();
+        tasks[t].finished = PyThread_allocate_lock();
+        if (tasks[t].start == NULL || tasks[t].finished == NULL)
+            return -1;
+        PyThread_acquire_lock(tasks[t].start, WAIT_LOCK);
+        PyThread_acquire_lock(tasks[t].finished, WAIT_LOCK);
+        tasks[t].running = PyThread_start_new_thread(decode_worker_thread, &tasks[t]) != PYTHREAD_INVALID_THREAD_ID;
+    }
+    return 0;
+}
+
+
+
+void
+stop_decode_workers(DecodeTask *tasks, int n_tasks)
+{
+    /*
+    Stops the worker threads, waits for them and frees the locks.
+    */
+    for (int t=1; t<n_tasks; t++)
+    {
+        if (tasks[t].running)
+        {
+            tasks[t].stop = true;
+            PyThread_release_lock(tasks[t].start);
+            PyThread_acquire_lock(tasks[t].finished, WAIT_LOCK);
+            tasks[t].running = false;
+        }
+        if (tasks[t].start != NULL)
+        {
+            PyThread_release_lock(tasks[t].start);
+            PyThread_free_lock(tasks[t].start);
+            tasks[t].start = NULL;
+        }
+        if (tasks[t].finished != NULL)
+        {
+            PyThread_release_lock(tasks[t].finished);
+            PyThread_free_lock(tasks[t].finished);
+            tasks[t].finished = NULL;
+        }
+    }
+}
+
+
+
+void
+decode_tasks_in_parallel(DecodeTask *tasks, int n_tasks)
+{
+    /*
+    Decodes the tasks on the worker threads, while the first task is
+    decoded by the calling thread. Must be called without holding the GIL.
+    */
+    for (int t=1; t<n_tasks; t++)
+    {
+        if (tasks[t].running)
+            PyThread_release_lock(tasks[t].start);
+    }
+    decode_buffer_range(&tasks[0]);
+
+    for (int t=1; t<n_tasks; t++)
+    {
+        if (tasks[t].running)
+            PyThread_acquire_lock(tasks[t].finished, WAIT_LOCK);
+        else
+            decode_buffer_range(&tasks[t]);
+    }
 }
 
 
@@ -732,6 +909,11 @@ decompress(PyObject *module, PyObject *args, PyObject *kwargs)
     int principal = 0;
     int status = 0;
     int buffer_id = 0;
+    int threads = 1;
+    int columnar = 0;
+    int contiguous = 0;
+    int packed = 0;
+    const char *probe = "auto";
 
     static char *kwlist[] = {"filename",
                              "timeframes",
@@ -747,9 +929,14 @@ decompress(PyObject *module, PyObject *args, PyObject *kwargs)
                              "principal",
                              "status",
                              "buffer_id",
+                             "threads",
+                             "columnar",
+                             "contiguous",
+                             "packed",
+                             "probe",
                              NULL};
 
-    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "s|OOOOOOOpppppp", kwlist,
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "s|OOOOOOOppppppippps", kwlist,
                                      &filename,
                                      &timeframes,
                                      &x_sizes,
@@ -763,32 +950,126 @@ decompress(PyObject *module, PyObject *args, PyObject *kwargs)
                                      &cluster,
                                      &principal,
                                      &status,
-                                     &buffer_id))
-        Py_RETURN_NONE;
+                                     &buffer_id,
+                                     &threads,
+                                     &columnar,
+                                     &contiguous,
+                                     &packed,
+                                     &probe))
+        return NULL;
+
+    // More threads than processors would only add overhead.
+    if (threads > cpu_count())
+        threads = cpu_count();
+    if (threads < 1)
+        threads = 1;
+
+    // --- Convert filters ---------------------------------------------------------------------------------------------
+    PyObject *result = NULL;
+    DecodeTask *tasks = NULL;
+    unsigned int *selected = NULL;
+
+    PyObject *records_buffer = NULL;
+    PyObject *pixels_buffer = NULL;
+    PyObject *offsets_buffer = NULL;
+
+    // Records and particle images of all tasks in buffer order.
+    ParticleBatch decoded;
+    init_particle_batch(&decoded);
+    DecodeOptions options;
+    memset(&options, 0, sizeof(DecodeOptions));
+    options.truncated = truncated;
+    options.poisson = poisson;
+    options.cluster = cluster;
+    options.principal = principal;
+
+    if (probe_from_name(probe, &options.probe) < 0
+        || boundaries_from_list(timeframes, &options.timeframes) < 0
+        || boundaries_from_list(x_sizes, &options.x_sizes) < 0
+        || boundaries_from_list(y_sizes, &options.y_sizes) < 0)
+        goto cleanup;
 
-    FILE *imagefile = fopen(filename, "rb");
+    /*
+    The imagefile is mapped into memory and the data buffers are decoded
+    directly from the mapping. This avoids a read call and a copy for every
+    single buffer of the imagefile.
+    */
+    MappedImagefile imagefile;
 
-    if (imagefile == NULL)
+    if (map_imagefile(filename, &imagefile) < 0)
     {
-        Py_RETURN_NONE;     // ToDo: missing error handling!
+        PyErr_SetFromErrnoWithFilename(PyExc_OSError, filename);
+        goto cleanup;
     }
 
     /*
-    Count the number of bytes in the imagefile.
-    Seek the end of file and set the index back to the top.
+    If the number of bytes is not completely divisible by 4112 the imagefile
+    is corrupted. An incomplete buffer at the end of the file is ignored.
     */
-    fseek(imagefile, 0, SEEK_END);
-    long file_bytes = ftell(imagefile);
-    fseek(imagefile, 0, SEEK_SET);
+    unsigned long long file_bytes = imagefile.size;
+    unsigned int n_buffers = file_bytes / BUFFER_SIZE;
+
+    // The data format is detected from the first buffers, if the probe is not given.
+    if (options.probe == PROBE_AUTO)
+    {
+        Py_BEGIN_ALLOW_THREADS
+        options.probe = detect_probe(&imagefile);
+        Py_END_ALLOW_THREADS
+    }
+
+    if (buffer_list_from_list(exclude_buffers, n_buffers, &options.exclude_buffers) < 0
+        || buffer_list_from_list(include_buffers, n_buffers, &options.include_buffers) < 0)
+        goto unmap;
 
     /*
-    OAP imagefiles consist of header (16 bytes) and data (4096 bytes)
-    blocks in alternating order. If the number of bytes is not completely
-    divisible by 4112 the imagefile is corrupted.
+    If only specific buffers are included, the tasks decode the list of
+    selected buffers instead of scanning all buffers. Only the pages of
+    these buffers are read from the file and the kernel is advised not to
+    read ahead.
     */
-    unsigned int n_buffers = file_bytes / 4112;
-    unsigned char header[16];
-    unsigned char buffer[4096];
+    unsigned int n_items = n_buffers;
+    if (options.include_buffers.active)
+    {
+        selected = (unsigned int*) malloc((n_buffers+1) * sizeof(unsigned int));
+        if (selected == NULL)
+        {
+            PyErr_NoMemory();
+            goto unmap;
+        }
+        n_items = selected_buffers(&options.include_buffers, &options.exclude_buffers, selected);
+        advise_random_access(&imagefile);
+    }
+
+    /*
+    Every task decodes a range of buffers into its own batch. The GIL is released
+    while decoding, so other Python threads can decode further imagefiles at
+    the same time. The batches are collected in one contiguous block and
+    the Python objects are only created afterwards.
+    */
+    bool store_images = PyList_Check(arrays_list) || PyList_Check(images_list) || contiguous;
+    bool store = store_images || columnar;
+
+    tasks = (DecodeTask*) calloc(threads, sizeof(DecodeTask));
+    if (tasks == NULL)
+    {
+        PyErr_NoMemory();
+        goto unmap;
+    }
+    for (int t=0; t<threads; t++)
+    {
+        tasks[t].imagefile = &imagefile;
+        tasks[t].options = &options;
+        tasks[t].selected = selected;
+        init_particle_batch(&tasks[t].batch);
+        init_scratch_arena(&tasks[t].arena);
+        tasks[t].batch.store = store;
+        tasks[t].batch.store_images = store_images;
+    }
+    if (start_decode_workers(tasks, threads) < 0)
+    {
+        PyErr_NoMemory();
+        goto unmap;
+    }
 
     /*
     Number of imagefile particles, biterrors in the particle header,
@@ -799,61 +1080,82 @@ decompress(PyObject *module, PyObject *args, PyObject *kwargs)
     unsigned int zropxels_counter = 0;
     unsigned int trncated_counter = 0;
 
-    for(unsigned int i=0; i<=n_buffers; i++)    // ToDo: last buffer?
+    // --- Print Status Report -----------------------------------------------------------------------------------------
+    if (status && n_buffers)
     {
-        fread(header, 1, 16, imagefile);
-        fread(buffer, 1, 4096, imagefile);
+        // Bytes in the header are swapped.
+        const unsigned char *header = imagefile.data;
+        int year = (header[1] << 8 | header[0]);
+        int month = (header[3] << 8 | header[2]);
+        int day = (header[5] << 8 | header[4]);
+
+        printf("\n--- Status Report ---\n\n");
+        printf("File was recorded on %s %d, %d\n\n", MONTH[month-1], day, year);
+        printf("Size (B): %llu\n", file_bytes);
+        printf("# Buffer: %u\n", n_buffers);
+        printf("Probe:    %s\n\n", PROBE_NAMES[options.probe]);
+    }
 
-        // --- Print Status Report -------------------------------------------------------------------------------------
-        if (status)
+    unsigned int chunk_size = threads * BUFFERS_PER_TASK;
+
+    for (unsigned int first=0; first<n_items; first+=chunk_size)
+    {
+        // --- Decode buffer range -------------------------------------------------------------------------------------
+        unsigned int last = (n_items-first > chunk_size) ? first+chunk_size : n_items;
+        unsigned int task_size = (last-first + threads-1) / threads;
+        int n_tasks = 0;
+
+        for (unsigned int i=first; i<last; i+=task_size)
         {
-            if (i == 0)
+            tasks[n_tasks].first_buffer = i;
+            tasks[n_tasks].last_buffer = (last-i > task_size) ? i+task_size : last;
+            n_tasks++;
+        }
+
+        Py_BEGIN_ALLOW_THREADS
+        decode_tasks_in_parallel(tasks, n_tasks);
+        Py_END_ALLOW_THREADS
+
+        // --- Collect particles in buffer order -----------------------------------------------------------------------
+
+        /*
+        A single task keeps appending to its batch, which becomes the
+        collected batch at the end. Otherwise the batches are merged.
+        */
+        for (int t=0; t<n_tasks; t++)
+        {
+            ParticleBatch *batch = &tasks[t].batch;
+            if (batch->memory_error || (store && threads > 1 && ! merge_particle_batch(&decoded, batch)))
             {
-                // Bytes in the header are swapped.
-                int year = (header[1] << 8 | header[0]);
-                int month = (header[3] << 8 | header[2]);
-                int day = (header[5] << 8 | header[4]);
-
-                printf("\n--- Status Report ---\n\n");
-                printf("File was recorded on %s %d, %d\n\n", MONTH[month-1], day, year);
-                printf("Size (B): %ld\n", file_bytes);
-                printf("# Buffer: %ld\n\n", n_buffers);
+                PyErr_NoMemory();
+                goto unmap;
             }
+
+            particle_counter += batch->particle_counter;
+            biterror_counter += batch->biterror_counter;
+            zropxels_counter += batch->zropxels_counter;
+            trncated_counter += batch->trncated_counter;
+            batch->particle_counter = 0;
+            batch->biterror_counter = 0;
+            batch->zropxels_counter = 0;
+            batch->trncated_counter = 0;
+            if (threads > 1)
+                clear_particle_batch(batch);
+        }
+
+        // --- Print Status Report -------------------------------------------------------------------------------------
+        if (status)
+        {
             if (buffer_id)
             {
-                printf("\rBuffer ID: %d", i);
-                if (i == n_buffers)
+                printf("\rBuffer ID: %u", (selected != NULL) ? selected[last-1] : last-1);
+                if (last == n_items)
                     printf("\n");
             }
             else
-                progress_bar(i, n_buffers, 20, "Analyse ", " Complete");
-        }
-
-        // Explicitly exclude buffers or analyze only specific buffers.
-        if (exclude_buffers != Py_None)
-        {
-            if (check_if_value_is_in_list(i, exclude_buffers))
-                continue;
+                progress_bar(last, n_items, 20, "Analyse ", " Complete");
         }
-        if (! check_if_value_is_in_list(i, include_buffers))
-            continue;
-
-        decompress_grayscale_buffer(buffer,
-                                    &particle_counter,
-                                    &biterror_counter,
-                                    &zropxels_counter,
-                                    &trncated_counter,
-                                    timeframes,
-                                    x_sizes,
-                                    y_sizes,
-                                    truncated,
-                                    poisson,
-                                    cluster,
-                                    principal,
-                                    arrays_list,
-                                    images_list);
     }
-    fclose(imagefile);
 
     // --- Print Status Report -----------------------------------------------------------------------------------------
     if (status)
@@ -865,12 +1167,90 @@ decompress(PyObject *module, PyObject *args, PyObject *kwargs)
         printf("\nRuntime %Lfs\n\n", (long double)(clock() - start)  / CLOCKS_PER_SEC);
     }
 
-    // set reference count to zero
-    Py_DECREF(timeframes);
-    Py_DECREF(x_sizes);
-    Py_DECREF(y_sizes);
-    Py_DECREF(exclude_buffers);
-    Py_DECREF(include_buffers);
+    // --- Create Python objects ----------------------------------------------------------------------------------------
+
+    /*
+    The particle images of all particles are owned by a native buffer and
+    the OpticalArray objects are views into it. The records are returned as
+    native buffer instead of the number of particles, if the columns or the
+    contiguous images are requested. The Python wrapper turns them into
+    NumPy arrays.
+    */
+    if (threads == 1)
+    {
+        decoded = tasks[0].batch;
+        init_particle_batch(&tasks[0].batch);
+    }
+    ParticleBatch collected = decoded;
+    const ParticleRecord *records = decoded.records;
+    size_t n_records = decoded.n_records;
+
+    if (store_images)
+    {
+        pixels_buffer = NativeBuffer_from_memory(decoded.pixels, decoded.n_pixels);
+        decoded.pixels = NULL;
+        if (pixels_buffer == NULL)
+            goto unmap;
+    }
+    if (columnar || contiguous)
+    {
+        records_buffer = NativeBuffer_from_memory(decoded.records, n_records * sizeof(ParticleRecord));
+        decoded.records = NULL;
+        if (records_buffer == NULL)
+            goto unmap;
+    }
+    if (store_images && materialize_particle_batch(&collected, pixels_buffer, packed, arrays_list, images_list) < 0)
+        goto unmap;
 
-    return PyLong_FromLong(particle_counter);
+    if (contiguous)
+    {
+        // Offsets of the particle images within the pixels, including the end of the last image.
+        int64_t *offsets = (int64_t*) malloc((n_records+1) * sizeof(int64_t));
+        if (offsets == NULL)
+        {
+            PyErr_NoMemory();
+            goto unmap;
+        }
+        offsets[0] = 0;
+        for (size_t i=0; i<n_records; i++)
+            offsets[i+1] = offsets[i] + records[i].y_dim * 64;
+
+        offsets_buffer = NativeBuffer_from_memory(offsets, (n_records+1) * sizeof(int64_t));
+        if (offsets_buffer == NULL)
+            goto unmap;
+        result = PyTuple_Pack(3, records_buffer, pixels_buffer, offsets_buffer);
+    }
+    else if (columnar)
+    {
+        result = records_buffer;
+        Py_INCREF(result);
+    }
+    else
+        result = PyLong_FromLong(particle_counter);
+
+unmap:
+    unmap_imagefile(&imagefile);
+
+cleanup:
+    if (tasks != NULL)
+    {
+        stop_decode_workers(tasks, threads);
+        for (int t=0; t<threads; t++)
+        {
+            free_particle_batch(&tasks[t].batch);
+            free_scratch_arena(&tasks[t].arena);
+        }
+        free(tasks);
+    }
+    free(selected);
+    free_particle_batch(&decoded);
+    Py_XDECREF(records_buffer);
+    Py_XDECREF(pixels_buffer);
+    Py_XDECREF(offsets_buffer);
+    free_boundaries(&options.timeframes);
+    free_boundaries(&options.x_sizes);
+    free_boundaries(&options.y_sizes);
+    free_buffer_list(&options.exclude_buffers);
+    free_buffer_list(&options.include_buffers);
+    return result;
 }
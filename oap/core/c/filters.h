@@ -0,0 +1,271 @@
+/*
+Native representation of the filter arguments of the decompression.
+
+The Python lists are converted once at the beginning of the decompression,
+so that the particle filters can be evaluated without holding the GIL.
+Boundaries are sorted and merged into disjoint intervals, which are found
+by binary search. Buffer lists of single indices and index ranges are
+converted into a bitmap of the buffers of the imagefile.
+*/
+
+
+
+typedef struct {
+    long *bounds;       // pairs of minimum and maximum boundaries in ascending order
+    Py_ssize_t size;    // number of boundary pairs
+    bool active;
+} Boundaries;
+
+typedef struct {
+    unsigned char *bitmap;  // bit i is set, if buffer i is in the list
+    size_t n_bits;
+    bool active;
+} BufferList;
+
+
+
+static int
+compare_boundaries(const void *a, const void *b)
+{
+    long min_a = ((const long*) a)[0];
+    long min_b = ((const long*) b)[0];
+    return (min_a > min_b) - (min_a < min_b);
+}
+
+
+
+static void
+merge_boundaries(Boundaries *boundaries)
+{
+    /*
+    Sorts the boundary pairs and merges overlapping and adjacent pairs.
+    Empty pairs (minimum > maximum) never contain a value and are removed.
+    */
+    long *bounds = boundaries->bounds;
+    Py_ssize_t size = 0;
+
+    qsort(bounds, boundaries->size, 2 * sizeof(long), compare_boundaries);
+
+    for (Py_ssize_t i=0; i<boundaries->size; i++)
+    {
+        long min_boundary = bounds[2*i];
+        long max_boundary = bounds[2*i+1];
+        if (min_boundary > max_boundary)
+            continue;
+
+        if (size && (bounds[2*size-1] == LONG_MAX || min_boundary <= bounds[2*size-1] + 1))
+        {
+            if (max_boundary > bounds[2*size-1])
+                bounds[2*size-1] = max_boundary;
+            continue;
+        }
+        bounds[2*size] = min_boundary;
+        bounds[2*size+1] = max_boundary;
+        size++;
+    }
+    boundaries->size = size;
+}
+
+
+
+int
+boundaries_from_list(PyObject *tuples, Boundaries *boundaries)
+{
+    /*
+    Converts a Python list of (min, max) tuples. If there is no valid list
+    or the list is empty, the boundaries are inactive and every value lies
+    within them. List elements which are not tuples are ignored.
+    */
+    boundaries->bounds = NULL;
+    boundaries->size = 0;
+    boundaries->active = false;
+
+    if (! PyList_Check(tuples) || ! PyList_Size(tuples))
+        return 0;
+
+    Py_ssize_t number_of_tuples = PyList_Size(tuples);
+    boundaries->active = true;
+    boundaries->bounds = (long*) malloc(2 * number_of_tuples * sizeof(long));
+    if (boundaries->bounds == NULL)
+    {
+        PyErr_NoMemory();
+        return -1;
+    }
+
+    for (Py_ssize_t i=0; i<number_of_tuples; i++)
+    {
+        PyObject *tuple = PyList_GET_ITEM(tuples, i);
+        if (! PyTuple_Check(tuple) || PyTuple_Size(tuple) < 2)
+            continue;
+
+        long min_boundary = PyLong_AsLong(PyTuple_GET_ITEM(tuple, 0));
+        long max_boundary = PyLong_AsLong(PyTuple_GET_ITEM(tuple, 1));
+        if (PyErr_Occurred())
+            return -1;
+
+        boundaries->bounds[2*boundaries->size] = min_boundary;
+        boundaries->bounds[2*boundaries->size+1] = max_boundary;
+        boundaries->size++;
+    }
+    merge_boundaries(boundaries);
+    return 0;
+}
+
+
+
+static int
+buffer_range_from_item(PyObject *item, long *first, long *last)
+{
+    /*
+    Converts a buffer index or an inclusive (first, last) range of buffer
+    indices. Returns -1 and sets an exception for any other item.
+    */
+    if (PyTuple_Check(item) || PyList_Check(item))
+    {
+        if (PySequence_Size(item) != 2)
+        {
+            PyErr_SetString(PyExc_ValueError, "buffer ranges must be (first, last) pairs");
+            return -1;
+        }
+        PyObject *bound = PySequence_GetItem(item, 0);
+        *first = PyLong_AsLong(bound);
+        Py_DECREF(bound);
+        bound = PySequence_GetItem(item, 1);
+        *last = PyLong_AsLong(bound);
+        Py_DECREF(bound);
+    }
+    else
+    {
+        *first = PyLong_AsLong(item);
+        *last = *first;
+    }
+    return PyErr_Occurred() ? -1 : 0;
+}
+
+
+
+int
+buffer_list_from_list(PyObject *list, size_t n_buffers, BufferList *buffers)
+{
+    /*
+    Converts a Python list of buffer indices and inclusive (first, last)
+    ranges into a bitmap of the n_buffers buffers of the imagefile. If there
+    is no valid list, the buffer list is inactive. Negative indices and
+    indices beyond the end of the imagefile are ignored.
+    */
+    buffers->bitmap = NULL;
+    buffers->n_bits = 0;
+    buffers->active = false;
+
+    if (! PyList_Check(list))
+        return 0;
+
+    Py_ssize_t list_size = PyList_Size(list);
+    buffers->active = true;
+    buffers->n_bits = n_buffers;
+    buffers->bitmap = (unsigned char*) calloc(buffers->n_bits / 8 + 1, 1);
+    if (buffers->bitmap == NULL)
+    {
+        PyErr_NoMemory();
+        return -1;
+    }
+
+    for (Py_ssize_t i=0; i<list_size; i++)
+    {
+        long first, last;
+        if (buffer_range_from_item(PyList_GET_ITEM(list, i), &first, &last) < 0)
+            return -1;
+
+        if (first < 0)
+            first = 0;
+        if (last >= (long) n_buffers)
+            last = (long) n_buffers - 1;
+        for (long value=first; value<=last; value++)
+            buffers->bitmap[value / 8] |= 1 << (value % 8);
+    }
+    return 0;
+}
+
+
+
+void
+free_boundaries(Boundaries *boundaries)
+{
+    free(boundaries->bounds);
+    boundaries->bounds = NULL;
+}
+
+
+
+void
+free_buffer_list(BufferList *buffers)
+{
+    free(buffers->bitmap);
+    buffers->bitmap = NULL;
+}
+
+
+
+bool
+value_in_boundaries(long value, const Boundaries *boundaries)
+{
+    /*
+    Method to check if a value lies in specific boundaries.
+    */
+    if (! boundaries->active)
+        return true;
+
+    // Binary search for the last pair with a minimum <= value.
+    Py_ssize_t low = 0;
+    Py_ssize_t high = boundaries->size;
+    while (low < high)
+    {
+        Py_ssize_t middle = low + (high-low) / 2;
+        if (boundaries->bounds[2*middle] <= value)
+            low = middle + 1;
+        else
+            high = middle;
+    }
+    return low > 0 && value <= boundaries->bounds[2*low-1];
+}
+
+
+
+bool
+value_in_buffer_list(long value, const BufferList *buffers)
+{
+    /*
+    Method to check if a value lies in a buffer list.
+
+    Just like the Python code: (value in list)
+    */
+    if (value < 0 || (size_t) value >= buffers->n_bits)
+        return false;
+    return (buffers->bitmap[value / 8] >> (value % 8)) & 1;
+}
+
+
+
+size_t
+selected_buffers(const BufferList *include, const BufferList *exclude, unsigned int *selected)
+{
+    /*
+    Writes the ascending indices of the buffers in the include list, which
+    are not in the exclude list, and returns their number. The output must
+    have room for include->n_bits indices.
+    */
+    size_t n_selected = 0;
+    for (size_t byte=0; byte<(include->n_bits+7)/8; byte++)
+    {
+        // Skip whole bytes of the bitmap, which contain no buffer at all.
+        unsigned int bits = include->bitmap[byte];
+        while (bits)
+        {
+            unsigned int value = byte*8 + trailing_zeros64(bits);
+            bits &= bits - 1;
+            if (value < include->n_bits && ! (exclude->active && value_in_buffer_list(value, exclude)))
+                selected[n_selected++] = value;
+        }
+    }
+    return n_selected;
+}
@@ -0,0 +1,155 @@
+/*
+Memory mapped access to OAP imagefiles.
+*/
+
+#ifdef _WIN32
+#include <windows.h>
+#else
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#endif
+#include <errno.h>
+
+/*
+OAP imagefiles consist of header (16 bytes) and data (4096 bytes)
+blocks in alternating order.
+*/
+#define BUFFER_HEADER_SIZE 16
+#define BUFFER_DATA_SIZE 4096
+#define BUFFER_SIZE (BUFFER_HEADER_SIZE + BUFFER_DATA_SIZE)
+
+
+
+typedef struct {
+    const unsigned char *data;
+    unsigned long long size;
+#ifdef _WIN32
+    HANDLE file;
+    HANDLE mapping;
+#endif
+} MappedImagefile;
+
+
+
+int
+map_imagefile(const char *filename, MappedImagefile *imagefile)
+{
+    /*
+    Maps the whole imagefile read-only into memory. The kernel is advised to
+    read ahead sequentially, since buffers are decoded in ascending order.
+    Returns -1 and sets errno if the file cannot be mapped.
+
+    Empty imagefiles are not mapped at all. The data pointer is NULL in this case.
+    */
+    imagefile->data = NULL;
+    imagefile->size = 0;
+
+#ifdef _WIN32
+    imagefile->mapping = NULL;
+    imagefile->file = CreateFileA(filename, GENERIC_READ, FILE_SHARE_READ | FILE_SHARE_WRITE, NULL,
+                                  OPEN_EXISTING, FILE_FLAG_SEQUENTIAL_SCAN, NULL);
+    if (imagefile->file == INVALID_HANDLE_VALUE)
+    {
+        errno = (GetLastError() == ERROR_FILE_NOT_FOUND) ? ENOENT : EACCES;
+        return -1;
+    }
+
+    LARGE_INTEGER file_bytes;
+    if (! GetFileSizeEx(imagefile->file, &file_bytes))
+    {
+        CloseHandle(imagefile->file);
+        errno = EIO;
+        return -1;
+    }
+    imagefile->size = (unsigned long long) file_bytes.QuadPart;
+    if (imagefile->size == 0)
+        return 0;
+
+    imagefile->mapping = CreateFileMappingA(imagefile->file, NULL, PAGE_READONLY, 0, 0, NULL);
+    if (imagefile->mapping != NULL)
+        imagefile->data = (const unsigned char*) MapViewOfFile(imagefile->mapping, FILE_MAP_READ, 0, 0, 0);
+
+    if (imagefile->data == NULL)
+    {
+        if (imagefile->mapping != NULL)
+            CloseHandle(imagefile->mapping);
+        CloseHandle(imagefile->file);
+        errno = ENOMEM;
+        return -1;
+    }
+#else
+    int file = open(filename, O_RDONLY);
+    if (file < 0)
+        return -1;
+
+    struct stat file_stat;
+    if (fstat(file, &file_stat) < 0)
+    {
+        close(file);
+        return -1;
+    }
+    imagefile->size = (unsigned long long) file_stat.st_size;
+    if (imagefile->size == 0)
+    {
+        close(file);
+        return 0;
+    }
+
+#ifdef POSIX_FADV_SEQUENTIAL
+    posix_fadvise(file, 0, 0, POSIX_FADV_SEQUENTIAL);
+#endif
+
+    void *data = mmap(NULL, imagefile->size, PROT_READ, MAP_PRIVATE, file, 0);
+
+    // The mapping stays valid after closing the file descriptor.
+    close(file);
+
+    if (data == MAP_FAILED)
+        return -1;
+
+#ifdef POSIX_MADV_SEQUENTIAL
+    posix_madvise(data, imagefile->size, POSIX_MADV_SEQUENTIAL);
+#endif
+    imagefile->data = (const unsigned char*) data;
+#endif
+    return 0;
+}
+
+
+
+void
+advise_random_access(const MappedImagefile *imagefile)
+{
+    /*
+    Advises the kernel to read only the accessed pages of the mapping,
+    if just a few buffers of the imagefile are decoded.
+    */
+#ifdef POSIX_MADV_RANDOM
+    if (imagefile->data != NULL)
+        posix_madvise((void*) imagefile->data, imagefile->size, POSIX_MADV_RANDOM);
+#else
+    (void) imagefile;
+#endif
+}
+
+
+
+void
+unmap_imagefile(MappedImagefile *imagefile)
+{
+#ifdef _WIN32
+    if (imagefile->data != NULL)
+        UnmapViewOfFile(imagefile->data);
+    if (imagefile->mapping != NULL)
+        CloseHandle(imagefile->mapping);
+    if (imagefile->file != INVALID_HANDLE_VALUE)
+        CloseHandle(imagefile->file);
+#else
+    if (imagefile->data != NULL)
+        munmap((void*) imagefile->data, imagefile->size);
+#endif
+    imagefile->data = NULL;
+    imagefile->size = 0;
+}
@@ -0,0 +1,249 @@
+/*
+SIMD kernels for the classification of grayscale image slices.
+
+A kernel converts the 128 bits of an image slice into 64 shadow levels
+and updates the pixel counts, the extents and the image moments. The
+fastest kernel supported by the CPU is selected when the module is
+imported. The scalar kernel in bitstream.h is the fallback on every
+other platform.
+
+The environment variable OAP_SLICE_KERNEL ("scalar", "sse2" or "avx2")
+selects a specific kernel, if it is supported.
+*/
+
+#if defined(__x86_64__) || defined(_M_X64)
+#define OAP_X86_KERNELS
+#include <immintrin.h>
+#endif
+
+#if defined(__GNUC__) || defined(__clang__)
+#define TARGET(features) __attribute__((target(features)))
+#else
+#define TARGET(features)
+#endif
+
+
+
+typedef void (*SliceKernel)(uint64_t, uint64_t, int, unsigned char*, PixelStats*);
+
+static SliceKernel classify_grayscale_slice = classify_grayscale_slice_scalar;
+static const char *slice_kernel_name = "scalar";
+
+
+
+static inline void
+update_pixel_stats(PixelStats *stats, int y, uint64_t shadowed,
+                   int pixel_one, int pixel_two, int pixel_thr, int sum_x)
+{
+    /*
+    Adds the results of one slice. Bit x of shadowed is set,
+    if the pixel x is shadowed. The column counts are updated
+    by the kernels.
+    */
+    stats->pixel_one += pixel_one;
+    stats->pixel_two += pixel_two;
+    stats->pixel_thr += pixel_thr;
+
+    if (shadowed)
+    {
+        int min_index = trailing_zeros64(shadowed);
+        int max_index = 63 - leading_zeros64(shadowed);
+        int number_of_pixels = pixel_one + pixel_two + pixel_thr;
+
+        if (stats->min_index > min_index) stats->min_index = min_index;
+        if (stats->max_index < max_index) stats->max_index = max_index;
+        stats->sum_x += sum_x;
+        stats->sum_y += y * number_of_pixels;
+        stats->sum_yy += y * y * number_of_pixels;
+        stats->sum_xy += y * sum_x;
+    }
+}
+
+
+
+#ifdef OAP_X86_KERNELS
+
+/*
+Every byte of a slice holds four pixels. After the byte is copied into
+four lanes, the first and the second bit of the pixel in each lane are
+tested with these masks.
+*/
+#define FIRST_BITS  0x02082080
+#define SECOND_BITS 0x01041040
+
+
+
+static inline int
+horizontal_sum_sse2(__m128i bytes)
+{
+    __m128i sums = _mm_sad_epu8(bytes, _mm_setzero_si128());
+    return _mm_cvtsi128_si32(sums) + _mm_cvtsi128_si32(_mm_srli_si128(sums, 8));
+}
+
+
+
+static void
+classify_grayscale_slice_sse2(uint64_t first_word, uint64_t second_word, int y,
+                              unsigned char *row, PixelStats *stats)
+{
+    // Slice bytes in stream order.
+    __m128i slice = _mm_set_epi64x((long long) byteswap64(second_word), (long long) byteswap64(first_word));
+    __m128i doubled_low = _mm_unpacklo_epi8(slice, slice);
+    __m128i doubled_high = _mm_unpackhi_epi8(slice, slice);
+    __m128i pixels[4] = {
+        _mm_unpacklo_epi16(doubled_low, doubled_low),
+        _mm_unpackhi_epi16(doubled_low, doubled_low),
+        _mm_unpacklo_epi16(doubled_high, doubled_high),
+        _mm_unpackhi_epi16(doubled_high, doubled_high),
+    };
+
+    const __m128i zero = _mm_setzero_si128();
+    const __m128i first_bits = _mm_set1_epi32(FIRST_BITS);
+    const __m128i second_bits = _mm_set1_epi32(SECOND_BITS);
+    const __m128i sixteen = _mm_set1_epi8(16);
+    __m128i x_index = _mm_setr_epi8(0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15);
+
+    __m128i count_1 = zero, count_2 = zero, count_3 = zero;
+    uint64_t shadowed = 0;
+    int sum_x = 0;
+
+    for (int k=0; k<4; k++)
+    {
+        // Bit pairs: (1,1) = 0, (0,1) = 1, (1,0) = 2, (0,0) = 3
+        __m128i first_unset = _mm_cmpeq_epi8(_mm_and_si128(pixels[k], first_bits), zero);
+        __m128i second_unset = _mm_cmpeq_epi8(_mm_and_si128(pixels[k], second_bits), zero);
+        __m128i level = _mm_sub_epi8(_mm_sub_epi8(zero, first_unset), _mm_add_epi8(second_unset, second_unset));
+        _mm_storeu_si128((__m128i*) (row + 16*k), level);
+
+        // Matching lanes are -1, so subtracting them counts the pixels.
+        count_1 = _mm_sub_epi8(count_1, _mm_andnot_si128(second_unset, first_unset));
+        count_2 = _mm_sub_epi8(count_2, _mm_andnot_si128(first_unset, second_unset));
+        count_3 = _mm_sub_epi8(count_3, _mm_and_si128(first_unset, second_unset));
+
+        __m128i shadow = _mm_or_si128(first_unset, second_unset);
+        __m128i *columns = (__m128i*) (stats->column_count + 16*k);
+        _mm_storeu_si128(columns, _mm_sub_epi8(_mm_loadu_si128(columns), shadow));
+        shadowed |= (uint64_t) (unsigned int) _mm_movemask_epi8(shadow) << (16*k);
+        sum_x += horizontal_sum_sse2(_mm_and_si128(shadow, x_index));
+        x_index = _mm_add_epi8(x_index, sixteen);
+    }
+
+    update_pixel_stats(stats, y, shadowed, horizontal_sum_sse2(count_1), horizontal_sum_sse2(count_2),
+                       horizontal_sum_sse2(count_3), sum_x);
+}
+
+
+
+TARGET("avx2")
+static inline int
+horizontal_sum_avx2(__m256i bytes)
+{
+    __m256i sums = _mm256_sad_epu8(bytes, _mm256_setzero_si256());
+    __m128i halves = _mm_add_epi64(_mm256_castsi256_si128(sums), _mm256_extracti128_si256(sums, 1));
+    return _mm_cvtsi128_si32(halves) + _mm_cvtsi128_si32(_mm_srli_si128(halves, 8));
+}
+
+
+
+TARGET("avx2")
+static void
+classify_grayscale_slice_avx2(uint64_t first_word, uint64_t second_word, int y,
+                              unsigned char *row, PixelStats *stats)
+{
+    // Slice bytes in stream order in both 128 bit lanes.
+    __m256i slice = _mm256_broadcastsi128_si256(
+        _mm_set_epi64x((long long) byteswap64(second_word), (long long) byteswap64(first_word)));
+    __m256i pixels[2] = {
+        _mm256_shuffle_epi8(slice, _mm256_setr_epi8(0, 0, 0, 0, 1, 1, 1, 1, 2, 2, 2, 2, 3, 3, 3, 3,
+                                                    4, 4, 4, 4, 5, 5, 5, 5, 6, 6, 6, 6, 7, 7, 7, 7)),
+        _mm256_shuffle_epi8(slice, _mm256_setr_epi8(8, 8, 8, 8, 9, 9, 9, 9, 10, 10, 10, 10, 11, 11, 11, 11,
+                                                    12, 12, 12, 12, 13, 13, 13, 13, 14, 14, 14, 14, 15, 15, 15, 15)),
+    };
+
+    const __m256i zero = _mm256_setzero_si256();
+    const __m256i first_bits = _mm256_set1_epi32(FIRST_BITS);
+    const __m256i second_bits = _mm256_set1_epi32(SECOND_BITS);
+    __m256i x_index = _mm256_setr_epi8(0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15,
+                                       16, 17, 18, 19, 20, 21, 22, 23, 24, 25, 26, 27, 28, 29, 30, 31);
+
+    __m256i count_1 = zero, count_2 = zero, count_3 = zero;
+    uint64_t shadowed = 0;
+    int sum_x = 0;
+
+    for (int k=0; k<2; k++)
+    {
+        // Bit pairs: (1,1) = 0, (0,1) = 1, (1,0) = 2, (0,0) = 3
+        __m256i first_unset = _mm256_cmpeq_epi8(_mm256_and_si256(pixels[k], first_bits), zero);
+        __m256i second_unset = _mm256_cmpeq_epi8(_mm256_and_si256(pixels[k], second_bits), zero);
+        __m256i level = _mm256_sub_epi8(_mm256_sub_epi8(zero, first_unset),
+                                        _mm256_add_epi8(second_unset, second_unset));
+        _mm256_storeu_si256((__m256i*) (row + 32*k), level);
+
+        // Matching lanes are -1, so subtracting them counts the pixels.
+        count_1 = _mm256_sub_epi8(count_1, _mm256_andnot_si256(second_unset, first_unset));
+        count_2 = _mm256_sub_epi8(count_2, _mm256_andnot_si256(first_unset, second_unset));
+        count_3 = _mm256_sub_epi8(count_3, _mm256_and_si256(first_unset, second_unset));
+
+        __m256i shadow = _mm256_or_si256(first_unset, second_unset);
+        __m256i *columns = (__m256i*) (stats->column_count + 32*k);
+        _mm256_storeu_si256(columns, _mm256_sub_epi8(_mm256_loadu_si256(columns), shadow));
+        shadowed |= (uint64_t) (unsigned int) _mm256_movemask_epi8(shadow) << (32*k);
+        sum_x += horizontal_sum_avx2(_mm256_and_si256(shadow, x_index));
+        x_index = _mm256_add_epi8(x_index, _mm256_set1_epi8(32));
+    }
+
+    update_pixel_stats(stats, y, shadowed, horizontal_sum_avx2(count_1), horizontal_sum_avx2(count_2),
+                       horizontal_sum_avx2(count_3), sum_x);
+}
+
+
+
+static bool
+cpu_supports_avx2(void)
+{
+#if defined(_MSC_VER)
+    int info[4];
+    __cpuid(info, 0);
+    if (info[0] < 7)
+        return false;
+    __cpuid(info, 1);
+    // The operating system must save the AVX registers (OSXSAVE and AVX).
+    if ((info[2] & (1 << 27)) == 0 || (info[2] & (1 << 28)) == 0 || (_xgetbv(0) & 6) != 6)
+        return false;
+    __cpuidex(info, 7, 0);
+    return (info[1] & (1 << 5)) != 0;
+#else
+    __builtin_cpu_init();
+    return __builtin_cpu_supports("avx2");
+#endif
+}
+
+#endif
+
+
+
+void
+init_slice_kernels(void)
+{
+    /*
+    Selects the fastest slice kernel supported by the CPU.
+    */
+    const char *requested = getenv("OAP_SLICE_KERNEL");
+
+    if (requested != NULL && strcmp(requested, "scalar") == 0)
+        return;
+
+#ifdef OAP_X86_KERNELS
+    classify_grayscale_slice = classify_grayscale_slice_sse2;
+    slice_kernel_name = "sse2";
+
+    if (requested != NULL && strcmp(requested, "sse2") == 0)
+        return;
+
+    if (cpu_supports_avx2())
+    {
+        classify_grayscale_slice = classify_grayscale_slice_avx2;
+        slice_kernel_name = "avx2";
+    }
+#endif
+}
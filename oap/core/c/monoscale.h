@@ -0,0 +1,131 @@
+/*
+Decompressed data of DMT CIP monoscale imagefiles.
+
+Monoscale data is run-length encoded bytewise. An image slice consists of
+8 bytes with one bit per pixel (first pixel in the highest bit of the first
+byte). Cleared bits are shadowed pixels. Particles are separated by
+boundary slices of 8 bytes 0xAA.
+*/
+
+// Shadow level of monoscale pixels (MONOSCALE_SHADOWLEVEL in oap.__conf__).
+#define MONOSCALE_SHADOW_LEVEL 1
+
+#define MONOSCALE_SLICE_SIZE 8
+#define MONOSCALE_BOUNDARY 0xAA
+
+static const unsigned char MONOSCALE_BOUNDARY_SLICE[MONOSCALE_SLICE_SIZE] = {
+    MONOSCALE_BOUNDARY, MONOSCALE_BOUNDARY, MONOSCALE_BOUNDARY, MONOSCALE_BOUNDARY,
+    MONOSCALE_BOUNDARY, MONOSCALE_BOUNDARY, MONOSCALE_BOUNDARY, MONOSCALE_BOUNDARY,
+};
+
+// Bit j is set, if pixel j of a slice byte is shadowed.
+static unsigned char MONOSCALE_SHADOWED[256];
+
+// Shadow levels of the eight pixels of a slice byte.
+static unsigned char MONOSCALE_LEVELS[256][8];
+
+
+
+void
+init_monoscale_tables(void)
+{
+    for (int byte=0; byte<256; byte++)
+    {
+        MONOSCALE_SHADOWED[byte] = 0;
+        for (int j=0; j<8; j++)
+        {
+            bool shadowed = ! (byte & (128 >> j));
+            MONOSCALE_SHADOWED[byte] |= shadowed << j;
+            MONOSCALE_LEVELS[byte][j] = shadowed ? MONOSCALE_SHADOW_LEVEL : 0;
+        }
+    }
+}
+
+
+
+size_t
+expand_monoscale_data(const unsigned char *data, unsigned char *bytes)
+{
+    /*
+    Decompresses the data bytes of a buffer and returns the number of
+    decompressed bytes, which is at most count_monoscale_bytes(data).
+
+    -> 1xxxxxxx: repeat 0x00, 01xxxxxx: repeat 0xFF, 001xxxxx: dummy byte,
+       000xxxxx: the next bytes are not compressed (5 bit count + 1)
+    */
+    size_t k = 0;
+    int i = 0;
+
+    while (i < BUFFER_DATA_SIZE)
+    {
+        int count = (data[i]&31) + 1;
+
+        if (data[i]&32)
+            i++;
+        else if (data[i]&128 || data[i]&64)
+        {
+            memset(bytes+k, (data[i]&128) ? 0 : 255, count);
+            k += count;
+            i++;
+        }
+        else
+        {
+            i++;
+            if (count > BUFFER_DATA_SIZE-i)
+                count = BUFFER_DATA_SIZE-i;
+            memcpy(bytes+k, data+i, count);
+            k += count;
+            i += count;
+        }
+    }
+    return k;
+}
+
+
+
+long long
+find_monoscale_data_start(const unsigned char *bytes, size_t byte_count)
+{
+    /*
+    Returns the index behind the first boundary slice or -1,
+    if the data contains no boundary.
+    */
+    int boundary_count = 0;
+    for (size_t k=0; k<byte_count; k++)
+    {
+        boundary_count = (bytes[k] == MONOSCALE_BOUNDARY) ? boundary_count+1 : 0;
+        if (boundary_count == MONOSCALE_SLICE_SIZE)
+            return (long long) k+1;
+    }
+    return -1;
+}
+
+
+
+static inline void
+classify_monoscale_slice(const unsigned char *slice, int y, unsigned char *row, PixelStats *stats)
+{
+    /*
+    Writes the 64 shadow levels of an image slice into the row and
+    updates the pixel counts, the extents and the moments.
+    */
+    uint64_t shadowed = 0;
+    for (int x=0; x<MONOSCALE_SLICE_SIZE; x++)
+    {
+        shadowed |= (uint64_t) MONOSCALE_SHADOWED[slice[x]] << (8*x);
+        memcpy(row + 8*x, MONOSCALE_LEVELS[slice[x]], 8);
+    }
+
+    // Sum of the indices of all shadowed pixels, every index bit at once.
+    int sum_x = popcount64(shadowed & 0xAAAAAAAAAAAAAAAAULL)
+              + popcount64(shadowed & 0xCCCCCCCCCCCCCCCCULL) * 2
+              + popcount64(shadowed & 0xF0F0F0F0F0F0F0F0ULL) * 4
+              + popcount64(shadowed & 0xFF00FF00FF00FF00ULL) * 8
+              + popcount64(shadowed & 0xFFFF0000FFFF0000ULL) * 16
+              + popcount64(shadowed & 0xFFFFFFFF00000000ULL) * 32;
+
+    for (uint64_t mask=shadowed; mask; mask &= mask - 1)
+        stats->column_count[trailing_zeros64(mask)]++;
+
+    update_pixel_stats(stats, y, shadowed, popcount64(shadowed), 0, 0, sum_x);
+}
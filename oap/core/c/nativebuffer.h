@@ -0,0 +1,79 @@
+/*
+Python object, which owns a block of native memory and exposes it through
+the buffer protocol. Columns and images, which are written by the decoder,
+are handed to NumPy without copying them (numpy.frombuffer).
+*/
+
+typedef struct {
+    PyObject_HEAD
+    void *data;
+    Py_ssize_t size;
+} NativeBufferObject;
+
+
+
+static void
+NativeBuffer_dealloc(NativeBufferObject *self)
+{
+    free(self->data);
+    Py_TYPE(self)->tp_free((PyObject *) self);
+}
+
+
+
+static int
+NativeBuffer_getbuffer(NativeBufferObject *self, Py_buffer *view, int flags)
+{
+    return PyBuffer_FillInfo(view, (PyObject *) self, self->data, self->size, 0, flags);
+}
+
+
+
+static Py_ssize_t
+NativeBuffer_length(NativeBufferObject *self)
+{
+    return self->size;
+}
+
+
+
+static PyBufferProcs NativeBuffer_as_buffer = {
+    .bf_getbuffer = (getbufferproc) NativeBuffer_getbuffer,
+};
+
+static PySequenceMethods NativeBuffer_as_sequence = {
+    .sq_length = (lenfunc) NativeBuffer_length,
+};
+
+static PyTypeObject NativeBufferType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    .tp_name = "oap.NativeBuffer",
+    .tp_doc = "Native memory of the C extension, which supports the buffer protocol.",
+    .tp_basicsize = sizeof(NativeBufferObject),
+    .tp_itemsize = 0,
+    .tp_flags = Py_TPFLAGS_DEFAULT,
+    .tp_dealloc = (destructor) NativeBuffer_dealloc,
+    .tp_as_buffer = &NativeBuffer_as_buffer,
+    .tp_as_sequence = &NativeBuffer_as_sequence,
+};
+
+
+
+static PyObject *
+NativeBuffer_from_memory(void *data, Py_ssize_t size)
+{
+    /*
+    Creates a new buffer object, which takes the ownership of the memory.
+    The memory is freed, if the object could not be created.
+    */
+    NativeBufferObject *self;
+    self = (NativeBufferObject *) NativeBufferType.tp_alloc(&NativeBufferType, 0);
+    if (self == NULL)
+    {
+        free(data);
+        return NULL;
+    }
+    self->data = data;
+    self->size = size;
+    return (PyObject *) self;
+}
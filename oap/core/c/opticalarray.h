@@ -7,6 +7,17 @@ typedef struct {
 
     unsigned char *array;
 
+    // Owner of the array, if the array is a view into the particle images of a decode.
+    PyObject *base;
+
+    // Pixels are packed (see packedpixels.h). The Poisson spot mask is optional.
+    bool packed;
+    uint64_t *poisson_mask;
+
+    // Number of buffer views of the particle image (see OpticalArray_getbuffer) and their shape.
+    Py_ssize_t exports;
+    Py_ssize_t shape[2];
+
     unsigned int second;
     unsigned short number;
     unsigned short millisecond;
@@ -38,6 +49,10 @@ typedef struct {
 
 } OpticalArrayObject;
 
+// Incremented whenever an attribute of an OpticalArray object is set. Cached attribute
+// values (e.g. the metadata columns of oap.Imagefile) are valid as long as it is unchanged.
+static unsigned long long optical_array_version = 0;
+
 
 
 /*
@@ -45,6 +60,94 @@ typedef struct {
  * ---  | OpticalArray: Special Methods | ------------------------------------------------------------------------------
  *      * ----------------------------- *
  */
+static void
+OpticalArray_release_array(OpticalArrayObject *self)
+{
+    if (self->base != NULL)
+        Py_CLEAR(self->base);
+    else
+        free(self->array);
+    self->array = NULL;
+    self->packed = false;
+    self->poisson_mask = NULL;
+}
+
+static void
+OpticalArray_copy_pixels(const OpticalArrayObject *self, unsigned char *array)
+{
+    // Writes the unpacked particle image (y_dim * 64 pixels) to array.
+    if (self->packed)
+        unpack_pixels(self->array, self->poisson_mask, self->y_dim, array);
+    else
+        memcpy(array, self->array, self->y_dim * 64);
+}
+
+static const unsigned char *
+OpticalArray_pixels(const OpticalArrayObject *self, unsigned char **unpacked)
+{
+    /*
+    Returns the unpacked particle image. A packed image is unpacked into
+    a temporary copy, which is returned in unpacked and must be freed.
+    */
+    *unpacked = NULL;
+    if (! self->packed)
+        return self->array;
+
+    *unpacked = (unsigned char*) malloc(self->y_dim * 64 + 1);
+    if (*unpacked == NULL)
+    {
+        PyErr_NoMemory();
+        return NULL;
+    }
+    OpticalArray_copy_pixels(self, *unpacked);
+    return *unpacked;
+}
+
+static int
+OpticalArray_check_exports(const OpticalArrayObject *self)
+{
+    // The particle image must not be replaced while it is exported.
+    if (self->exports > 0)
+    {
+        PyErr_SetString(PyExc_BufferError, "particle image is exported by a buffer view");
+        return -1;
+    }
+    return 0;
+}
+
+static int
+OpticalArray_pack_pixels(OpticalArrayObject *self)
+{
+    /*
+    Replaces the particle image by its packed representation.
+    Returns -1 if an exception was raised.
+    */
+    if (self->packed || self->array == NULL)
+        return 0;
+    if (OpticalArray_check_exports(self) < 0)
+        return -1;
+
+    bool marker = memchr(self->array, POISSON_SPOT_MARKER, self->y_dim * 64) != NULL;
+    unsigned char *packed = (unsigned char*) malloc(packed_pixels_size(self->y_dim, marker) + 1);
+    if (packed == NULL)
+    {
+        PyErr_NoMemory();
+        return -1;
+    }
+    uint64_t *poisson_mask = marker ? (uint64_t*) (packed + self->y_dim * PACKED_ROW_SIZE) : NULL;
+    if (pack_pixels(self->array, self->y_dim, packed, poisson_mask) < 0)
+    {
+        free(packed);
+        PyErr_SetString(PyExc_ValueError, "only shadow levels 0 to 3 and Poisson spot markers can be packed");
+        return -1;
+    }
+    OpticalArray_release_array(self);
+    self->array = packed;
+    self->poisson_mask = poisson_mask;
+    self->packed = true;
+    return 0;
+}
+
 static PyObject *
 OpticalArray_new(PyTypeObject *type, PyObject *args, PyObject *kwds)
 {
@@ -103,7 +206,10 @@ OpticalArray_init(OpticalArrayObject *self, PyObject *args, PyObject *kwargs)
                              "rosette",
                              NULL};
 
-    unsigned char *buffer;  // ToDo: is this really the best solution?
+    if (OpticalArray_check_exports(self) < 0)
+        return -1;
+
+    Py_buffer buffer = {NULL, NULL};
     if (!PyArg_ParseTupleAndKeywords(args, kwargs, "|y*IHHHbbbbbHHHbbbbfffff", kwlist,
                                      &buffer,
                                      &self->second,
@@ -128,47 +234,82 @@ OpticalArray_init(OpticalArrayObject *self, PyObject *args, PyObject *kwargs)
                                      &self->column,
                                      &self->rosette))
         return -1;
-    self->array = buffer;
+
+    // The particle image is copied, the object owns its array.
+    OpticalArray_release_array(self);
+    if (buffer.obj != NULL)
+    {
+        Py_ssize_t image_size = self->y_dim * 64;
+        if (buffer.len < image_size)
+        {
+            PyBuffer_Release(&buffer);
+            PyErr_SetString(PyExc_ValueError, "array is smaller than y_dim * 64 pixels");
+            return -1;
+        }
+        self->array = (unsigned char*) malloc(image_size ? image_size : 1);
+        if (self->array == NULL)
+        {
+            PyBuffer_Release(&buffer);
+            PyErr_NoMemory();
+            return -1;
+        }
+        memcpy(self->array, buffer.buf, image_size);
+        PyBuffer_Release(&buffer);
+    }
     return 0;
 }
 
 static void
 OpticalArray_dealloc(OpticalArrayObject *self)
 {
+    OpticalArray_release_array(self);
     Py_TYPE(self)->tp_free((PyObject *) self);
 }
 
+static int
+OpticalArray_setattro(PyObject *self, PyObject *name, PyObject *value)
+{
+    int result = PyObject_GenericSetAttr(self, name, value);
+    if (result == 0)
+        optical_array_version++;
+    return result;
+}
+
 static PyObject *
 OpticalArray_repr(OpticalArrayObject *self)
 {
-    char *image;
-    image = (unsigned char*) malloc((self->y_dim * 64 + 1) * sizeof(char));
+    /*
+    Returns the particle image as text with one line per image slice. Shadow
+    levels 1 to 3 are written as digits, any other level as X.
+    */
+    unsigned char *unpacked;
+    const unsigned char *array = OpticalArray_pixels(self, &unpacked);
+    if (array == NULL && self->packed)
+        return NULL;
+
+    char *image = (char*) malloc(self->y_dim * 65 + 1);
+    if (image == NULL)
+    {
+        free(unpacked);
+        return PyErr_NoMemory();
+    }
 
+    char *character = image;
     for (int y=0; y<self->y_dim; y++)
     {
+        if (y > 0)
+            *character++ = '\n';
         for (int x=0; x<64; x++)
         {
-            if (self->array[y*64+x] == 0)
-                image[y*64+x] = " ";
-            else if (self->array[y*64+x] == 1)
-                image[y*64+x] = "1";
-            else if (self->array[y*64+x] == 2)
-                image[y*64+x] = "2";
-            else if (self->array[y*64+x] == 3)
-                image[y*64+x] = "3";
-            else
-                image[y*64+x] = "X";
+            unsigned char level = array[y*64+x];
+            *character++ = (level == 0) ? ' ' : (level <= 3) ? '0' + level : 'X';
         }
     }
-    image[self->y_dim * 64 + 1] = NULL;
-    const char * tmp = image;
+    *character = '\0';
 
-    const char test[5] = "Test";
-    for (int i=0; i<5; i++)
-        printf("%c ", test[i]);
-
-    PyObject *unicode = PyUnicode_FromString(test);
+    PyObject *unicode = PyUnicode_FromString(image);
     free(image);
+    free(unpacked);
     return unicode;
 }
 
@@ -194,18 +335,61 @@ OpticalArray_height(OpticalArrayObject *self, PyObject *Py_UNUSED(ignored))
 static PyObject *
 OpticalArray_bytes(OpticalArrayObject *self, PyObject *Py_UNUSED(ignored))
 {
-    return Py_BuildValue("y#", self->array, 64*self->y_dim);
+    PyObject *bytes = PyBytes_FromStringAndSize(NULL, 64*self->y_dim);
+    if (bytes != NULL)
+        OpticalArray_copy_pixels(self, (unsigned char*) PyBytes_AS_STRING(bytes));
+    return bytes;
 }
 
 static PyObject *
 OpticalArray_list(OpticalArrayObject *self, PyObject *Py_UNUSED(ignored))
 {
-    PyObject *list = PyList_New(0);
-    for (int i=0; i<self->y_dim*64; i++)
-        PyList_Append(list, PyLong_FromLong(self->array[i]));
+    unsigned char *unpacked;
+    const unsigned char *array = OpticalArray_pixels(self, &unpacked);
+    if (array == NULL && self->packed)
+        return NULL;
+
+    PyObject *list = PyList_New(self->y_dim*64);
+    for (int i=0; list != NULL && i<self->y_dim*64; i++)
+    {
+        PyObject *level = PyLong_FromLong(array[i]);
+        if (level == NULL)
+        {
+            Py_CLEAR(list);
+            break;
+        }
+        PyList_SET_ITEM(list, i, level);
+    }
+    free(unpacked);
     return list;
 }
 
+static PyObject *
+OpticalArray_pack(OpticalArrayObject *self, PyObject *Py_UNUSED(ignored))
+{
+    // Packs the particle image into two bits per pixel.
+    if (OpticalArray_pack_pixels(self) < 0)
+        return NULL;
+    Py_RETURN_NONE;
+}
+
+static PyObject *
+OpticalArray_unpack(OpticalArrayObject *self, PyObject *Py_UNUSED(ignored))
+{
+    // Restores one byte per pixel.
+    if (! self->packed)
+        Py_RETURN_NONE;
+    if (OpticalArray_check_exports(self) < 0)
+        return NULL;
+
+    unsigned char *unpacked;
+    if (OpticalArray_pixels(self, &unpacked) == NULL)
+        return NULL;
+    OpticalArray_release_array(self);
+    self->array = unpacked;
+    Py_RETURN_NONE;
+}
+
 static PyObject *
 OpticalArray_string(OpticalArrayObject *self, PyObject *Py_UNUSED(ignored))
 {
@@ -230,60 +414,103 @@ OpticalArray_area_ratio(OpticalArrayObject *self, PyObject *Py_UNUSED(ignored))
 }
 
 static PyObject *
-OpticalArray_tensor(OpticalArrayObject *self, PyObject *Py_UNUSED(ignored))
+OpticalArray_components(OpticalArrayObject *self, PyObject *Py_UNUSED(ignored))
 {
-    int new_xbary = 31;
-    int new_ybary = 31;
-    float *tensor_array;
-    tensor_array = (float*) calloc(64 * 64, sizeof(float));
-
-    int y_dimension;
-    if (64 > self->y_dim)
-        y_dimension = self->y_dim;
-    else
-        y_dimension = 64;
+    /*
+    Returns the 8-connected components of the shadowed pixels as a list of
+    (pixels, x_min, x_max, y_min, y_max) tuples in the order of their first
+    pixel. Poisson spot markers do not belong to any component.
+    */
+    if (self->array == NULL || self->y_dim == 0)
+        return PyList_New(0);
+
+    unsigned char *unpacked;
+    const unsigned char *array = OpticalArray_pixels(self, &unpacked);
+    if (array == NULL)
+        return NULL;
+
+    int *scratch = (int*) malloc(cluster_scratch_size(self->y_dim, 0, 63) * sizeof(int));
+    ParticleComponent *components = (ParticleComponent*) malloc((32 * self->y_dim + 1) * sizeof(ParticleComponent));
+    if (scratch == NULL || components == NULL)
+    {
+        free(unpacked);
+        free(scratch);
+        free(components);
+        return PyErr_NoMemory();
+    }
 
-    int x_shift = new_xbary - self->x_bary;
-    int y_shift = new_ybary - self->y_bary;
-    float pixel_value;
+    int n_components = label_components(array, self->y_dim, 0, 63, scratch, components);
+    free(unpacked);
 
-    for (int y=y_shift; y<y_dimension+y_shift; y++)
+    PyObject *list = PyList_New(n_components);
+    for (int i=0; list != NULL && i<n_components; i++)
     {
-        for (int x=0; x<64; x++)
-        {
-            pixel_value = 0.0; // ToDo: monochromatic
-
-            if (self->array[(y-y_shift)*64+x] != 0 && self->array[(y-y_shift)*64+x] != 7) // ToDo: poisson spot
-            {
-                pixel_value = 1.0;
-            }
-
-            if (pixel_value != 0)
-            {
-                if (new_xbary != -1)
-                {
-                    int new_x = x+x_shift;
-                    if (new_x >= 0 && new_x < 64)
-                    {
-                        if (y >= 0 && y < 64)
-                        {
-                            tensor_array[y*64+new_x] = pixel_value;
-                        }
-                    }
-                }
-                else
-                {
-                    if (y >= 0 && y < 64)
-                        tensor_array[y*64+x] = pixel_value;
-                }
-            }
-        }
+        PyObject *component = Py_BuildValue("(iiiii)", components[i].pixels,
+                                            components[i].x_min, components[i].x_max,
+                                            components[i].y_min, components[i].y_max);
+        if (component == NULL)
+            Py_CLEAR(list);
+        else
+            PyList_SET_ITEM(list, i, component);
+    }
+    free(scratch);
+    free(components);
+    return list;
+}
+
+void
+particle_tensor(const unsigned char *array, int y_dim, int x_bary, int y_bary, float *tensor)
+{
+    /*
+    Writes the shadowed pixels of a particle image as ones into a zeroed
+    64x64 tensor, which is centred around the barycenter of the particle.
+    Poisson spot markers are not shadowed. At most 64 slices are used.
+    */
+    int x_shift = 31 - x_bary;
+    int y_shift = 31 - y_bary;
+    int y_dimension = (y_dim < 64) ? y_dim : 64;
+
+    // Rows and columns of the image, which are shifted into the tensor.
+    int y_first = (y_shift < 0) ? -y_shift : 0;
+    int y_last = (y_dimension < 64-y_shift) ? y_dimension : 64-y_shift;
+    int x_first = (x_shift < 0) ? -x_shift : 0;
+    int x_last = (64 < 64-x_shift) ? 64 : 64-x_shift;
+
+    for (int y=y_first; y<y_last; y++)
+    {
+        const unsigned char *row = array + y*64;
+        float *tensor_row = tensor + (y+y_shift)*64 + x_shift;
+
+        for (int x=x_first; x<x_last; x++)
+            tensor_row[x] = (row[x] != 0 && row[x] != POISSON_SPOT_MARKER) ? 1.0f : 0.0f; // ToDo: monochromatic
+    }
+}
+
+static PyObject *
+OpticalArray_tensor(OpticalArrayObject *self, PyObject *Py_UNUSED(ignored))
+{
+    unsigned char *unpacked;
+    const unsigned char *array = OpticalArray_pixels(self, &unpacked);
+    if (array == NULL && self->packed)
+        return NULL;
+
+    float *tensor_array = (float*) calloc(64 * 64, sizeof(float));
+    if (tensor_array == NULL)
+    {
+        free(unpacked);
+        return PyErr_NoMemory();
     }
+    particle_tensor(array, self->y_dim, self->x_bary, self->y_bary, tensor_array);
+    free(unpacked);
 
-    PyObject *particle_as_tensor = PyList_New(0);
-    for (int i=0; i<64*64; i++)
+    PyObject *particle_as_tensor = PyList_New(64 * 64);
+    for (int i=0; particle_as_tensor != NULL && i<64*64; i++)
     {
-        PyList_Append(particle_as_tensor, PyFloat_FromDouble(tensor_array[i]));
+        PyObject *value = PyFloat_FromDouble(tensor_array[i]);
+        if (value == NULL)
+            Py_CLEAR(particle_as_tensor);
+        else
+            PyList_SET_ITEM(particle_as_tensor, i, value);
     }
     free(tensor_array);
     return particle_as_tensor;
@@ -292,16 +519,26 @@ OpticalArray_tensor(OpticalArrayObject *self, PyObject *Py_UNUSED(ignored))
 static PyObject *
 OpticalArray_print(OpticalArrayObject *self, PyObject *Py_UNUSED(ignored))
 {
-    print_array(self->array, self->y_dim, 64);
-    return Py_None;
+    unsigned char *unpacked;
+    const unsigned char *array = OpticalArray_pixels(self, &unpacked);
+    if (array == NULL && self->packed)
+        return NULL;
+
+    print_array((unsigned char*) array, self->y_dim, 64);
+    free(unpacked);
+    Py_RETURN_NONE;
 }
 
 static PyObject *
 OpticalArray_reduce(OpticalArrayObject *self, PyObject *Py_UNUSED(ignored))
 {
-    return Py_BuildValue("O(y#IHHHBBBBBHHHBBBBfffff)",
-                         PyObject_GetAttrString(self, "__class__"),    // ToDo: is this the best way?
-                         self->array, 64 * self->y_dim,
+    PyObject *array = OpticalArray_bytes(self, NULL);
+    if (array == NULL)
+        return NULL;
+
+    return Py_BuildValue("O(NIHHHBBBBBHHHBBBBfffff)",
+                         (PyObject *) Py_TYPE(self),
+                         array,
                          self->second,
                          self->number,
                          self->millisecond,
@@ -329,15 +566,177 @@ OpticalArray_reduce(OpticalArrayObject *self, PyObject *Py_UNUSED(ignored))
 
 
 
+/*
+ *      * ------------------------------------------------ *
+ * ---  | OpticalArray: Conversion of native particle records | -----------------------------------------------------
+ *      * ------------------------------------------------ *
+ */
+static PyTypeObject OpticalArrayType;
+
+static OpticalArrayObject *
+OpticalArray_from_record(const ParticleRecord *particle, const unsigned char *particle_array, PyObject *base)
+{
+    /*
+    Creates a new OpticalArray object from a particle record. If base is
+    given, the object is a view into the particle images owned by base.
+    Otherwise the particle image is copied.
+    */
+    OpticalArrayObject *self;
+    self = (OpticalArrayObject *) OpticalArrayType.tp_alloc(&OpticalArrayType, 0);
+    if (self == NULL)
+        return NULL;
+
+    if (base != NULL)
+    {
+        Py_INCREF(base);
+        self->base = base;
+        self->array = (unsigned char*) particle_array;
+    }
+    else
+    {
+        self->array = (unsigned char*) malloc(particle->y_dim * 64 * sizeof(unsigned char));
+        if (self->array == NULL)
+        {
+            Py_DECREF(self);
+            PyErr_NoMemory();
+            return NULL;
+        }
+        memcpy(self->array, particle_array, particle->y_dim * 64);
+    }
+
+    self->second = particle->second;
+    self->number = particle->number;
+    self->millisecond = particle->millisecond;
+    self->microsecond = particle->microsecond;
+    self->y_dim = particle->y_dim;
+    self->x_bary = particle->x_bary;
+    self->y_bary = particle->y_bary;
+    self->min_idx = particle->min_idx;
+    self->max_idx = particle->max_idx;
+    self->pixel_one = particle->pixel_one;
+    self->pixel_two = particle->pixel_two;
+    self->pixel_thr = particle->pixel_thr;
+    self->poisson = particle->poisson;
+    self->poisson_mono = particle->poisson_mono;
+    self->truncated = particle->truncated;
+    self->cluster = particle->cluster;
+    self->hit_ratio = particle->hit_ratio;
+    self->axis_ratio = particle->axis_ratio;
+    self->alpha = particle->alpha;
+    self->column = particle->column;
+    self->rosette = particle->rosette;
+    return self;
+}
+
+void
+OpticalArray_to_record(const OpticalArrayObject *self, ParticleRecord *particle)
+{
+    memset(particle, 0, sizeof(ParticleRecord));
+    particle->second = self->second;
+    particle->number = self->number;
+    particle->millisecond = self->millisecond;
+    particle->microsecond = self->microsecond;
+    particle->y_dim = self->y_dim;
+    particle->x_bary = self->x_bary;
+    particle->y_bary = self->y_bary;
+    particle->min_idx = self->min_idx;
+    particle->max_idx = self->max_idx;
+    particle->pixel_one = self->pixel_one;
+    particle->pixel_two = self->pixel_two;
+    particle->pixel_thr = self->pixel_thr;
+    particle->poisson = self->poisson;
+    particle->poisson_mono = self->poisson_mono;
+    particle->truncated = self->truncated;
+    particle->cluster = self->cluster;
+    particle->hit_ratio = self->hit_ratio;
+    particle->axis_ratio = self->axis_ratio;
+    particle->alpha = self->alpha;
+    particle->column = self->column;
+    particle->rosette = self->rosette;
+}
+
+// ---------------------------------------------------------------------------------------------------------------------
+
+
+
+/*
+ *      * ------------------------------------------ *
+ * ---  | OpticalArray: Buffer protocol (PEP 3118) | -------------------------------------------------------------------
+ *      * ------------------------------------------ *
+ */
+static Py_ssize_t OPTICAL_ARRAY_STRIDES[2] = {64, 1};
+
+static int
+OpticalArray_getbuffer(OpticalArrayObject *self, Py_buffer *view, int flags)
+{
+    /*
+    Exports the particle image as read-only (y_dim, 64) uint8 buffer
+    without copying it. A packed image is unpacked into a temporary copy,
+    which lives as long as the buffer view.
+    */
+    view->obj = NULL;
+    if ((flags & PyBUF_WRITABLE) == PyBUF_WRITABLE)
+    {
+        PyErr_SetString(PyExc_BufferError, "particle image is read-only");
+        return -1;
+    }
+
+    unsigned char *unpacked;
+    const unsigned char *array = OpticalArray_pixels(self, &unpacked);
+    if (array == NULL && self->packed)
+        return -1;
+
+    self->shape[0] = self->y_dim;
+    self->shape[1] = 64;
+
+    view->buf = (void*) array;
+    view->obj = (PyObject*) self;
+    view->len = self->y_dim * 64;
+    view->readonly = 1;
+    view->itemsize = 1;
+    view->format = ((flags & PyBUF_FORMAT) == PyBUF_FORMAT) ? "B" : NULL;
+    view->shape = ((flags & PyBUF_ND) == PyBUF_ND) ? self->shape : NULL;
+    view->ndim = (view->shape != NULL) ? 2 : 1;
+    view->strides = ((flags & PyBUF_STRIDES) == PyBUF_STRIDES) ? OPTICAL_ARRAY_STRIDES : NULL;
+    view->suboffsets = NULL;
+    view->internal = unpacked;
+
+    Py_INCREF(self);
+    self->exports++;
+    return 0;
+}
+
+static void
+OpticalArray_releasebuffer(OpticalArrayObject *self, Py_buffer *view)
+{
+    free(view->internal);
+    self->exports--;
+}
+
+static PyBufferProcs OpticalArray_as_buffer = {
+    .bf_getbuffer = (getbufferproc) OpticalArray_getbuffer,
+    .bf_releasebuffer = (releasebufferproc) OpticalArray_releasebuffer,
+};
+
+// ---------------------------------------------------------------------------------------------------------------------
+
+
+
 static PyMemberDef OpticalArray_members[] = { // ToDo: missing descriptions!
     {"second", T_UINT, offsetof(OpticalArrayObject, second), 0, ""},
     {"number", T_USHORT, offsetof(OpticalArrayObject, number), 0, ""},
+    {"millisecond", T_USHORT, offsetof(OpticalArrayObject, millisecond), 0, ""},
+    {"microsecond", T_USHORT, offsetof(OpticalArrayObject, microsecond), 0, ""},
     {"hit_ratio", T_FLOAT, offsetof(OpticalArrayObject, hit_ratio), 0, ""},
     {"axis_ratio", T_FLOAT, offsetof(OpticalArrayObject, axis_ratio), 0, ""},
     {"alpha", T_FLOAT, offsetof(OpticalArrayObject, alpha), 0, ""},
     {"column", T_FLOAT, offsetof(OpticalArrayObject, column), 0, ""},
     {"rosette", T_FLOAT, offsetof(OpticalArrayObject, rosette), 0, ""},
     {"truncated", T_BOOL, offsetof(OpticalArrayObject, truncated), 0, ""},
+    {"cluster", T_UBYTE, offsetof(OpticalArrayObject, cluster), 0, ""},
+    {"poisson", T_UBYTE, offsetof(OpticalArrayObject, poisson), 0, ""},
+    {"base", T_OBJECT, offsetof(OpticalArrayObject, base), READONLY, ""},
+    {"packed", T_BOOL, offsetof(OpticalArrayObject, packed), READONLY, ""},
     {NULL}  /* Sentinel */
 };
 
@@ -351,6 +750,9 @@ static PyMethodDef OpticalArray_methods[] = { // ToDo: missing descriptions!
     {"height", (PyCFunction) OpticalArray_height, METH_NOARGS, ""},
     {"tensor", (PyCFunction) OpticalArray_tensor, METH_NOARGS, ""},
     {"area_ratio", (PyCFunction) OpticalArray_area_ratio, METH_NOARGS, ""},
+    {"components", (PyCFunction) OpticalArray_components, METH_NOARGS, ""},
+    {"pack", (PyCFunction) OpticalArray_pack, METH_NOARGS, ""},
+    {"unpack", (PyCFunction) OpticalArray_unpack, METH_NOARGS, ""},
     {"__reduce__", (PyCFunction) OpticalArray_reduce, METH_NOARGS, ""},
     {NULL}  /* Sentinel */
 };
@@ -365,7 +767,17 @@ static PyTypeObject OpticalArrayType = {
     .tp_new = OpticalArray_new,
     .tp_init = (initproc) OpticalArray_init,
     .tp_dealloc = (destructor) OpticalArray_dealloc,
-    .tp_repr = OpticalArray_repr,
+    .tp_repr = (reprfunc) OpticalArray_repr,
+    .tp_setattro = OpticalArray_setattro,
+    .tp_as_buffer = &OpticalArray_as_buffer,
     .tp_members = OpticalArray_members,
     .tp_methods = OpticalArray_methods,
 };
+
+
+
+static PyObject *
+attribute_version(PyObject *module, PyObject *Py_UNUSED(ignored))
+{
+    return PyLong_FromUnsignedLongLong(optical_array_version);
+}
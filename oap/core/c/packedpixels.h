@@ -0,0 +1,99 @@
+/*
+Packed storage of particle images.
+
+Grayscale shadow levels (0 to 3) need only two bits, so four pixels are
+packed into one byte (pixel x in the bits 2*(x%4) of byte x/4), which is
+a quarter of the unpacked image. Poisson spot markers are kept in an
+optional bitmask with one 64 bit word per image row.
+*/
+
+// Bytes of the packed pixels and of the Poisson spot mask per image row.
+#define PACKED_ROW_SIZE 16
+#define POISSON_MASK_ROW_SIZE 8
+
+static unsigned char PACKED_PIXELS[256][4];
+
+
+
+void
+init_packed_pixel_table(void)
+{
+    for (int byte=0; byte<256; byte++)
+    {
+        for (int j=0; j<4; j++)
+            PACKED_PIXELS[byte][j] = (byte >> (2*j)) & 3;
+    }
+}
+
+
+
+size_t
+packed_pixels_size(int y_dim, bool poisson_mask)
+{
+    return y_dim * (PACKED_ROW_SIZE + (poisson_mask ? POISSON_MASK_ROW_SIZE : 0));
+}
+
+
+
+int
+pack_pixels(const unsigned char *array, int y_dim, unsigned char *packed, uint64_t *poisson_mask)
+{
+    /*
+    Packs the pixels of an image. The Poisson spot markers are written to
+    the mask, if given. Returns 1 if the image contains Poisson spot
+    markers, 0 if not and -1 if a pixel can not be packed.
+    */
+    int has_marker = 0;
+
+    for (int y=0; y<y_dim; y++)
+    {
+        const unsigned char *row = array + y*64;
+        uint64_t mask = 0;
+
+        for (int i=0; i<PACKED_ROW_SIZE; i++)
+        {
+            unsigned char byte = 0;
+            for (int j=0; j<4; j++)
+            {
+                unsigned char level = row[4*i+j];
+                if (level == POISSON_SPOT_MARKER)
+                {
+                    mask |= 1ULL << (4*i+j);
+                    continue;
+                }
+                if (level > 3)
+                    return -1;
+                byte |= level << (2*j);
+            }
+            packed[y*PACKED_ROW_SIZE+i] = byte;
+        }
+        if (mask)
+            has_marker = 1;
+        if (poisson_mask != NULL)
+            poisson_mask[y] = mask;
+    }
+    return has_marker;
+}
+
+
+
+void
+unpack_pixels(const unsigned char *packed, const uint64_t *poisson_mask, int y_dim, unsigned char *array)
+{
+    /*
+    Restores the image of pack_pixels(). The mask is optional.
+    */
+    for (int y=0; y<y_dim; y++)
+    {
+        unsigned char *row = array + y*64;
+        for (int i=0; i<PACKED_ROW_SIZE; i++)
+            memcpy(row + 4*i, PACKED_PIXELS[packed[y*PACKED_ROW_SIZE+i]], 4);
+
+        uint64_t mask = (poisson_mask != NULL) ? poisson_mask[y] : 0;
+        while (mask)
+        {
+            row[trailing_zeros64(mask)] = POISSON_SPOT_MARKER;
+            mask &= mask - 1;
+        }
+    }
+}
@@ -0,0 +1,173 @@
+/*
+Native storage of decoded particles.
+
+The decoder writes particle records and particle images into a batch
+without touching any Python objects. The batch is converted into
+OpticalArray objects afterwards (see processing.h).
+
+The layout of the particle record is mirrored by oap.core.PARTICLE_DTYPE.
+*/
+
+
+
+typedef struct {
+    unsigned int second;
+    unsigned short number;
+    unsigned short millisecond;
+    unsigned short microsecond;
+    unsigned short pixel_one;
+    unsigned short pixel_two;
+    unsigned short pixel_thr;
+    unsigned char y_dim;
+    unsigned char x_bary;
+    unsigned char y_bary;
+    unsigned char min_idx;
+    unsigned char max_idx;
+    unsigned char poisson;
+    unsigned char poisson_mono;
+    unsigned char truncated;
+    unsigned char cluster;
+    float hit_ratio;
+    float axis_ratio;
+    float alpha;
+    float column;
+    float rosette;
+} ParticleRecord;
+
+typedef struct {
+    ParticleRecord *records;
+    size_t n_records;
+    size_t records_capacity;
+
+    // Particle images of all records in consecutive order.
+    unsigned char *pixels;
+    size_t n_pixels;
+    size_t pixels_capacity;
+
+    /*
+    Number of particles, biterrors in the particle header,
+    zero pixel images and truncated particle images.
+    */
+    unsigned int particle_counter;
+    unsigned int biterror_counter;
+    unsigned int zropxels_counter;
+    unsigned int trncated_counter;
+
+    // Records and images are only stored, if they are materialized afterwards.
+    bool store;
+    bool store_images;
+
+    // Set, if the memory for the batch could not be allocated.
+    bool memory_error;
+} ParticleBatch;
+
+
+
+void
+init_particle_batch(ParticleBatch *batch)
+{
+    memset(batch, 0, sizeof(ParticleBatch));
+}
+
+
+
+void
+clear_particle_batch(ParticleBatch *batch)
+{
+    /*
+    Removes all records, but keeps the allocated memory
+    for the next buffers.
+    */
+    batch->n_records = 0;
+    batch->n_pixels = 0;
+}
+
+
+
+void
+free_particle_batch(ParticleBatch *batch)
+{
+    free(batch->records);
+    free(batch->pixels);
+    init_particle_batch(batch);
+}
+
+
+
+bool
+reserve_memory(void **memory, size_t *capacity, size_t required, size_t item_size)
+{
+    /*
+    Grows a memory block geometrically until it holds the required number of items.
+    */
+    if (required <= *capacity)
+        return true;
+
+    size_t new_capacity = *capacity ? *capacity : 64;
+    while (new_capacity < required)
+        new_capacity *= 2;
+
+    void *new_memory = realloc(*memory, new_capacity * item_size);
+    if (new_memory == NULL)
+        return false;
+
+    *memory = new_memory;
+    *capacity = new_capacity;
+    return true;
+}
+
+
+
+ParticleRecord *
+append_particle(ParticleBatch *batch, const unsigned char *particle_array, int img_height)
+{
+    /*
+    Appends a new record to the batch and copies the particle image, if
+    an image is given. Returns NULL if the memory could not be allocated.
+    */
+    if (! reserve_memory((void**) &batch->records, &batch->records_capacity,
+                         batch->n_records+1, sizeof(ParticleRecord)))
+    {
+        batch->memory_error = true;
+        return NULL;
+    }
+    if (particle_array != NULL)
+    {
+        size_t image_size = img_height * 64;
+        if (! reserve_memory((void**) &batch->pixels, &batch->pixels_capacity,
+                             batch->n_pixels+image_size, sizeof(unsigned char)))
+        {
+            batch->memory_error = true;
+            return NULL;
+        }
+        memcpy(batch->pixels+batch->n_pixels, particle_array, image_size);
+        batch->n_pixels += image_size;
+    }
+    return &batch->records[batch->n_records++];
+}
+
+
+
+bool
+merge_particle_batch(ParticleBatch *target, const ParticleBatch *source)
+{
+    /*
+    Appends the records and the particle images of the source batch, so
+    that the images of all batches are stored in one contiguous block.
+    */
+    if (! reserve_memory((void**) &target->records, &target->records_capacity,
+                         target->n_records+source->n_records, sizeof(ParticleRecord))
+        || ! reserve_memory((void**) &target->pixels, &target->pixels_capacity,
+                            target->n_pixels+source->n_pixels, sizeof(unsigned char)))
+    {
+        target->memory_error = true;
+        return false;
+    }
+    if (source->n_records)
+        memcpy(target->records+target->n_records, source->records, source->n_records * sizeof(ParticleRecord));
+    if (source->n_pixels)
+        memcpy(target->pixels+target->n_pixels, source->pixels, source->n_pixels);
+    target->n_records += source->n_records;
+    target->n_pixels += source->n_pixels;
+    return true;
+}
@@ -1,108 +1,155 @@
 /*
 Poisson spot labeling and evaluation.
+
+The spot is filled with a scanline fill and an explicit stack, which is
+limited to the bounding box of the particle. The closure of the circle
+around the spot and the spot size are determined while filling.
 */
 
 const unsigned char POISSON_SPOT_MARKER = 7;
 
 
 
-void
-poisson_spot(unsigned char *array, int x, int y, int y_dim, int x_min, int x_max)
+typedef struct {
+    short y;
+    short left;
+    short right;
+} PoissonSpan;
+
+
+
+size_t
+poisson_scratch_size(int y_dim)
 {
     /*
-    Checks if the value for index (x,y) is zero. If true, the pixel
-    gets marked with a PoissonSpot marker.
+    Bytes of scratch memory, which are needed by poisson_spot().
+    Every filled span seeds at most one pixel per two columns in both
+    neighbouring rows, so the stack never exceeds twice the number of
+    pixels. The spans are limited by the number of pixels.
     */
+    size_t pixels = y_dim * 64;
+    return scratch_aligned(pixels * sizeof(PoissonSpan)) + scratch_aligned((2*pixels+1) * sizeof(PoissonSpan));
+}
 
-    if (x >= x_min && x <= x_max && y >= 0 && y < y_dim)
-    {
-        if (array[y*64+x] == 0)
-        {
-            array[y*64+x] = POISSON_SPOT_MARKER;
-            poisson_spot(array, x, y+1, y_dim, x_min, x_max);
-            poisson_spot(array, x, y-1, y_dim, x_min, x_max);
-            poisson_spot(array, x+1, y, y_dim, x_min, x_max);
-            poisson_spot(array, x-1, y, y_dim, x_min, x_max);
-        }
-    }
-    return;
+
+
+static inline double
+sum_of_squares(int n)
+{
+    // 0*0 + 1*1 + ... + n*n
+    return n * (n+1.0) * (2.0*n+1.0) / 6.0;
 }
 
 
 
-void
-evaluate_poisson_spot(unsigned char *array, int img_height, int min_index, int max_index, int *poisson_size)
+int
+poisson_spot(unsigned char *array, int x, int y, int y_dim, int x_min, int x_max, ImageMoments *moments,
+             ScratchArena *arena)
 {
     /*
-    Measures the sizes of labeled Poisson Spots. If the Poisson Spot is not a closed
-    circle the Poisson Spot markers will be deleted.
-    The Poisson size is positive if there is a Poisson Spot with a closed circle.
+    Marks the zero pixels, which are 4-connected with the pixel (x,y)
+    within the bounding box, with the Poisson Spot marker.
+
+    Returns the size of the Poisson Spot (its width), if the spot is
+    surrounded by a closed circle. Otherwise the markers are removed
+    and the size is zero. The markers of a closed spot are added to the
+    moments, if given. Returns -1 if the arena is too small for the
+    scratch memory (see poisson_scratch_size).
     */
+    if (x < x_min || x > x_max || y < 0 || y >= y_dim || array[y*64+x] != 0)
+        return 0;
+
+    size_t mark = scratch_mark(arena);
+    size_t pixels = y_dim * 64;
+    PoissonSpan *spans = (PoissonSpan*) scratch_alloc(arena, pixels * sizeof(PoissonSpan));
+    PoissonSpan *stack = (PoissonSpan*) scratch_alloc(arena, (2*pixels+1) * sizeof(PoissonSpan));
+    size_t n_spans = 0;
+    size_t n_seeds = 0;
+
+    if (spans == NULL || stack == NULL)
+    {
+        scratch_release(arena, mark);
+        return -1;
+    }
 
     int min_poisson = 63;
     int max_poisson = 0;
-
     bool closed_circle = true;
-    bool contains_poisson_spot = false;
 
-    /*
-    Find the minimum and maximum of the Poisson Spot
-    to calculate the sizes of both spots.
-    */
-    for (int i=0; i<img_height; i++)
+    stack[n_seeds++] = (PoissonSpan) {y, x, x};
+
+    while (n_seeds)
     {
-        for (int j=0; j<64; j++)
-        {
-            if (array[i*64+j] == POISSON_SPOT_MARKER)
-            {
-                contains_poisson_spot = true;
-                if (min_poisson > j) min_poisson = j;
-                if (max_poisson < j) max_poisson = j;
-            }
-        }
-    }
+        PoissonSpan seed = stack[--n_seeds];
+        unsigned char *row = array + seed.y*64;
 
-    if (max_poisson >= min_poisson)
-        *poisson_size = max_poisson-min_poisson+1;
+        if (row[seed.left] != 0)
+            continue;
 
-    /*
-    Check if the Poisson Spots are closed circles. Otherwise it is not
-    possible to measure the size of the spots.
-    */
-    for (int x=0; x<64; x++)
-    {
-        if (array[x] == POISSON_SPOT_MARKER || array[(img_height-1)*64+x] == POISSON_SPOT_MARKER)
-        {
+        // --- Fill the whole run of zero pixels -----------------------------------------------------------------------
+        int left = seed.left;
+        int right = seed.left;
+        while (left > x_min && row[left-1] == 0)
+            left--;
+        while (right < x_max && row[right+1] == 0)
+            right++;
+
+        spans[n_spans++] = (PoissonSpan) {seed.y, left, right};
+        memset(row+left, POISSON_SPOT_MARKER, right-left+1);
+
+        if (min_poisson > left) min_poisson = left;
+        if (max_poisson < right) max_poisson = right;
+
+        // The spot is not closed, if it touches the bounding box.
+        if (seed.y == 0 || seed.y == y_dim-1 || left == x_min || right == x_max)
             closed_circle = false;
-        }
-    }
-    for (int y=0; y<img_height; y++)
-    {
-        if (array[y*64+min_index] == POISSON_SPOT_MARKER || array[y*64+max_index] == POISSON_SPOT_MARKER)
+
+        // --- Seed one pixel of every run of zeros in the neighbouring rows -------------------------------------------
+        for (int next_y=seed.y-1; next_y<=seed.y+1; next_y+=2)
         {
-            closed_circle = false;
+            if (next_y < 0 || next_y >= y_dim)
+                continue;
+
+            const unsigned char *next_row = array + next_y*64;
+            for (int next_x=left; next_x<=right; next_x++)
+            {
+                if (next_row[next_x] != 0 || (next_x > left && next_row[next_x-1] == 0))
+                    continue;
+                stack[n_seeds++] = (PoissonSpan) {next_y, next_x, next_x};
+            }
         }
     }
 
     /*
-    If there is no closes Poisson Spot it's not possible to measure
+    If there is no closed Poisson Spot it's not possible to measure
     the spot size. Therefore the particle array will be cleaned of the
     Poisson Spot markers.
     */
-    if (contains_poisson_spot && ! closed_circle) {
+    int poisson_size = 0;
 
-        // Reset the size of the PoissonSpot.
-        *poisson_size = 0;
+    for (size_t i=0; i<n_spans; i++)
+    {
+        const PoissonSpan *span = &spans[i];
+        int length = span->right - span->left + 1;
 
-        for (int i=0; i<img_height; i++)
+        if (! closed_circle)
         {
-            for (int j=0; j<64; j++)
-            {
-                if (array[i*64+j] == POISSON_SPOT_MARKER)
-                {
-                    array[i*64+j] = 0;
-                }
-            }
+            memset(array + span->y*64 + span->left, 0, length);
+        }
+        else if (moments != NULL)
+        {
+            double sum_x = (span->left + span->right) * length / 2.0;
+            moments->number_of_pixels += length;
+            moments->sum_x += sum_x;
+            moments->sum_y += span->y * length;
+            moments->sum_xx += sum_of_squares(span->right) - sum_of_squares(span->left-1);
+            moments->sum_yy += span->y * span->y * length;
+            moments->sum_xy += span->y * sum_x;
         }
     }
+    if (closed_circle)
+        poisson_size = max_poisson-min_poisson+1;
+
+    scratch_release(arena, mark);
+    return poisson_size;
 }
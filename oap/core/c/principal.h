@@ -21,33 +21,25 @@ mse(unsigned char *array_a, unsigned char *array_b, int array_length)
 void
 principal_components(unsigned char *array,
                      int img_height,
+                     const ImageMoments *moments,
+                     int min_index,
+                     int max_index,
                      double *hit_ratio,
                      double *alpha_value,
                      double *axis_ratio,
                      double *mse_ellipse)
 {
-    double sum_x = 0.0;
-    double sum_y = 0.0;
-    double sum_xx = 0.0;
-    double sum_yy = 0.0;
-    double sum_xy = 0.0;
-    double number_pix = 0.0;
-
-    for (int y=0; y<img_height; y++)
-    {
-        for (int x=0; x<64; x++)
-        {
-            if (array[y*64+x] != 0)
-            {
-                sum_x += x;
-                sum_y += y;
-                sum_xx += x*x;
-                sum_yy += y*y;
-                sum_xy += x*y;
-                number_pix += 1;
-            }
-        }
-    }
+    /*
+    Calculates the principal components from the moments of the non-zero
+    pixels. The particle image is only needed for the ellipse hit ratio,
+    which is restricted to the bounding box of the particle and the ellipse.
+    */
+    double sum_x = moments->sum_x;
+    double sum_y = moments->sum_y;
+    double sum_xx = moments->sum_xx;
+    double sum_yy = moments->sum_yy;
+    double sum_xy = moments->sum_xy;
+    double number_pix = moments->number_of_pixels;
 
     if (number_pix == 0)
         return;
@@ -130,15 +122,38 @@ principal_components(unsigned char *array,
     double b = minor_axis * minor_axis;
     double a = major_axis * major_axis;
 
-    int polygon_hits = 0;
     int ellipse_hits = 0;
-    int polygon_misses = 0;
     int ellipse_misses = 0;
 
-    unsigned char *ellipse_array;
-    ellipse_array = (unsigned char*) calloc(img_height*64, sizeof(unsigned char));
-    unsigned char *one_color_array;
-    one_color_array = (unsigned char*) calloc(img_height*64, sizeof(unsigned char));
+    /*
+    Pixels outside the particle and outside the ellipse neither hit nor
+    miss. The columns are limited to the particle and the extent of the
+    ellipse (with a margin of one pixel), if no full mask is needed.
+    */
+    int x_first = 0;
+    int x_last = 63;
+
+    if (mse_ellipse == NULL)
+    {
+        double half_width = sqrt(a * cos_alpha * cos_alpha + b * sin_alpha * sin_alpha);
+        if (half_width < 64)
+        {
+            int ellipse_first = (int) floor(x_bary - half_width) - 1;
+            int ellipse_last = (int) ceil(x_bary + half_width) + 1;
+            x_first = min_index < ellipse_first ? min_index : ellipse_first;
+            x_last = max_index > ellipse_last ? max_index : ellipse_last;
+            if (x_first < 0) x_first = 0;
+            if (x_last > 63) x_last = 63;
+        }
+    }
+
+    unsigned char *ellipse_array = NULL;
+    unsigned char *one_color_array = NULL;
+    if (mse_ellipse != NULL)
+    {
+        ellipse_array = (unsigned char*) calloc(img_height*64, sizeof(unsigned char));
+        one_color_array = (unsigned char*) calloc(img_height*64, sizeof(unsigned char));
+    }
 
     bool intersect_ellipse;
     double denom_x;
@@ -146,7 +161,7 @@ principal_components(unsigned char *array,
 
     for (int y=0; y<img_height; y++)
     {
-        for (int x=0; x<64; x++)
+        for (int x=x_first; x<=x_last; x++)
         {
             denom_x = cos_alpha * (x - x_bary) + sin_alpha * (y - y_bary);
             denom_y = sin_alpha * (x - x_bary) - cos_alpha * (y - y_bary);
@@ -178,8 +193,9 @@ principal_components(unsigned char *array,
     *axis_ratio = major_axis / minor_axis;
 
     if (mse_ellipse != NULL)
+    {
         *mse_ellipse = mse(one_color_array, ellipse_array, img_height*64);
-
-    free(ellipse_array);
-    free(one_color_array);
+        free(ellipse_array);
+        free(one_color_array);
+    }
 }
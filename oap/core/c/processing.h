@@ -3,31 +3,48 @@ Process the decompressed particle array.
 All analyses and outputs of the particle image are defined here.
 */
 
+size_t
+particle_scratch_size(void)
+{
+    /*
+    Bytes of scratch memory for the largest possible particle (255 slices):
+    the particle image, the cluster labels and the Poisson spot fill.
+    */
+    return scratch_aligned(255 * 64)
+         + scratch_aligned(cluster_scratch_size(255, 0, 63) * sizeof(int))
+         + poisson_scratch_size(255);
+}
+
+
+
 void
 process_particle_array(unsigned char *particle_array,
                        int slice_size,
                        int img_height,
                        int particle_width,
-                       int particle_number,
-                       int second_of_day,
-                       int millisecond,
-                       int microsecond,
-                       int nanosecond,
-                       int counter_1_pixels,
-                       int counter_2_pixels,
-                       int counter_3_pixels,
                        int number_of_pixels,
-                       int min_index,
-                       int max_index,
-                       int x_bary,
-                       int y_bary,
-                       int particle_truncated,
+                       ImageMoments *moments,
+                       ParticleRecord *particle,
                        int poisson,
                        int cluster,
                        int principal,
-                       PyObject *arrays_list,
-                       PyObject *images_list)
+                       ParticleBatch *batch,
+                       ScratchArena *arena)
 {
+    /*
+    Analyses the particle image and appends the particle to the batch. The
+    record must already contain the particle header and the pixel counts.
+    The moments of the shadowed pixels are calculated here, if the decoder
+    does not provide them (NULL). Temporary memory is taken from the arena,
+    which must provide particle_scratch_size() bytes. This function does not
+    touch any Python objects.
+    */
+    ImageMoments particle_moments;
+    if (moments == NULL && principal)
+    {
+        image_moments(particle_array, img_height, &particle_moments);
+        moments = &particle_moments;
+    }
 
     // --- Poisson spot detection --------------------------------------------------------------------------------------
 
@@ -37,10 +54,14 @@ process_particle_array(unsigned char *particle_array,
 
     if (poisson && img_height >= 3 && particle_width >= 3 && number_of_pixels >= 4)
     {
-        poisson_spot(particle_array, x_bary, y_bary, img_height, min_index, max_index);
-        // Measure the Poisson Spot size and remove marker, if the circle
-        // around the spot is not closed.
-        evaluate_poisson_spot(particle_array, img_height, min_index, max_index, &poisson_size);
+        poisson_size = poisson_spot(particle_array, particle->x_bary, particle->y_bary, img_height,
+                                    particle->min_idx, particle->max_idx, moments, arena);
+        if (poisson_size < 0)
+        {
+            poisson_size = 0;
+            if (batch != NULL)
+                batch->memory_error = true;
+        }
     }
 
 
@@ -52,7 +73,8 @@ process_particle_array(unsigned char *particle_array,
 
     if (principal)
     {
-        principal_components(particle_array, img_height, &hit_ratio, &alpha_value, &axis_ratio, NULL);
+        principal_components(particle_array, img_height, moments, particle->min_idx, particle->max_idx,
+                             &hit_ratio, &alpha_value, &axis_ratio, NULL);
     }
 
 
@@ -62,69 +84,87 @@ process_particle_array(unsigned char *particle_array,
 
     if (cluster)
     {
-        // This algorithm colors the particle image therefore
-        // a copy of the particle array must be made.
-        unsigned char *particle_array_copy;
-        particle_array_copy = (unsigned char*) malloc((img_height*slice_size) * sizeof(unsigned char));
-        memcpy(particle_array_copy, particle_array, img_height*slice_size);
-        number_of_particle_cluster = particle_cluster(particle_array_copy, img_height, min_index, max_index);
-        free(particle_array_copy);
+        number_of_particle_cluster = particle_cluster(particle_array, img_height,
+                                                      particle->min_idx, particle->max_idx, arena);
+        if (number_of_particle_cluster < 0)
+        {
+            number_of_particle_cluster = 0;
+            if (batch != NULL)
+                batch->memory_error = true;
+        }
     }
 
 
 
-    // --- Append particle image to list -------------------------------------------------------------------------------
-    if (PyList_Check(images_list))
+    // --- Append particle to batch ------------------------------------------------------------------------------------
+    particle->poisson = poisson_size;
+    particle->cluster = number_of_particle_cluster;
+    particle->hit_ratio = hit_ratio;
+    particle->axis_ratio = axis_ratio;
+    particle->alpha = alpha_value;
+
+    if (batch != NULL && batch->store)
     {
-        PyObject *particle_as_list = PyList_New(0);
-        for (int y=0; y<img_height; y++)
-        {
-            for (int x=0; x<64; x++)
-            {
-                PyList_Append(particle_as_list, PyLong_FromLong(particle_array[y*64+x]));
-            }
-        }
-        PyList_Append(images_list, particle_as_list);
-        Py_DECREF(particle_as_list);
+        ParticleRecord *record = append_particle(batch, batch->store_images ? particle_array : NULL, img_height);
+        if (record != NULL)
+            *record = *particle;
     }
+}
 
 
 
-    // --- Init OpticalArray -------------------------------------------------------------------------------------------
-    if (PyList_Check(arrays_list))
+int
+materialize_particle_batch(const ParticleBatch *batch, PyObject *base, bool packed,
+                           PyObject *arrays_list, PyObject *images_list)
+{
+    /*
+    Creates the Python objects of all particles in a batch. The particles
+    are appended to the arrays list (OpticalArray objects) and to the
+    images list (particle images as list of integers). If base owns the
+    pixels of the batch, the OpticalArray objects are views into them.
+    Packed OpticalArray objects own their packed particle images.
+    Returns -1 if an exception was raised.
+    */
+    const unsigned char *particle_array = batch->pixels;
+
+    for (size_t i=0; i<batch->n_records; i++)
     {
-        OpticalArrayObject *optical_array;
-        optical_array = (OpticalArrayObject *) OpticalArrayType.tp_alloc(&OpticalArrayType, 0);
-
-
-        unsigned char *buffer;
-        buffer = (unsigned char*) malloc((img_height*slice_size) * sizeof(unsigned char));
-        memcpy(buffer, particle_array, img_height*slice_size);
-        optical_array->array = buffer;
-        // free(buffer);
-
-
-        optical_array->second = second_of_day;
-        optical_array->number = particle_number;
-        optical_array->millisecond = millisecond;
-        optical_array->microsecond = microsecond;
-        optical_array->y_dim = img_height;
-        optical_array->x_bary = x_bary;
-        optical_array->y_bary = y_bary;
-        optical_array->min_idx = min_index;
-        optical_array->max_idx = max_index;
-        optical_array->pixel_one = counter_1_pixels;
-        optical_array->pixel_two = counter_2_pixels;
-        optical_array->pixel_thr = counter_3_pixels;
-        optical_array->poisson = poisson_size;
-        //optical_array->poisson_mono = 0;
-        optical_array->truncated = particle_truncated;
-        optical_array->cluster = number_of_particle_cluster;
-        optical_array->hit_ratio = hit_ratio;
-        optical_array->axis_ratio = axis_ratio;
-        optical_array->alpha = alpha_value;
-
-        PyList_Append(arrays_list, (PyObject *) optical_array);
-        Py_DECREF(optical_array);
+        const ParticleRecord *particle = &batch->records[i];
+        Py_ssize_t image_size = particle->y_dim * 64;
+
+        // --- Append particle image to list ---------------------------------------------------------------------------
+        if (PyList_Check(images_list))
+        {
+            PyObject *particle_as_list = PyList_New(image_size);
+            if (particle_as_list == NULL)
+                return -1;
+            for (Py_ssize_t j=0; j<image_size; j++)
+                PyList_SET_ITEM(particle_as_list, j, PyLong_FromLong(particle_array[j]));
+
+            int result = PyList_Append(images_list, particle_as_list);
+            Py_DECREF(particle_as_list);
+            if (result < 0)
+                return -1;
+        }
+
+        // --- Init OpticalArray ---------------------------------------------------------------------------------------
+        if (PyList_Check(arrays_list))
+        {
+            OpticalArrayObject *optical_array = OpticalArray_from_record(particle, particle_array, base);
+            if (optical_array == NULL)
+                return -1;
+            if (packed && OpticalArray_pack_pixels(optical_array) < 0)
+            {
+                Py_DECREF(optical_array);
+                return -1;
+            }
+
+            int result = PyList_Append(arrays_list, (PyObject *) optical_array);
+            Py_DECREF(optical_array);
+            if (result < 0)
+                return -1;
+        }
+        particle_array += image_size;
     }
+    return 0;
 }
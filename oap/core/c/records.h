@@ -0,0 +1,126 @@
+/*
+Conversion between OpticalArray objects and native particle records.
+
+The records and the concatenated particle images can be passed between
+processes or stored in files without pickling every single object.
+*/
+
+
+
+static PyObject *
+arrays_to_records(PyObject *module, PyObject *args, PyObject *kwargs)
+{
+    /*
+    Returns the particle records and the concatenated particle images
+    of a list of OpticalArray objects as a tuple of two bytes objects.
+    The particle images are empty, if images is False.
+    */
+    PyObject *arrays;
+    int images = 1;
+    static char *kwlist[] = {"arrays", "images", NULL};
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|p", kwlist, &arrays, &images))
+        return NULL;
+
+    PyObject *sequence = PySequence_Fast(arrays, "arrays must be a sequence of OpticalArray objects");
+    if (sequence == NULL)
+        return NULL;
+
+    Py_ssize_t n_arrays = PySequence_Fast_GET_SIZE(sequence);
+    PyObject **items = PySequence_Fast_ITEMS(sequence);
+    Py_ssize_t n_pixels = 0;
+
+    for (Py_ssize_t i=0; i<n_arrays; i++)
+    {
+        if (! PyObject_TypeCheck(items[i], &OpticalArrayType))
+        {
+            Py_DECREF(sequence);
+            PyErr_SetString(PyExc_TypeError, "arrays must be a sequence of OpticalArray objects");
+            return NULL;
+        }
+        if (images)
+            n_pixels += ((OpticalArrayObject *) items[i])->y_dim * 64;
+    }
+
+    PyObject *records = PyBytes_FromStringAndSize(NULL, n_arrays * sizeof(ParticleRecord));
+    PyObject *pixels = PyBytes_FromStringAndSize(NULL, n_pixels);
+    if (records == NULL || pixels == NULL)
+    {
+        Py_XDECREF(records);
+        Py_XDECREF(pixels);
+        Py_DECREF(sequence);
+        return NULL;
+    }
+
+    ParticleRecord *record = (ParticleRecord *) PyBytes_AS_STRING(records);
+    unsigned char *particle_array = (unsigned char *) PyBytes_AS_STRING(pixels);
+
+    for (Py_ssize_t i=0; i<n_arrays; i++)
+    {
+        OpticalArrayObject *optical_array = (OpticalArrayObject *) items[i];
+        OpticalArray_to_record(optical_array, &record[i]);
+        if (images)
+        {
+            OpticalArray_copy_pixels(optical_array, particle_array);
+            particle_array += optical_array->y_dim * 64;
+        }
+    }
+    Py_DECREF(sequence);
+
+    PyObject *result = PyTuple_Pack(2, records, pixels);
+    Py_DECREF(records);
+    Py_DECREF(pixels);
+    return result;
+}
+
+
+
+static PyObject *
+records_to_arrays(PyObject *module, PyObject *args, PyObject *kwargs)
+{
+    /*
+    Creates a list of OpticalArray objects from particle records and the
+    concatenated particle images. Both arguments can be any object which
+    supports the buffer protocol (bytes, memoryview, NumPy arrays, ...).
+    */
+    Py_buffer records;
+    Py_buffer pixels;
+    static char *kwlist[] = {"records", "pixels", NULL};
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "y*y*", kwlist, &records, &pixels))
+        return NULL;
+
+    PyObject *arrays_list = NULL;
+
+    if (records.len % sizeof(ParticleRecord))
+    {
+        PyErr_SetString(PyExc_ValueError, "size of records is not a multiple of the record size");
+        goto release;
+    }
+
+    ParticleBatch batch;
+    init_particle_batch(&batch);
+    batch.records = (ParticleRecord *) records.buf;
+    batch.n_records = records.len / sizeof(ParticleRecord);
+    batch.pixels = (unsigned char *) pixels.buf;
+    batch.n_pixels = pixels.len;
+
+    size_t n_pixels = 0;
+    for (size_t i=0; i<batch.n_records; i++)
+        n_pixels += batch.records[i].y_dim * 64;
+
+    if (n_pixels > batch.n_pixels)
+    {
+        PyErr_SetString(PyExc_ValueError, "pixels are smaller than the particle images of the records");
+        goto release;
+    }
+
+    arrays_list = PyList_New(0);
+    if (arrays_list != NULL && materialize_particle_batch(&batch, NULL, false, arrays_list, Py_None) < 0)
+        Py_CLEAR(arrays_list);
+
+release:
+    PyBuffer_Release(&records);
+    PyBuffer_Release(&pixels);
+    return arrays_list;
+}
@@ -0,0 +1,87 @@
+/*
+Input tensors of the particle classifiers.
+
+The centred 64x64 tensors of many particles are written directly into
+a preallocated float32 array, instead of creating a list of 4096 Python
+floats for every particle (see OpticalArray.tensor).
+*/
+
+
+
+static PyObject *
+tensors(PyObject *module, PyObject *args, PyObject *kwargs)
+{
+    /*
+    Writes the tensors of a sequence of OpticalArray objects into out,
+    which must be a writable, C-contiguous float32 buffer with at least
+    len(arrays) * 64 * 64 items, e.g. a NumPy array of shape (N, 64, 64, 1).
+    */
+    PyObject *arrays;
+    PyObject *out;
+    static char *kwlist[] = {"arrays", "out", NULL};
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "OO", kwlist, &arrays, &out))
+        return NULL;
+
+    PyObject *sequence = PySequence_Fast(arrays, "arrays must be a sequence of OpticalArray objects");
+    if (sequence == NULL)
+        return NULL;
+
+    Py_ssize_t n_arrays = PySequence_Fast_GET_SIZE(sequence);
+    PyObject **items = PySequence_Fast_ITEMS(sequence);
+
+    for (Py_ssize_t i=0; i<n_arrays; i++)
+    {
+        if (! PyObject_TypeCheck(items[i], &OpticalArrayType))
+        {
+            Py_DECREF(sequence);
+            PyErr_SetString(PyExc_TypeError, "arrays must be a sequence of OpticalArray objects");
+            return NULL;
+        }
+    }
+
+    Py_buffer buffer;
+    if (PyObject_GetBuffer(out, &buffer, PyBUF_WRITABLE | PyBUF_FORMAT | PyBUF_C_CONTIGUOUS) < 0)
+    {
+        Py_DECREF(sequence);
+        return NULL;
+    }
+
+    PyObject *result = NULL;
+
+    if (buffer.itemsize != sizeof(float) || buffer.format == NULL || strcmp(buffer.format, "f") != 0)
+    {
+        PyErr_SetString(PyExc_TypeError, "out must be a float32 buffer");
+        goto release;
+    }
+    if (buffer.len < n_arrays * 64 * 64 * (Py_ssize_t) sizeof(float))
+    {
+        PyErr_SetString(PyExc_ValueError, "out is smaller than len(arrays) * 64 * 64 items");
+        goto release;
+    }
+
+    float *tensor = (float*) buffer.buf;
+    memset(tensor, 0, n_arrays * 64 * 64 * sizeof(float));
+
+    for (Py_ssize_t i=0; i<n_arrays; i++)
+    {
+        OpticalArrayObject *optical_array = (OpticalArrayObject *) items[i];
+
+        unsigned char *unpacked;
+        const unsigned char *array = OpticalArray_pixels(optical_array, &unpacked);
+        if (array == NULL && optical_array->packed)
+            goto release;
+
+        particle_tensor(array, optical_array->y_dim, optical_array->x_bary, optical_array->y_bary, tensor);
+        free(unpacked);
+        tensor += 64 * 64;
+    }
+
+    result = Py_None;
+    Py_INCREF(result);
+
+release:
+    PyBuffer_Release(&buffer);
+    Py_DECREF(sequence);
+    return result;
+}
@@ -2,10 +2,34 @@
 Utility methods for the core library.
 */
 
+#ifdef _WIN32
+#include <windows.h>
+#else
+#include <unistd.h>
+#endif
+
+
+
+int
+cpu_count(void)
+{
+    /*
+    Number of online processors, at least 1.
+    */
+#ifdef _WIN32
+    SYSTEM_INFO info;
+    GetSystemInfo(&info);
+    return (info.dwNumberOfProcessors > 0) ? (int) info.dwNumberOfProcessors : 1;
+#else
+    long count = sysconf(_SC_NPROCESSORS_ONLN);
+    return (count > 0) ? (int) count : 1;
+#endif
+}
+
 
 
 int
-count_grayscale_bits(unsigned char *data)
+count_grayscale_bits(const unsigned char *data)
 {
     /*
     Counts the number of decompressed BITs in a compressed
@@ -29,7 +53,7 @@ count_grayscale_bits(unsigned char *data)
 
 
 int
-count_monoscale_bytes(unsigned char *data)
+count_monoscale_bytes(const unsigned char *data)
 {
     /*
     Counts the number of decompressed BYTEs in a compressed
@@ -62,97 +86,6 @@ count_monoscale_bytes(unsigned char *data)
 
 
 
-int
-bin_to_dec(unsigned char *bin, int length)
-{
-    /*
-    Fast method to convert a binary value to
-    an integer value.
-
-    The binary order is reversed:
-
-    unsigned char bin[3] = {0,0,1};
-    bin_to_dec(bin, 3); // Result: 4
-    */
-    int dec = 0;
-    for (int i=0; i<length; i++)
-    {
-        if (bin[i])
-        {
-            dec |= (1 << (i));
-        }
-    }
-    return dec;
-}
-
-
-
-bool
-check_if_value_is_in_list(long value, PyObject *list)
-{
-    /*
-    Method to check if a value lies in a Python list object.
-
-    Just like the Python code: (value in list)
-    */
-
-    // If there is no valid list return true.
-    if (! PyList_Check(list))
-        return true;
-
-    Py_ssize_t list_size = PyList_Size(list);
-    bool value_in_list = false;
-
-    for (int i=0; i<list_size; i++)
-    {
-        long list_element = PyLong_AsLong(PyList_GetItem(list, i));
-
-        if (value == list_element)
-        {
-            value_in_list = true;
-        }
-    }
-    return value_in_list;
-}
-
-
-
-bool
-check_if_value_is_in_boundaries(long value, PyObject *tuples)
-{
-    /*
-    Method to check if a value lies in specific boundaries.
-    */
-
-    if (! PyList_Check(tuples))
-        return true;
-
-    if (! PyList_Size(tuples))
-        return true;
-
-    Py_ssize_t number_of_tuples = PyList_Size(tuples);
-    bool value_in_tuples = false;
-
-    for (int i=0; i<number_of_tuples; i++)
-    {
-        PyObject * tuple = PyList_GetItem(tuples, i);   // ToDo: Py_DECREF tuple?
-
-        if (PyTuple_Check(tuple))
-        {
-            long min_boundary = PyLong_AsLong(PyTuple_GetItem(tuple, 0));
-            long max_boundary = PyLong_AsLong(PyTuple_GetItem(tuple, 1));
-
-            if (value >= min_boundary && value <= max_boundary)
-            {
-                value_in_tuples = true;
-            }
-        }
-    }
-    return value_in_tuples;
-}
-
-
-
 void
 print_array(unsigned char *array, int number_of_slices, int slice_size)
 {
@@ -184,3 +117,50 @@ void progress_bar(int iteration, int total, int length, char *prefix, char *suff
     if (iteration == total)
         printf("\n");
 }
+
+
+
+/*
+Raw moments of the shadowed pixels of a particle image.
+*/
+typedef struct {
+    double number_of_pixels;
+    double sum_x;
+    double sum_y;
+    double sum_xx;
+    double sum_yy;
+    double sum_xy;
+} ImageMoments;
+
+
+
+static inline void
+add_pixel_to_moments(ImageMoments *moments, int x, int y)
+{
+    moments->number_of_pixels += 1;
+    moments->sum_x += x;
+    moments->sum_y += y;
+    moments->sum_xx += x*x;
+    moments->sum_yy += y*y;
+    moments->sum_xy += x*y;
+}
+
+
+
+void
+image_moments(const unsigned char *array, int img_height, ImageMoments *moments)
+{
+    /*
+    Calculates the moments of all non-zero pixels of a particle image.
+    */
+    memset(moments, 0, sizeof(ImageMoments));
+
+    for (int y=0; y<img_height; y++)
+    {
+        for (int x=0; x<64; x++)
+        {
+            if (array[y*64+x] != 0)
+                add_pixel_to_moments(moments, x, y);
+        }
+    }
+}
@@ -0,0 +1,146 @@
+"""
+Decompression of all imagefiles of a measurement campaign in a pool of worker processes.
+
+The workers do not send OpticalArray objects back to the parent process. Instead, the particle records
+and particle images of every imagefile are written into shared memory blocks, which are read by the
+parent process without pickling any particle.
+"""
+
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+from oap.core import PARTICLE_DTYPE, decompress, records_to_arrays
+from oap.lib.imagefile import Imagefile
+
+
+def _decompress_to_shared_memory(filename, kwargs):
+    """
+    Decompresses an imagefile in a worker process and copies the particle records and the
+    particle images into two new shared memory blocks.
+
+    :return:    list of (name, size) tuples of the shared memory blocks
+    """
+    records, pixels, _ = decompress(filename, contiguous=True, **kwargs)
+    blocks = []
+    try:
+        for data in (records, pixels):
+            block = shared_memory.SharedMemory(create=True, size=max(data.nbytes, 1))
+            blocks.append((block.name, data.nbytes))
+            try:
+                block.buf[:data.nbytes] = data.view(np.uint8)
+            finally:
+                block.close()
+    except BaseException:
+        _unlink_shared_memory(blocks)
+        raise
+    return blocks
+
+
+def _recording_date(filename):
+    """
+    Date of the first buffer header of an imagefile as integer (YYYYMMDD).
+    """
+    with open(filename, "rb") as file:
+        header = file.read(6)
+    if len(header) < 6:
+        return 0
+    year, month, day = (int.from_bytes(header[i:i+2], "little") for i in (0, 2, 4))
+    return year * 10000 + month * 100 + day
+
+
+def _read_shared_memory(blocks):
+    """
+    Creates the OpticalArray objects of an imagefile from its shared memory blocks and
+    returns them together with the timestamps of the particles.
+    """
+    (records_name, records_size), (pixels_name, pixels_size) = blocks
+    records_block = shared_memory.SharedMemory(name=records_name)
+    pixels_block = shared_memory.SharedMemory(name=pixels_name)
+    try:
+        arrays = records_to_arrays(records_block.buf[:records_size], pixels_block.buf[:pixels_size])
+        records = np.frombuffer(records_block.buf, dtype=PARTICLE_DTYPE,
+                                count=records_size // PARTICLE_DTYPE.itemsize)
+        timestamps = records[["second", "millisecond", "microsecond"]].copy()
+        del records
+    finally:
+        records_block.close()
+        pixels_block.close()
+    return arrays, timestamps
+
+
+def _unlink_shared_memory(blocks):
+    for name, _ in blocks:
+        try:
+            block = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            continue
+        block.close()
+        block.unlink()
+
+
+def decompress_many(filenames, workers=None, timeframes=None, x_sizes=None, y_sizes=None,
+                    exclude_buffers=None, include_buffers=None,
+                    truncated=True, poisson=True, cluster=True, principal=True, probe="auto"):
+    """
+    Decompresses many imagefiles in a pool of worker processes and merges all
+    particles into one Imagefile object sorted by recording date and time.
+
+    :param filenames:   paths to the imagefiles
+    :type filenames:    list of strings
+
+    --- optional params ---
+    :param workers:     number of worker processes (default is the number of CPUs)
+    :type workers:      integer
+
+    All other keyword arguments are passed to the decompression of every imagefile.
+
+    :return:            Imagefile object containing the particles of all imagefiles
+    """
+    filenames = list(filenames)
+    kwargs = dict(timeframes=timeframes, x_sizes=x_sizes, y_sizes=y_sizes,
+                  exclude_buffers=exclude_buffers, include_buffers=include_buffers,
+                  truncated=truncated, poisson=poisson, cluster=cluster, principal=principal, probe=probe)
+
+    # The resource tracker must be shared with the workers. Otherwise, the shared
+    # memory blocks would be removed as soon as a worker process terminates.
+    resource_tracker.ensure_running()
+
+    results = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_decompress_to_shared_memory, filename, kwargs) for filename in filenames]
+            # Every result is collected before an error is raised, so that the blocks
+            # of all successful workers are unlinked as well.
+            error = None
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except BaseException as exception:
+                    error = error or exception
+            if error is not None:
+                raise error
+
+        arrays = []
+        dates, timestamps = [], []
+        for filename, blocks in zip(filenames, results):
+            file_arrays, file_timestamps = _read_shared_memory(blocks)
+            arrays += file_arrays
+            timestamps.append(file_timestamps)
+            dates.append(np.full(len(file_arrays), _recording_date(filename), dtype=np.uint32))
+    finally:
+        for blocks in results:
+            _unlink_shared_memory(blocks)
+
+    imagefile = Imagefile()
+    imagefile.filename = filenames
+    if arrays:
+        timestamps = np.concatenate(timestamps)
+        order = np.lexsort((timestamps["microsecond"], timestamps["millisecond"],
+                            timestamps["second"], np.concatenate(dates)))
+        imagefile.arrays = [arrays[i] for i in order]
+        imagefile.number_of_particles = len(imagefile.arrays)
+        imagefile.min_time = imagefile.arrays[0].second
+        imagefile.max_time = imagefile.arrays[-1].second
+    return imagefile
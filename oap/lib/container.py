@@ -0,0 +1,181 @@
+"""
+Versioned binary container for decoded particles.
+
+The container stores named columns (NumPy arrays) and a dictionary of attributes. It is
+written sequentially and opened with a memory map, so uncompressed columns are views of the
+file that are only read from disk when they are accessed.
+
+Layout (integers are little endian):
+
+    magic       8 bytes     b"OAPCNTR\\0"
+    version     uint32
+    reserved    uint32
+    columns     raw or compressed column data, every column aligned to 64 bytes
+    directory   UTF-8 JSON with the attributes and the offset, size, dtype, shape
+                and compression of every column
+    trailer     uint64 offset and uint64 size of the directory followed by the magic
+"""
+
+import json
+import mmap
+import os
+import struct
+import uuid
+import zlib
+
+import numpy as np
+
+
+MAGIC = b"OAPCNTR\x00"
+VERSION = 1
+ALIGNMENT = 64
+COMPRESSIONS = (None, "zlib")
+
+_HEADER = struct.Struct("<8sII")
+_TRAILER = struct.Struct("<QQ8s")
+
+
+def is_container(filename):
+    """
+    Returns True, if the file starts with the magic of the container format.
+    """
+    with open(filename, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def write_container(filename, columns, attributes=None, compression=None):
+    """
+    Writes the columns and the attributes sequentially into a new container. The container
+    is written into a temporary file, which replaces the file at the end. So a container can
+    be saved over the file it was opened from. On Windows, a file can not be replaced while
+    it is memory-mapped, so the Container of the file must be closed before.
+
+    :param filename:    path of the container
+    :type filename:     string
+
+    :param columns:     column names and values
+    :type columns:      dict of numpy-arrays
+
+    --- optional params ---
+    :param attributes:  JSON serializable attributes
+    :type attributes:   dict
+
+    :param compression: compression of all columns (None or "zlib") or a dict with the
+                        compression per column name
+    :type compression:  string or dict
+    """
+    directory = {"attributes": attributes or {}, "columns": {}}
+    temporary = f"{filename}.{uuid.uuid4().hex[:8]}.tmp"
+
+    try:
+        with open(temporary, "xb") as file:
+            file.write(_HEADER.pack(MAGIC, VERSION, 0))
+            position = _HEADER.size
+
+            for name, values in columns.items():
+                method = compression.get(name) if isinstance(compression, dict) else compression
+                if method not in COMPRESSIONS:
+                    raise ValueError(f"unknown compression: {method}")
+
+                values = np.ascontiguousarray(values)
+                data = values.data.cast("B") if values.size else b""
+                if method == "zlib":
+                    data = zlib.compress(data)
+
+                padding = -position % ALIGNMENT
+                file.write(bytes(padding))
+                position += padding
+
+                directory["columns"][name] = {"offset": position,
+                                              "size": len(data),
+                                              "dtype": values.dtype.str if not values.dtype.names else
+                                              values.dtype.descr,
+                                              "shape": list(values.shape),
+                                              "compression": method}
+                file.write(data)
+                position += len(data)
+
+            data = json.dumps(directory).encode("utf-8")
+            file.write(data)
+            file.write(_TRAILER.pack(position, len(data), MAGIC))
+
+        os.replace(temporary, filename)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+class Container:
+    """
+    Read-only container, which is mapped into memory. Columns are loaded lazily on first
+    access and cached. Uncompressed columns are read-only views of the memory map.
+
+    The memory map is closed by close or at the end of a with statement, once all views of
+    the columns were released.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as file:
+            self.__map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            magic, self.version, _ = _HEADER.unpack_from(self.__map, 0)
+            offset, size, trailer_magic = _TRAILER.unpack_from(self.__map, len(self.__map) - _TRAILER.size)
+            if magic != MAGIC or trailer_magic != MAGIC:
+                raise ValueError(f"{filename} is not a particle container")
+            if self.version > VERSION:
+                raise ValueError(f"container version {self.version} is not supported")
+
+            directory = json.loads(bytes(self.__map[offset:offset+size]).decode("utf-8"))
+        except BaseException:
+            self.__map.close()
+            raise
+        self.attributes = directory["attributes"]
+        self.__columns = directory["columns"]
+        self.__cache = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    @property
+    def closed(self):
+        return self.__map.closed
+
+    def close(self):
+        """
+        Releases the cached columns and closes the memory map. Raises BufferError, if views
+        of the columns are still referenced somewhere else.
+        """
+        self.__cache = {}
+        self.__map.close()
+
+    def __contains__(self, name):
+        return name in self.__columns
+
+    def __getitem__(self, name):
+        if self.__map.closed:
+            raise ValueError("the container is closed")
+        if name not in self.__cache:
+            self.__cache[name] = self.__load(name)
+        return self.__cache[name]
+
+    def names(self):
+        return list(self.__columns)
+
+    def __load(self, name):
+        column = self.__columns[name]
+        dtype = column["dtype"]
+        dtype = np.dtype([tuple(field) for field in dtype] if isinstance(dtype, list) else dtype)
+        count = int(np.prod(column["shape"]))
+
+        if column["compression"] == "zlib":
+            data = zlib.decompress(self.__map[column["offset"]:column["offset"]+column["size"]])
+            values = np.frombuffer(data, dtype=dtype, count=count)
+        else:
+            values = np.frombuffer(self.__map, dtype=dtype, count=count, offset=column["offset"])
+        return values.reshape(column["shape"])
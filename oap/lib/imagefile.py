@@ -2,30 +2,66 @@
 
 """
 
+import os
 import pickle
 import numpy as np
 
 from matplotlib import pyplot as plt
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 
-from oap.core import decompress
+from oap.core import (BUFFER_SIZE, PARTICLE_DTYPE, arrays_to_records, attribute_version, decompress, detect_probe,
+                      records_to_arrays, tensors)
 from oap.bnp import progress, Runtime
+from oap.lib.container import Container, is_container, write_container
 from oap.__conf__ import COLUMN, ROSETTE
 
+# Resolutions in seconds of the cached particle counts (see Imagefile.counts).
+COUNT_LEVELS = (1, 10, 60, 600)
+
+# Maximum number of filter presets with cached particle counts.
+COUNT_CACHE_SIZE = 32
+
 
 def load_imagefile(filename):
+    """
+    Opens an Imagefile object, which was saved with Imagefile.save. The particles of a
+    container are only read, when they are accessed. Pickled Imagefile objects of
+    older versions are still supported.
+    """
+    if is_container(filename):
+        return Imagefile.from_container(Container(filename))
     with open(filename, "rb") as file:
         imagefile = pickle.load(file)
     return imagefile
 
 
+def _metadata_columns(records):
+    """
+    Metadata columns of the particle records (see Imagefile._metadata).
+    """
+    pixels = records["pixel_one"].astype(np.int64) + records["pixel_two"] + records["pixel_thr"]
+    return {
+        "second": records["second"].astype(np.int64),
+        "millisecond": records["millisecond"].astype(np.int64),
+        "microsecond": records["microsecond"].astype(np.int64),
+        "area_ratio": np.sqrt(pixels * np.pi) * 15,
+        "width": records["max_idx"].astype(np.int64) - records["min_idx"] + 1,
+        "height": records["y_dim"].astype(np.int64),
+        "hit_ratio": records["hit_ratio"].astype(np.float64),
+        "axis_ratio": records["axis_ratio"].astype(np.float64),
+        "alpha": records["alpha"].astype(np.float64),
+        "column": records["column"].astype(np.float64),
+        "rosette": records["rosette"].astype(np.float64),
+    }
+
+
 class Imagefile:
 
     def __init__(self, filename=None,
                  timeframes=None, x_sizes=None, y_sizes=None,
                  exclude_buffers=None, include_buffers=None,
                  truncated=True, poisson=True, cluster=True, principal=True, status=True, buffer_id=False,
-                 diodes=64, resolution=15):
+                 diodes=64, resolution=15, threads=1, probe="auto"):
 
         self.filename = filename
         self.diodes = diodes
@@ -38,7 +74,14 @@ class Imagefile:
         self.axes = None
         self.__auto_plot = None
 
+        self._container = None
+        # Decompression options and byte offset of the next buffer of a followed imagefile.
+        self._follow = None
+        self.checkpoint = 0
         self.arrays = []
+        self.number_of_particles = 0
+        self.min_time = None
+        self.max_time = None
         if self.filename is not None:
             self.number_of_particles = decompress(self.filename,
                                                   arrays=self.arrays,
@@ -52,13 +95,96 @@ class Imagefile:
                                                   cluster=cluster,
                                                   principal=principal,
                                                   status=status,
-                                                  buffer_id=buffer_id)
+                                                  buffer_id=buffer_id,
+                                                  threads=threads,
+                                                  probe=probe)
             self.min_time = self.arrays[0].second   # ToDo: empty image files! Also check for weird values!
             self.max_time = self.arrays[-1].second  # ToDo: update this when usind __add__
 
+    @property
+    def arrays(self):
+        if self._arrays is None:
+            self._arrays = self.__load_arrays()
+            self._close_container()
+            # The cached columns of the container describe the same particles.
+            self._cache_key = self.__arrays_key()
+        return self._arrays
+
+    @arrays.setter
+    def arrays(self, arrays):
+        self._arrays = arrays
+        if arrays is not None:
+            self._close_container()
+        self.invalidate()
+        self._cache_key = self.__arrays_key()
+
+    def _close_container(self):
+        # The container is not needed anymore, once the OpticalArray objects exist. Columns,
+        # which are still referenced (see _native_particles), keep the memory map open until
+        # they are garbage collected.
+        if self._container is not None:
+            try:
+                self._container.close()
+            except BufferError:
+                pass
+            self._container = None
+
+    def invalidate(self):
+        """
+        Clears the cached metadata columns and particle counts. The caches are cleared
+        automatically, if the arrays are replaced, particles are appended to or removed from
+        the arrays or an attribute of any particle is set (see oap.core.attribute_version).
+        Call invalidate after particles of the arrays were replaced by other particles.
+        """
+        self._columns = None
+        self._counts = {}
+
+    def __arrays_key(self):
+        return None if self._arrays is None else (id(self._arrays), len(self._arrays), attribute_version())
+
+    def _check_cache(self):
+        # Metadata columns and particle counts must be rebuilt, if the particles changed.
+        key = self.__arrays_key()
+        if key != self._cache_key:
+            self.invalidate()
+            self._cache_key = key
+
+    def __setstate__(self, state):
+        # Pickled objects of older versions store the arrays as plain attribute.
+        if "arrays" in state:
+            state["_arrays"] = state.pop("arrays")
+        state.setdefault("_container", None)
+        state.setdefault("_follow", None)
+        state.setdefault("checkpoint", 0)
+        state["_columns"] = None
+        state["_counts"] = {}
+        state["_cache_key"] = None
+        self.__dict__.update(state)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_arrays"] = self.arrays
+        state["_container"] = None
+        state["_columns"] = None
+        state["_counts"] = {}
+        state["_cache_key"] = None
+        return state
+
     def __len__(self):
         return self.number_of_particles
 
+    def __getitem__(self, timespan):
+        """
+        Returns the particles with start <= time < stop as new Imagefile object, which shares
+        the OpticalArray objects and the metadata columns with this object. The time is given
+        in seconds of the day and may have fractions of a second:
+
+            imagefile[36000:36060.5]
+        """
+        if not isinstance(timespan, slice) or timespan.step is not None:
+            raise TypeError("Imagefile objects are sliced by time: imagefile[start:stop]")
+        return self._subset(self.time_indices(timespan.start, timespan.stop))
+
     def __iter__(self):
         self.offset = 0
         return self
@@ -73,15 +199,261 @@ class Imagefile:
 
     def __add__(self, other):
         new = Imagefile()
-        new.arrays = self.arrays
-        new.arrays += other.arrays
+        new.arrays = self.arrays + other.arrays
         if self.arrays[0].second > other.arrays[0].second:
             new.arrays.sort(key=lambda x: x.second, reverse=True)
         return new
 
-    def save(self, filename):
-        with open(filename, "wb") as file:
-            pickle.dump(self, file)
+    def save(self, filename, compression=None):
+        """
+        Saves the particles into a container (see oap.lib.container), which is
+        opened with load_imagefile.
+
+        --- optional params ---
+        :param compression: compression of the columns (None or "zlib") or a dict
+                            with the compression per column
+        :type compression:  string or dict
+        """
+        records, pixels, offsets = self._native_particles()
+        columns = {name: records[name] for name in PARTICLE_DTYPE.names}
+        columns["pixels"] = pixels
+        columns["offsets"] = offsets
+
+        attributes = {"filename": self.filename,
+                      "diodes": self.diodes,
+                      "resolution": self.resolution,
+                      "number_of_particles": self.number_of_particles,
+                      "min_time": self.min_time,
+                      "max_time": self.max_time,
+                      "follow": self._follow,
+                      "checkpoint": self.checkpoint}
+        write_container(filename, columns, attributes=attributes, compression=compression)
+        del records, pixels, offsets, columns
+
+        # The memory map still refers to the replaced file, if the container was saved
+        # over the file it was opened from.
+        if self._container is not None and os.path.abspath(self._container.filename) == os.path.abspath(filename):
+            self._close_container()
+            self._container = Container(filename)
+
+    @classmethod
+    def from_container(cls, container):
+        """
+        Creates an Imagefile object from a container. The OpticalArray objects are
+        created on first access of the arrays.
+        """
+        attributes = container.attributes
+        imagefile = cls(diodes=attributes["diodes"], resolution=attributes["resolution"])
+        imagefile.filename = attributes["filename"]
+        imagefile.number_of_particles = attributes["number_of_particles"]
+        imagefile.min_time = attributes["min_time"]
+        imagefile.max_time = attributes["max_time"]
+        if attributes.get("follow") is not None:
+            # JSON turns the (min, max) tuples of the filters into lists.
+            imagefile._follow = {name: [tuple(v) if isinstance(v, list) else v for v in value]
+                                 if isinstance(value, list) else value
+                                 for name, value in attributes["follow"].items()}
+            imagefile.checkpoint = attributes["checkpoint"]
+        imagefile._container = container
+        imagefile.arrays = None
+        return imagefile
+
+    @classmethod
+    def follow(cls, filename, timeframes=None, x_sizes=None, y_sizes=None, exclude_buffers=None,
+               truncated=True, poisson=True, cluster=True, principal=True,
+               diodes=64, resolution=15, threads=1, probe="auto"):
+        """
+        Creates an Imagefile object of an imagefile, which is still being recorded. All complete
+        buffers are decoded now and every call of update decodes only the buffers, which were
+        appended in the meantime. The byte offset behind the last decoded buffer is stored as
+        checkpoint and is saved with the object (see save). The probe is detected once from the
+        first buffers, so that all updates decode the same data format.
+        """
+        imagefile = cls(diodes=diodes, resolution=resolution)
+        imagefile.filename = filename
+        imagefile._follow = dict(timeframes=timeframes, x_sizes=x_sizes, y_sizes=y_sizes,
+                                 exclude_buffers=exclude_buffers, truncated=truncated, poisson=poisson,
+                                 cluster=cluster, principal=principal, threads=threads, probe=probe)
+        imagefile.update()
+        return imagefile
+
+    def update(self):
+        """
+        Decodes the complete buffers, which were appended to the followed imagefile since the
+        last update, and appends their particles. An incomplete buffer at the end of the file is
+        decoded by a later update. Returns the number of new particles.
+        """
+        if self._follow is None:
+            raise ValueError("the Imagefile object does not follow an imagefile (see Imagefile.follow)")
+
+        first = self.checkpoint // BUFFER_SIZE
+        n_buffers = os.path.getsize(self.filename) // BUFFER_SIZE
+        if n_buffers <= first:
+            return 0
+        if self._follow.get("probe", "auto") == "auto":
+            self._follow["probe"] = detect_probe(self.filename)
+
+        arrays = []
+        number = decompress(self.filename, arrays=arrays, include_buffers=[(first, n_buffers-1)], status=False,
+                            **self._follow)
+        self.checkpoint = n_buffers * BUFFER_SIZE
+        if arrays:
+            self._append(arrays)
+        return number
+
+    def _append(self, arrays):
+        """
+        Appends particles and extends the cached metadata columns with the columns of the new
+        particles only. The particle counts are computed again on the next request.
+        """
+        self._check_cache()
+        columns = self._columns
+        self.arrays.extend(arrays)
+        self._counts = {}
+        self._cache_key = self.__arrays_key()
+        self.number_of_particles += len(arrays)
+        self.min_time = self.arrays[0].second
+        self.max_time = self.arrays[-1].second
+        if columns is None:
+            return
+
+        records = np.frombuffer(arrays_to_records(arrays, images=False)[0], dtype=PARTICLE_DTYPE)
+        new_columns = _metadata_columns(records)
+        time, order = columns.pop("time", None), columns.pop("order", None)
+        self._columns = {name: np.concatenate((columns[name], new_columns[name])) for name in new_columns}
+
+        # The time index stays sorted, if the new particles follow the last particle.
+        new_time = new_columns["second"] * 1000000 + new_columns["millisecond"] * 1000 + new_columns["microsecond"]
+        if time is not None and order is None and np.all(new_time[1:] >= new_time[:-1]) \
+                and (not len(time) or new_time[0] >= time[-1]):
+            self._columns["time"] = np.concatenate((time, new_time))
+            self._columns["order"] = None
+
+    def __load_arrays(self):
+        records, pixels, _ = self._native_particles()
+        return records_to_arrays(records, pixels)
+
+    def _native_particles(self, images=True):
+        """
+        Returns the particle records (PARTICLE_DTYPE), the concatenated particle images (uint8)
+        and the offsets of the images (int64, one more than particles). The columns of a
+        container are used as long as the arrays were not accessed. If images is False,
+        the particle images are empty.
+        """
+        if self._arrays is None and self._container is not None:
+            container = self._container
+            records = np.zeros(len(container["offsets"]) - 1, dtype=PARTICLE_DTYPE)
+            for name in PARTICLE_DTYPE.names:
+                records[name] = container[name]
+            return records, container["pixels"], container["offsets"]
+
+        records, pixels = arrays_to_records(self.arrays, images=images)
+        records = np.frombuffer(records, dtype=PARTICLE_DTYPE)
+        offsets = np.zeros(len(records) + 1, dtype=np.int64)
+        np.cumsum(records["y_dim"].astype(np.int64) * 64, out=offsets[1:])
+        return records, np.frombuffer(pixels, dtype=np.uint8), offsets
+
+    def _metadata(self):
+        """
+        Returns the cached metadata columns of all particles, which are used by the filters of
+        get_indices. The columns are computed once and cleared, if the arrays are replaced,
+        change their length or an attribute of a particle is set (see invalidate). Integers are
+        int64 and floats are float64, so that comparisons with the filter boundaries are exact.
+        """
+        self._check_cache()
+        if self._columns is None:
+            records, _, _ = self._native_particles(images=False)
+            self._columns = _metadata_columns(records)
+        return self._columns
+
+    def _time_index(self):
+        """
+        Returns the time keys (microseconds of the day) of all particles in time order and
+        the order of the particles, which is None if the particles are already sorted by time.
+        """
+        columns = self._metadata()
+        if "time" not in columns:
+            time = columns["second"] * 1000000 + columns["millisecond"] * 1000 + columns["microsecond"]
+            if np.all(time[1:] >= time[:-1]):
+                columns["order"] = None
+            else:
+                columns["order"] = np.argsort(time, kind="stable")
+                time = time[columns["order"]]
+            columns["time"] = time
+        return columns["time"], columns["order"]
+
+    def time_indices(self, start=None, stop=None):
+        """
+        Returns the indices of the particles with start <= time < stop in time order. The
+        boundaries are seconds of the day (None is unbounded) and are found by binary search.
+        """
+        time, order = self._time_index()
+        first = 0 if start is None else np.searchsorted(time, round(start * 1000000), side="left")
+        last = len(time) if stop is None else np.searchsorted(time, round(stop * 1000000), side="left")
+        last = max(first, last)
+        return slice(first, last) if order is None else order[first:last]
+
+    def _subset(self, indices):
+        """
+        Returns a new Imagefile object with the particles of a slice or an index array. A slice
+        shares the metadata columns with this object, an index array copies them.
+        """
+        columns = self._metadata()
+        arrays = self.arrays
+
+        subset = Imagefile(diodes=self.diodes, resolution=self.resolution)
+        subset.filename = self.filename
+        if isinstance(indices, slice):
+            subset.arrays = arrays[indices]
+        else:
+            subset.arrays = [arrays[i] for i in indices]
+        subset._columns = {name: columns[name][indices] for name in columns if name not in ("time", "order")}
+        subset.number_of_particles = len(subset.arrays)
+        if subset.arrays:
+            subset.min_time = subset.arrays[0].second
+            subset.max_time = subset.arrays[-1].second
+        return subset
+
+    def to_arrow(self, images="list"):
+        """
+        Returns the particles as Arrow table (requires pyarrow). Every field of the particle
+        records becomes a column. The particle images (y_dim * 64 pixels) are stored in the
+        column "image" without copying them.
+
+        --- optional params ---
+        :param images:  type of the image column: "list" (large_list<uint8>), "binary"
+                        (large_binary) or None (no image column)
+        :type images:   string
+        """
+        import pyarrow as pa
+
+        records, pixels, offsets = self._native_particles()
+        columns = [pa.array(np.ascontiguousarray(records[name])) for name in PARTICLE_DTYPE.names]
+        names = list(PARTICLE_DTYPE.names)
+
+        offsets = np.ascontiguousarray(offsets, dtype=np.int64)
+        pixels = np.ascontiguousarray(pixels, dtype=np.uint8)
+        if images == "list":
+            columns.append(pa.LargeListArray.from_arrays(pa.array(offsets), pa.array(pixels)))
+        elif images == "binary":
+            columns.append(pa.Array.from_buffers(pa.large_binary(), len(records),
+                                                 [None, pa.py_buffer(offsets), pa.py_buffer(pixels)]))
+        elif images is not None:
+            raise ValueError(f"unknown image column type: {images}")
+        if images is not None:
+            names.append("image")
+
+        metadata = {"diodes": str(self.diodes), "resolution": str(self.resolution)}
+        return pa.Table.from_arrays(columns, names=names, metadata=metadata)
+
+    def to_parquet(self, path, row_group_size=None, images="list", **kwargs):
+        """
+        Writes the Arrow table of the particles (see to_arrow) into a Parquet file. All other
+        keyword arguments are passed to pyarrow.parquet.write_table.
+        """
+        import pyarrow.parquet as pq
+
+        pq.write_table(self.to_arrow(images=images), path, row_group_size=row_group_size, **kwargs)
 
     def classify(self, batch_size=1024):
 
@@ -92,44 +464,96 @@ class Imagefile:
         pc_r = ParticleClassifier(p_type=ROSETTE)
         arrays = self.get_arrays(x=(5, 64), y=(5, 64))
         iterations = len(arrays)//batch_size if len(arrays) % batch_size == 0 else len(arrays)//batch_size+1
+        buffer = np.empty((min(batch_size, len(arrays)), 64, 64, 1), dtype=np.float32)
 
         for i in range(iterations):
             progress(i, iterations, prefix="Classification ", suffix=" Complete")
-            batch = [arrays[i*batch_size+j].tensor() for j in range(batch_size) if i*batch_size+j < len(arrays)]
-            batch = np.reshape(batch, (len(batch), 64, 64, 1))
+            batch_arrays = arrays[i*batch_size:(i+1)*batch_size]
+            batch = tensors(batch_arrays, out=buffer[:len(batch_arrays)])
             pred_c = pc_c.predict(batch)
             pred_r = pc_r.predict(batch)
             for j in range(len(batch)):
                 arrays[i*batch_size+j].column = pred_c[j][0]
                 arrays[i*batch_size+j].rosette = pred_r[j][0]
+        self.invalidate()
         runtime.stop()
 
+    def get_indices(self, timespan=(0, 86400), area_ratio=(0, 1e9), x=(0, 1e9), y=(0, 1e9),
+                    hit_ratio=(0, 1), axis_ratio=(0, 1e9), alpha=(-360, 360),
+                    c=(0, 1), r=(0, 1), timeshift=0):
+        """
+        Returns the indices of all particles within the boundaries (inclusive) as integer
+        array. The filters are evaluated on the cached metadata columns.
+        """
+        columns = self._metadata()
+
+        # Particles in time order are restricted to the timespan by binary search.
+        first, last = 0, len(columns["second"])
+        if self._time_index()[1] is None:
+            first = np.searchsorted(columns["second"], timespan[0] - timeshift, side="left")
+            last = max(first, np.searchsorted(columns["second"], timespan[1] - timeshift, side="right"))
+
+        seconds = columns["second"][first:last] + timeshift
+        mask = (timespan[0] <= seconds) & (seconds <= timespan[1])
+        for name, (lower, upper) in (("area_ratio", area_ratio), ("width", x), ("height", y),
+                                     ("hit_ratio", hit_ratio), ("axis_ratio", axis_ratio),
+                                     ("alpha", alpha), ("column", c), ("rosette", r)):
+            values = columns[name][first:last]
+            mask &= (lower <= values) & (values <= upper)
+        return np.flatnonzero(mask) + first
+
     def get_arrays(self, timespan=(0, 86400), area_ratio=(0, 1e9), x=(0, 1e9), y=(0, 1e9),
                    hit_ratio=(0, 1), axis_ratio=(0, 1e9), alpha=(-360, 360),
                    c=(0, 1), r=(0, 1), timeshift=0):
-        arrays = [array for array in self.arrays
-                  if timespan[0] <= array.second+timeshift <= timespan[1]
-                  and area_ratio[0] <= array.area_ratio() <= area_ratio[1]
-                  and x[0] <= array.width() <= x[1]
-                  and y[0] <= array.height() <= y[1]
-                  and hit_ratio[0] <= array.hit_ratio <= hit_ratio[1]
-                  and axis_ratio[0] <= array.axis_ratio <= axis_ratio[1]
-                  and alpha[0] <= array.alpha <= alpha[1]
-                  and c[0] <= array.column <= c[1]
-                  and r[0] <= array.rosette <= r[1]]
-        return arrays
+        indices = self.get_indices(timespan=timespan, area_ratio=area_ratio, x=x, y=y, hit_ratio=hit_ratio,
+                                   axis_ratio=axis_ratio, alpha=alpha, c=c, r=r, timeshift=timeshift)
+        arrays = self.arrays
+        return [arrays[i] for i in indices]
 
     def counts_per_second(self, timespan=(0, 86400), area_ratio=(0, 1e9), x=(0, 1e9), y=(0, 1e9),
                           hit_ratio=(0, 1), axis_ratio=(0, 1e9), alpha=(-360, 360), c=(0, 1), r=(0, 1),
                           timeshift=0):
-        arrays = self.get_arrays(timespan=timespan, area_ratio=area_ratio, x=x, y=y, hit_ratio=hit_ratio,
-                                 axis_ratio=axis_ratio, alpha=alpha, c=c, r=r, timeshift=timeshift)
-        counts = dict.fromkeys(range(self.arrays[0].second+timeshift,
-                                     self.arrays[-1].second+timeshift + 1), 0)
-        for a in arrays:
-            counts[a.second+timeshift] += 1
-        x, y = zip(*sorted(counts.items()))
-        return np.array(x), np.array(y)
+        return self.counts(1, timespan=timespan, area_ratio=area_ratio, x=x, y=y, hit_ratio=hit_ratio,
+                           axis_ratio=axis_ratio, alpha=alpha, c=c, r=r, timeshift=timeshift)
+
+    def counts(self, resolution=1, timespan=(0, 86400), area_ratio=(0, 1e9), x=(0, 1e9), y=(0, 1e9),
+               hit_ratio=(0, 1), axis_ratio=(0, 1e9), alpha=(-360, 360), c=(0, 1), r=(0, 1), timeshift=0):
+        """
+        Returns the start times and the particle counts of the time bins with a resolution of
+        1, 10, 60 or 600 seconds. The counts of all resolutions are computed once per filter
+        preset and cached until the particles change (see invalidate).
+        The returned arrays are read-only.
+        """
+        if resolution not in COUNT_LEVELS:
+            raise ValueError(f"resolution must be one of {COUNT_LEVELS}")
+
+        filters = dict(timespan=timespan, area_ratio=area_ratio, x=x, y=y, hit_ratio=hit_ratio,
+                       axis_ratio=axis_ratio, alpha=alpha, c=c, r=r)
+        key = tuple((name, tuple(value)) for name, value in filters.items()) + (timeshift,)
+        self._check_cache()
+        if key not in self._counts:
+            if len(self._counts) >= COUNT_CACHE_SIZE:
+                del self._counts[next(iter(self._counts))]
+            self._counts[key] = self.__count_levels(timeshift=timeshift, **filters)
+        return self._counts[key][resolution]
+
+    def __count_levels(self, timeshift=0, **filters):
+        indices = self.get_indices(timeshift=timeshift, **filters)
+        seconds = self._metadata()["second"] + timeshift
+        first, last = seconds[0], seconds[-1]
+        counts = np.bincount(seconds[indices] - first, minlength=last - first + 1)[:last - first + 1]
+
+        # Coarser levels are sums of the counts per second in bins aligned to the resolution.
+        levels = {}
+        for resolution in COUNT_LEVELS:
+            start = first // resolution * resolution
+            padded = np.zeros(-(-(last + 1 - start) // resolution) * resolution, dtype=counts.dtype)
+            padded[first - start:first - start + len(counts)] = counts
+            level = (np.arange(start, start + len(padded), resolution), padded.reshape(-1, resolution).sum(axis=1))
+            for values in level:
+                values.flags.writeable = False
+            levels[resolution] = level
+        return levels
 
     # --- Plotting -----------------------------------------------------------------------------------------------------
     def __reset_plot(self):
@@ -178,9 +602,9 @@ class Imagefile:
     def plot(self, timespan=(0, 86400), area_ratio=(0, 1e9), x=(0, 1e9), y=(0, 1e9),
              hit_ratio=(0, 1), axis_ratio=(0, 1e9), alpha=(-360, 360), c=(0, 1), r=(0, 1),
              timeshift=0, index=None, color=None, fill_color=None, opacity=1.0, linewidth=1.0, fill=True,
-             title=None, label=None, xlabel=None, ylabel=None, grid=False, legend=False, log=False):
-        x, y = self.counts_per_second(timespan=timespan, area_ratio=area_ratio, x=x, y=y, hit_ratio=hit_ratio,
-                                      axis_ratio=axis_ratio, alpha=alpha, c=c, r=r, timeshift=timeshift)
+             title=None, label=None, xlabel=None, ylabel=None, grid=False, legend=False, log=False, resolution=1):
+        x, y = self.counts(resolution, timespan=timespan, area_ratio=area_ratio, x=x, y=y, hit_ratio=hit_ratio,
+                           axis_ratio=axis_ratio, alpha=alpha, c=c, r=r, timeshift=timeshift)
         if self.__plt_iterator is None:
             self.init_plot(1, tight_layout=False, auto_plot=True)
         i = self.__plt_iterator if index is None else index
@@ -193,13 +617,14 @@ class Imagefile:
     def plot_count(self, timespan=(0, 86400), area_ratio=(0, 1e9), x=(0, 1e9), y=(0, 1e9),
                    hit_ratio=(0, 1), axis_ratio=(0, 1e9), alpha=(-360, 360), c=(0, 1), r=(0, 1),
                    timeshift=0, index=None, color=None, opacity=1.0, title=None,
-                   label=None, xlabel=None, ylabel=None, grid=False, legend=False, log=False):
-        x, y = self.counts_per_second(timespan=timespan, area_ratio=area_ratio, x=x, y=y, hit_ratio=hit_ratio,
-                                      axis_ratio=axis_ratio, alpha=alpha, c=c, r=r, timeshift=timeshift)
+                   label=None, xlabel=None, ylabel=None, grid=False, legend=False, log=False, resolution=1):
+        x, y = self.counts(resolution, timespan=timespan, area_ratio=area_ratio, x=x, y=y, hit_ratio=hit_ratio,
+                           axis_ratio=axis_ratio, alpha=alpha, c=c, r=r, timeshift=timeshift)
         if self.__plt_iterator is None:
             self.init_plot(1, tight_layout=False, auto_plot=True)
         i = self.__plt_iterator if index is None else index
-        self.axes[i][0].bar(x, y, align="center", width=1, color=color, alpha=opacity, label=label)
+        self.axes[i][0].bar(x, y, align="center" if resolution == 1 else "edge", width=resolution,
+                            color=color, alpha=opacity, label=label)
         self.__adjust_plot(i, title, xlabel, ylabel, grid, legend, log, index)
 
     # fix color bar !!!
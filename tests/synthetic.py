@@ -0,0 +1,241 @@
+"""
+Writer for synthetic grayscale and monoscale imagefiles (DMT CIP Grayscale and Monoscale).
+
+The writer is the inverse of the decompression algorithm in the C core and is only
+meant to generate small imagefiles with known particle images for testing.
+"""
+
+import random
+
+BUFFER_SIZE = 4096
+HEADER_SIZE = 16
+SLICE_BITS = 128
+
+# Shadow level -> bit pair of a grayscale pixel.
+PIXEL_BITS = {
+    0: (1, 1),
+    1: (0, 1),
+    2: (1, 0),
+    3: (0, 0),
+}
+
+
+def _header_bits(particle):
+    """
+    Particle header slice. The bits of the header fields are pairwise swapped after the 56 leading zeros.
+    """
+    fields = [
+        (56, 8, particle.get("tas", 0)),
+        (64, 16, particle.get("number", 0)),
+        (80, 3, particle.get("nanosecond", 0)),
+        (83, 10, particle.get("microsecond", 0)),
+        (93, 10, particle.get("millisecond", 0)),
+        (103, 6, particle["second"] % 60),
+        (109, 6, (particle["second"] // 60) % 60),
+        (115, 5, particle["second"] // 3600),
+        (120, 8, len(particle["image"]) + 1),
+    ]
+    bits = [0] * SLICE_BITS
+    for start, length, value in fields:
+        for i in range(length):
+            bits[start+i] = (value >> i) & 1
+    for i in range(56, SLICE_BITS, 2):
+        bits[i], bits[i+1] = bits[i+1], bits[i]
+    return bits
+
+
+def _particle_bits(particle):
+    bits = _header_bits(particle)
+    for row in particle["image"]:
+        for level in row:
+            bits.extend(PIXEL_BITS[level])
+    # Two boundary slices (trailer) of successive ones.
+    bits.extend([1] * 2 * SLICE_BITS)
+    return bits
+
+
+def _compress(bits, last_2_bits=0):
+    """
+    Compresses a bit stream with the grayscale run-length encoding.
+    Returns the compressed bytes and the last two literal bits.
+    """
+    data = bytearray()
+    i = 0
+    while i < len(bits):
+        repeats = 0
+        while repeats < 127 and i+2*repeats+1 < len(bits) \
+                and (bits[i+2*repeats] << 1 | bits[i+2*repeats+1]) == last_2_bits:
+            repeats += 1
+        if repeats >= 2:
+            data.append(128 | repeats)
+            i += 2 * repeats
+            continue
+        length = min(6, len(bits)-i)
+        value = 0
+        for bit in bits[i:i+length]:
+            value = value << 1 | bit
+        data.append({6: 64, 4: 16, 2: 4}[length] | value)
+        last_2_bits = value & 3
+        i += length
+    return data, last_2_bits
+
+
+def grayscale_buffers(particles):
+    """
+    Splits a list of particles into compressed 4096 byte data buffers.
+    """
+    buffers = []
+    data, last_2_bits = _compress([1] * 2 * SLICE_BITS)
+    count = 0
+    for particle in particles:
+        compressed, last = _compress(_particle_bits(particle), last_2_bits)
+        if count and len(data) + len(compressed) > BUFFER_SIZE:
+            buffers.append(data)
+            data, last_2_bits = _compress([1] * 2 * SLICE_BITS)
+            compressed, last = _compress(_particle_bits(particle), last_2_bits)
+            count = 0
+        data += compressed
+        last_2_bits = last
+        count += 1
+    buffers.append(data)
+    return [bytes(b) + bytes(BUFFER_SIZE - len(b)) for b in buffers]
+
+
+MONOSCALE_BOUNDARY = bytes([0xAA] * 8)
+
+
+def _monoscale_header(particle):
+    """
+    Monoscale particle header. The microseconds are stored in steps of 125 nanoseconds.
+    """
+    second = particle["second"]
+    timestamp = ((second // 3600) << 35 | ((second // 60) % 60) << 29 | (second % 60) << 23
+                 | particle.get("millisecond", 0) << 13 | particle.get("microsecond", 0) * 8)
+    header = particle.get("number", 0).to_bytes(2, "little") + timestamp.to_bytes(5, "little")
+    return header + bytes([(len(particle["image"]) + 1) << 1])
+
+
+def _monoscale_slice(row):
+    """
+    Image slice with one bit per pixel, shadowed pixels (any shadow level) are cleared bits.
+    """
+    data = bytearray([255] * 8)
+    for x, level in enumerate(row):
+        if level:
+            data[x // 8] &= ~(128 >> (x % 8))
+    return bytes(data)
+
+
+def _compress_monoscale(data):
+    """
+    Compresses bytes with the monoscale run-length encoding.
+    """
+    compressed = bytearray()
+    literal = bytearray()
+    i = 0
+    while i <= len(data):
+        run = 0
+        while i < len(data) and data[i] in (0, 255) and run < 32 and i+run < len(data) and data[i+run] == data[i]:
+            run += 1
+        if literal and (run >= 2 or len(literal) == 32 or i == len(data)):
+            compressed += bytes([len(literal) - 1]) + literal
+            literal = bytearray()
+        if i == len(data):
+            break
+        if run >= 2:
+            compressed.append((128 if data[i] == 0 else 64) | (run - 1))
+            i += run
+        else:
+            literal.append(data[i])
+            i += 1
+    return compressed
+
+
+def monoscale_buffers(particles):
+    """
+    Splits a list of particles into compressed 4096 byte monoscale data buffers. The
+    buffers are padded with dummy bytes.
+    """
+    buffers = []
+    data = bytearray(MONOSCALE_BOUNDARY)
+    count = 0
+    for particle in particles:
+        particle_data = _monoscale_header(particle) + b"".join(_monoscale_slice(row) for row in particle["image"])
+        particle_data += MONOSCALE_BOUNDARY
+        if count and len(_compress_monoscale(data + particle_data)) > BUFFER_SIZE:
+            buffers.append(_compress_monoscale(data))
+            data = bytearray(MONOSCALE_BOUNDARY)
+            count = 0
+        data += particle_data
+        count += 1
+    buffers.append(_compress_monoscale(data))
+    return [bytes(b) + bytes([32] * (BUFFER_SIZE - len(b))) for b in buffers]
+
+
+def write_imagefile(filename, buffers, date=(2020, 8, 30)):
+    """
+    Writes data buffers with their 16 byte headers to an imagefile.
+    """
+    header = bytearray(HEADER_SIZE)
+    header[0:6] = b"".join(v.to_bytes(2, "little") for v in date)
+    with open(filename, "wb") as file:
+        for buffer in buffers:
+            file.write(bytes(header))
+            file.write(buffer)
+
+
+def random_particle(rng, second, number, width=None, height=None, x=None):
+    """
+    Random blob-like particle image with shadow levels 1 to 3.
+    """
+    width = rng.randint(1, 30) if width is None else width
+    height = rng.randint(1, 40) if height is None else height
+    x = rng.randint(0, 64-width) if x is None else x
+    cx, cy = x + (width-1) / 2, (height-1) / 2
+    image = []
+    for row in range(height):
+        line = [0] * 64
+        for col in range(x, x+width):
+            dx = (col-cx) / (width / 2)
+            dy = (row-cy) / (height / 2)
+            distance = dx*dx + dy*dy
+            if distance <= 1.0 and rng.random() > 0.05:
+                line[col] = 3 if distance < 0.4 else (2 if distance < 0.7 else 1)
+        image.append(line)
+    return {
+        "second": second,
+        "millisecond": rng.randint(0, 999),
+        "microsecond": rng.randint(0, 999),
+        "nanosecond": rng.randint(0, 7),
+        "number": number,
+        "image": image,
+    }
+
+
+def ring_particle(second, number, size=12, x=20):
+    """
+    Particle with a closed Poisson spot in the centre.
+    """
+    image = []
+    c = (size-1) / 2
+    for row in range(size):
+        line = [0] * 64
+        for col in range(size):
+            d = ((col-c)**2 + (row-c)**2) ** 0.5
+            if size/4 <= d <= size/2:
+                line[x+col] = 3
+        image.append(line)
+    return {"second": second, "number": number, "image": image}
+
+
+def random_particles(n, seed=0, start=36000):
+    rng = random.Random(seed)
+    particles = []
+    second = start
+    for number in range(n):
+        second += rng.random() < 0.1
+        if number % 17 == 5:
+            particles.append(ring_particle(second, number))
+        else:
+            particles.append(random_particle(rng, second, number))
+    return particles
@@ -0,0 +1,54 @@
+"""
+Testing the decompression of many imagefiles from oap.lib.campaign
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import oap
+from tests.synthetic import grayscale_buffers, random_particles, write_imagefile
+
+
+class TestCampaign(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.filenames = []
+        for i, (start, date) in enumerate([(50000, (2020, 8, 30)), (36000, (2020, 8, 30)), (1000, (2020, 8, 31))]):
+            filename = os.path.join(cls.directory, f"Imagefile_{i}")
+            write_imagefile(filename, grayscale_buffers(random_particles(150, seed=i, start=start)), date=date)
+            cls.filenames.append(filename)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def test_decompress_many(self):
+        imagefile = oap.decompress_many(self.filenames, workers=2)
+        expected = []
+        for filename in (self.filenames[1], self.filenames[0], self.filenames[2]):
+            arrays = []
+            oap.decompress(filename, arrays=arrays, truncated=True, poisson=True, cluster=True, principal=True)
+            expected += sorted(arrays, key=lambda a: (a.second, a.millisecond, a.microsecond))
+        self.assertEqual(len(imagefile), len(expected))
+        self.assertEqual([(a.second, a.number, a.hit_ratio, a.bytes()) for a in imagefile.arrays],
+                         [(a.second, a.number, a.hit_ratio, a.bytes()) for a in expected])
+
+    @unittest.skipUnless(os.path.isdir("/dev/shm"), "requires /dev/shm")
+    def test_shared_memory_error(self):
+        blocks = set(os.listdir("/dev/shm"))
+        missing = os.path.join(self.directory, "missing")
+        with self.assertRaises(OSError):
+            oap.decompress_many([missing] + self.filenames, workers=2)
+        self.assertEqual(set(os.listdir("/dev/shm")), blocks)
+
+    def test_records(self):
+        arrays = []
+        oap.decompress(self.filenames[0], arrays=arrays, truncated=True, poisson=True)
+        self.assertEqual(oap.core.PARTICLE_DTYPE.itemsize, oap.core.RECORD_SIZE)
+        copies = oap.core.records_to_arrays(*oap.core.arrays_to_records(arrays))
+        self.assertEqual([(a.second, a.number, a.alpha, a.bytes()) for a in copies],
+                         [(a.second, a.number, a.alpha, a.bytes()) for a in arrays])
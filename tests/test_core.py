@@ -0,0 +1,386 @@
+"""
+Testing the decompression of imagefiles in oap.core
+"""
+
+import hashlib
+import importlib
+import os
+import pickle
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from oap.core import (BUFFER_SIZE, PARTICLE_DTYPE, OpticalArray, arrays_to_records, build_index, decompress,
+                      detect_probe, indexed_buffers, load_index, tensors)
+from oap.lib.container import Container
+from tests.synthetic import grayscale_buffers, monoscale_buffers, random_particles, ring_particle, write_imagefile
+
+
+def supported_slice_kernels():
+    """
+    Slice kernels which can be selected on this machine.
+    """
+    kernels = ["scalar"]
+    if platform.machine().lower() in ("x86_64", "amd64"):
+        kernels.append("sse2")
+        try:
+            with open("/proc/cpuinfo") as cpuinfo:
+                if "avx2" in cpuinfo.read().split():
+                    kernels.append("avx2")
+        except OSError:
+            pass
+    return kernels
+
+
+class TestCore(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.particles = random_particles(200, seed=42)
+        cls.buffers = grayscale_buffers(cls.particles)
+        cls.filename = os.path.join(cls.directory, "Imagefile_synthetic")
+        write_imagefile(cls.filename, cls.buffers)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def decompress(self, **kwargs):
+        arrays = []
+        number = decompress(self.filename, arrays=arrays, **kwargs)
+        self.assertEqual(number, len(arrays))
+        return arrays
+
+    def test_decompress(self):
+        arrays = self.decompress(truncated=True)
+        expected = [p for p in self.particles if any(any(row) for row in p["image"])]
+        self.assertEqual(len(arrays), len(expected))
+        for array, particle in zip(arrays, expected):
+            self.assertEqual(array.second, particle["second"])
+            self.assertEqual(array.number, particle["number"])
+            self.assertEqual(array.height(), len(particle["image"]))
+            self.assertEqual(array.list(), [level for row in particle["image"] for level in row])
+
+    def test_threads(self):
+        kwargs = dict(truncated=True, poisson=True, cluster=True, principal=True)
+        expected = [(a.second, a.number, a.axis_ratio, a.hit_ratio, a.bytes()) for a in self.decompress(**kwargs)]
+        for threads in (2, 3, 8):
+            arrays = self.decompress(threads=threads, **kwargs)
+            self.assertEqual([(a.second, a.number, a.axis_ratio, a.hit_ratio, a.bytes()) for a in arrays], expected)
+
+    def test_slice_kernels(self):
+        script = ("import hashlib, sys; from oap.core import SLICE_KERNEL, arrays_to_records, decompress; arrays = [];"
+                  "decompress(sys.argv[1], arrays=arrays, truncated=True, poisson=True, principal=True);"
+                  "print(SLICE_KERNEL, hashlib.md5(b''.join(arrays_to_records(arrays))).hexdigest())")
+        arrays = self.decompress(truncated=True, poisson=True, principal=True)
+        expected = hashlib.md5(b"".join(arrays_to_records(arrays))).hexdigest()
+        supported = supported_slice_kernels()
+        for kernel in ("scalar", "sse2", "avx2"):
+            with self.subTest(kernel=kernel):
+                if kernel not in supported:
+                    self.skipTest(f"{kernel} kernel is not supported by this CPU")
+                env = dict(os.environ, OAP_SLICE_KERNEL=kernel, PYTHONPATH=os.pathsep.join(sys.path))
+                output = subprocess.run([sys.executable, "-c", script, self.filename],
+                                        env=env, check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+                self.assertEqual(output.split(), [kernel, expected])
+
+    def test_columnar(self):
+        kwargs = dict(truncated=True, poisson=True, cluster=True, principal=True)
+        arrays = self.decompress(**kwargs)
+        for threads in (1, 3):
+            columns = decompress(self.filename, columnar=True, threads=threads, **kwargs)
+            self.assertEqual(columns.dtype, PARTICLE_DTYPE)
+            self.assertEqual(columns.tobytes(), arrays_to_records(arrays)[0])
+        self.assertEqual(list(columns["number"]), [a.number for a in arrays])
+        self.assertEqual(len(decompress(self.filename, columnar=True, timeframes=[(0, 1)])), 0)
+
+    def test_contiguous(self):
+        expected = self.decompress(truncated=True)
+        arrays = []
+        records, pixels, offsets = decompress(self.filename, arrays=arrays, contiguous=True, truncated=True, threads=2)
+        self.assertEqual(records.tobytes(), arrays_to_records(expected)[0])
+        self.assertEqual(pixels.tobytes(), arrays_to_records(expected)[1])
+        self.assertEqual(list(offsets[1:] - offsets[:-1]), [64 * a.height() for a in expected])
+        self.assertEqual(len(arrays), len(expected))
+        for i, array in enumerate(arrays):
+            self.assertIsNotNone(array.base)
+            self.assertEqual(array.bytes(), pixels[offsets[i]:offsets[i+1]].tobytes())
+        del records, pixels, offsets
+        self.assertEqual([a.bytes() for a in arrays], [a.bytes() for a in expected])
+        self.assertIsNone(OpticalArray(expected[0].bytes(), y_dim=expected[0].height()).base)
+
+    def test_packed(self):
+        kwargs = dict(truncated=True, poisson=True)
+        expected = self.decompress(**kwargs)
+        arrays = self.decompress(packed=True, **kwargs)
+        self.assertTrue(all(a.packed and a.base is None for a in arrays))
+        self.assertTrue(any(7 in a.list() for a in arrays))
+        self.assertEqual(arrays_to_records(arrays), arrays_to_records(expected))
+        for array, other in zip(arrays, expected):
+            self.assertEqual(array.list(), other.list())
+            self.assertEqual(array.tensor(), other.tensor())
+            self.assertEqual(array.components(), other.components())
+            self.assertEqual(pickle.loads(pickle.dumps(array)).bytes(), other.bytes())
+            self.assertEqual(repr(array), repr(other))
+
+        lines = repr(expected[0]).split("\n")
+        self.assertEqual(len(lines), expected[0].height())
+        self.assertEqual("".join(lines), "".join(" " if level == 0 else str(level) if level <= 3 else "X"
+                                                 for level in expected[0].list()))
+        references = sys.getrefcount(None)
+        for _ in range(10):
+            self.assertIsNone(arrays[0].print())
+        self.assertEqual(sys.getrefcount(None), references)
+
+        array = arrays[0]
+        array.unpack()
+        self.assertFalse(array.packed)
+        self.assertEqual(array.bytes(), expected[0].bytes())
+        array.pack()
+        self.assertTrue(array.packed)
+        self.assertEqual(array.bytes(), expected[0].bytes())
+        with self.assertRaises(ValueError):
+            OpticalArray(bytes([5] * 64), y_dim=1).pack()
+
+    def test_buffer_protocol(self):
+        for packed in (False, True):
+            for array in self.decompress(truncated=True, poisson=True, packed=packed)[:20]:
+                pixels = np.asarray(array)
+                self.assertEqual(pixels.shape, (array.height(), 64))
+                self.assertEqual(pixels.dtype, np.uint8)
+                self.assertFalse(pixels.flags.writeable)
+                self.assertEqual(pixels.tobytes(), array.bytes())
+                self.assertEqual(memoryview(array).tobytes(), array.bytes())
+
+        array = self.decompress(truncated=True)[0]
+        view = memoryview(array)
+        self.assertTrue(view.readonly)
+        with self.assertRaises(BufferError):
+            array.pack()
+        view.release()
+        array.pack()
+        with self.assertRaises(TypeError):
+            memoryview(array)[0, 0] = 1
+
+    def test_tensors(self):
+        arrays = self.decompress(truncated=True, poisson=True)
+        expected = np.reshape([a.tensor() for a in arrays], (len(arrays), 64, 64, 1))
+        result = tensors(arrays)
+        self.assertEqual(result.dtype, np.float32)
+        self.assertTrue(np.array_equal(result, expected))
+
+        out = np.full((len(arrays) + 5, 64, 64, 1), -1, dtype=np.float32)
+        for array in arrays:
+            array.pack()
+        self.assertIs(tensors(arrays, out=out[:len(arrays)]).base, out)
+        self.assertTrue(np.array_equal(out[:len(arrays)], expected))
+        self.assertTrue(np.all(out[len(arrays):] == -1))
+        self.assertEqual(tensors([]).shape, (0, 64, 64, 1))
+
+        with self.assertRaises(TypeError):
+            tensors(arrays, out=np.zeros((len(arrays), 64, 64, 1)))
+        with self.assertRaises(ValueError):
+            tensors(arrays, out=np.zeros((1, 64, 64, 1), dtype=np.float32))
+
+    def test_filters(self):
+        def assert_particles(first, second):
+            self.assertEqual(arrays_to_records(first), arrays_to_records(second))
+
+        arrays = self.decompress(truncated=True)
+        timeframes = [(36005, 36003), (36003, 36003), (36000, 36000), (36001, 36001), (36003, 36004), (36002, 36003)]
+        timeframes = timeframes[:3] + [(36000 + i % 3, 36000 + i % 3) for i in range(3000)]
+        expected = [a for a in arrays if any(t0 <= a.second <= t1 for t0, t1 in timeframes)]
+        self.assertTrue(0 < len(expected) < len(arrays))
+        assert_particles(self.decompress(truncated=True, timeframes=timeframes), expected)
+
+        y_sizes = [(8, 12), (1, 3), (10, 20), (25, 24)]
+        expected = [a for a in arrays if any(y0 <= a.height() <= y1 for y0, y1 in y_sizes)]
+        self.assertTrue(0 < len(expected) < len(arrays))
+        assert_particles(self.decompress(truncated=True, y_sizes=y_sizes), expected)
+        self.assertEqual(self.decompress(truncated=True, y_sizes=["invalid"]), [])
+
+        per_buffer = [self.decompress(truncated=True, include_buffers=[i]) for i in range(len(self.buffers))]
+        assert_particles(sum(per_buffer, []), arrays)
+        selected = [2, 0, 2, -1, 1000]
+        assert_particles(self.decompress(truncated=True, include_buffers=selected), per_buffer[0] + per_buffer[2])
+        assert_particles(self.decompress(truncated=True, exclude_buffers=selected),
+                         sum(per_buffer[1:2] + per_buffer[3:], []))
+
+        n_buffers = len(self.buffers)
+        ranges = [(1, 2), (n_buffers - 1, 10**12), (-5, 0)]
+        expected = per_buffer[0:3] + per_buffer[-1:]
+        for threads in (1, 3):
+            assert_particles(self.decompress(truncated=True, include_buffers=ranges, threads=threads),
+                             sum(expected, []))
+            assert_particles(self.decompress(truncated=True, include_buffers=ranges, exclude_buffers=[(2, 5)],
+                                             threads=threads), sum(per_buffer[0:2] + per_buffer[-1:], []))
+        assert_particles(self.decompress(truncated=True, exclude_buffers=[(1, n_buffers)]), per_buffer[0])
+        self.assertEqual(self.decompress(truncated=True, include_buffers=[(3, 2)]), [])
+        with self.assertRaises(ValueError):
+            self.decompress(include_buffers=[(1, 2, 3)])
+
+    def test_buffer_index(self):
+        filename = os.path.join(self.directory, "Imagefile_indexed")
+        shutil.copy(self.filename, filename)
+        self.assertIsNone(load_index(filename))
+        self.assertEqual(build_index(filename), filename + ".idx")
+        self.assertEqual(BUFFER_SIZE, importlib.import_module("__oap_c.core").BUFFER_SIZE)
+
+        entries = load_index(filename)
+        self.assertEqual(len(entries), len(self.buffers))
+        for i, entry in enumerate(entries):
+            seconds = [a.second for a in self.decompress(truncated=True, include_buffers=[i])]
+            self.assertEqual((entry["min_second"], entry["max_second"], entry["particles"]),
+                             (min(seconds), max(seconds), len(seconds)))
+
+        timeframes = [(36003, 36004), (36001, 36001)]
+        buffers = indexed_buffers(filename, timeframes)
+        self.assertTrue(0 < sum(last - first + 1 for first, last in buffers) < len(self.buffers))
+        for kwargs in ({"truncated": True}, {"truncated": True, "exclude_buffers": [1]}, {"threads": 2}):
+            expected = []
+            decompress(filename, timeframes, arrays=expected, index=False, **kwargs)
+            arrays = []
+            decompress(filename, timeframes, arrays=arrays, **kwargs)
+            self.assertEqual(arrays_to_records(arrays), arrays_to_records(expected))
+        self.assertEqual(decompress(filename, timeframes, include_buffers=[0, 1], truncated=True),
+                         decompress(filename, timeframes, include_buffers=[0, 1], truncated=True, index=False))
+        self.assertEqual(indexed_buffers(filename, [(36005, 36003)]), [])
+        self.assertIsNone(indexed_buffers(filename, None))
+
+        # Buffers, which are appended after building the index, are always decoded.
+        write_imagefile(filename, self.buffers + grayscale_buffers(random_particles(50, seed=1, start=36001)))
+        self.assertEqual(indexed_buffers(filename, [(36100, 36200)]), [(len(self.buffers), len(self.buffers) + 1)])
+        self.assertEqual(decompress(filename, [(36001, 36002)], truncated=True),
+                         decompress(filename, [(36001, 36002)], truncated=True, index=False))
+
+        write_imagefile(filename, self.buffers, date=(2021, 1, 1))
+        self.assertIsNone(load_index(filename))
+
+        # A rewritten imagefile with the same first buffer is detected by the header of the
+        # last indexed buffer, which contains the recording time of the buffer.
+        write_imagefile(filename, self.buffers)
+        build_index(filename)
+        buffers = self.buffers[:1] + grayscale_buffers(random_particles(200, seed=3, start=36010))
+        write_imagefile(filename, buffers)
+        with open(filename, "r+b") as file:
+            file.seek((len(self.buffers) - 1) * BUFFER_SIZE + 6)
+            file.write((12).to_bytes(2, "little"))
+        self.assertGreaterEqual(len(buffers), len(self.buffers))
+        self.assertIsNone(load_index(filename))
+        self.assertEqual(decompress(filename, [(36010, 36100)], truncated=True),
+                         decompress(filename, [(36010, 36100)], truncated=True, index=False))
+
+    def test_monoscale(self):
+        filename = os.path.join(self.directory, "Imagefile_monoscale")
+        write_imagefile(filename, monoscale_buffers(self.particles))
+        expected = [p for p in self.particles if any(any(row) for row in p["image"])]
+
+        arrays = []
+        self.assertEqual(decompress(filename, arrays=arrays, truncated=True, probe="monoscale"), len(expected))
+        for array, particle in zip(arrays, expected):
+            self.assertEqual((array.second, array.number, array.millisecond, array.microsecond),
+                             (particle["second"], particle["number"], particle.get("millisecond", 0),
+                              particle.get("microsecond", 0)))
+            self.assertEqual(array.list(), [int(level > 0) for row in particle["image"] for level in row])
+
+        kwargs = dict(truncated=True, poisson=True, cluster=True, principal=True)
+        reference = []
+        decompress(filename, arrays=reference, probe="monoscale", **kwargs)
+        self.assertTrue(any(a.poisson for a in reference))
+        for threads in (1, 3):
+            arrays = []
+            decompress(filename, arrays=arrays, threads=threads, **kwargs)
+            self.assertEqual(arrays_to_records(arrays), arrays_to_records(reference))
+            columns = decompress(filename, columnar=True, threads=threads, **kwargs)
+            self.assertEqual(columns.tobytes(), arrays_to_records(reference)[0])
+
+        timeframes, x_sizes = [(36002, 36004)], [(5, 20)]
+        arrays = []
+        decompress(filename, timeframes, arrays=arrays, x_sizes=x_sizes, **dict(kwargs, truncated=False))
+        self.assertEqual(arrays_to_records(arrays), arrays_to_records(
+            [a for a in reference if 36002 <= a.second <= 36004 and 5 <= a.width() <= 20 and not a.truncated]))
+
+        self.assertEqual(decompress(self.filename, probe="auto"), decompress(self.filename, probe="grayscale"))
+        self.assertEqual((detect_probe(filename), detect_probe(self.filename)), ("monoscale", "grayscale"))
+        with self.assertRaises(ValueError):
+            decompress(filename, probe="stereo")
+
+        # The probe of an indexed imagefile is taken from the index.
+        build_index(filename)
+        with Container(filename + ".idx") as container:
+            self.assertEqual(container.attributes["probe"], "monoscale")
+        self.assertEqual(decompress(filename, timeframes, **kwargs),
+                         decompress(filename, timeframes, probe="monoscale", index=False, **kwargs))
+        build_index(filename, probe="grayscale")
+        self.assertEqual(decompress(filename, **kwargs), decompress(filename, probe="grayscale", index=False, **kwargs))
+        self.assertEqual(decompress(filename, probe="monoscale", **kwargs), len(reference))
+        os.remove(filename + ".idx")
+
+    def test_thread_pool(self):
+        expected = decompress(self.filename, truncated=True, timeframes=[(36002, 36004)])
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(decompress, self.filename, truncated=True, timeframes=[(36002, 36004)])
+                       for _ in range(8)]
+        self.assertEqual([future.result() for future in futures], [expected] * 8)
+
+    def test_components(self):
+        image = bytearray(4 * 64)
+        image[0*64+1] = image[1*64+2] = image[2*64+1] = 3
+        for y in range(4):
+            image[y*64+10] = 1
+        image[3*64+11] = 2
+        image[1*64+20] = 7
+        array = OpticalArray(bytes(image), y_dim=4)
+        self.assertEqual(array.components(), [(3, 1, 2, 0, 2), (5, 10, 11, 0, 3)])
+
+        arrays = self.decompress(truncated=True, cluster=True)
+        self.assertEqual([a.cluster for a in arrays], [len(a.components()) for a in arrays])
+        self.assertTrue(any(a.cluster > 1 for a in arrays))
+
+    def test_long_shadow(self):
+        filename = os.path.join(self.directory, "Imagefile_long")
+        particle = dict(self.particles[0], image=[[0] * 20 + [3] * 24 + [0] * 20] * 250)
+        write_imagefile(filename, grayscale_buffers([particle]))
+        arrays = []
+        decompress(filename, arrays=arrays, truncated=True, cluster=True, poisson=True, principal=True)
+        self.assertEqual(len(arrays), 1)
+        self.assertEqual(arrays[0].cluster, 1)
+        self.assertEqual(arrays[0].components(), [(250 * 24, 20, 43, 0, 249)])
+
+    def test_poisson_spot(self):
+        closed = ring_particle(36000, 1, size=16)
+        opened = ring_particle(36000, 2, size=16)
+        opened["image"] = [row[:27] + [0] * 2 + row[29:] for row in opened["image"]]
+        filename = os.path.join(self.directory, "Imagefile_poisson")
+        write_imagefile(filename, grayscale_buffers([closed, opened]))
+        arrays = []
+        decompress(filename, arrays=arrays, truncated=True, poisson=True)
+        self.assertEqual([a.number for a in arrays], [1, 2])
+        self.assertGreater(arrays[0].poisson, 0)
+        self.assertIn(7, arrays[0].list())
+        self.assertEqual(arrays[1].poisson, 0)
+        self.assertNotIn(7, arrays[1].list())
+
+    def test_truncated(self):
+        arrays = self.decompress(truncated=False)
+        self.assertTrue(arrays)
+        self.assertFalse(any(array.truncated for array in arrays))
+
+    def test_incomplete_buffer(self):
+        filename = os.path.join(self.directory, "Imagefile_incomplete")
+        with open(self.filename, "rb") as source, open(filename, "wb") as target:
+            target.write(source.read() + bytes(1000))
+        self.assertEqual(len(self.decompress(truncated=True)),
+                         decompress(filename, truncated=True))
+
+    def test_missing_file(self):
+        with self.assertRaises(OSError):
+            decompress(os.path.join(self.directory, "missing"))
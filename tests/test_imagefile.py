@@ -0,0 +1,308 @@
+"""
+Testing the Imagefile class of oap.lib.imagefile
+"""
+
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+import oap
+from oap.lib.container import Container, write_container
+from tests.synthetic import grayscale_buffers, random_particles, write_imagefile
+
+
+def particle_tuples(arrays):
+    return [(a.second, a.number, a.millisecond, a.hit_ratio, a.alpha, a.poisson, a.bytes()) for a in arrays]
+
+
+def reference_arrays(arrays, timespan=(0, 86400), area_ratio=(0, 1e9), x=(0, 1e9), y=(0, 1e9),
+                     hit_ratio=(0, 1), axis_ratio=(0, 1e9), alpha=(-360, 360), c=(0, 1), r=(0, 1), timeshift=0):
+    return [array for array in arrays
+            if timespan[0] <= array.second+timeshift <= timespan[1]
+            and area_ratio[0] <= array.area_ratio() <= area_ratio[1]
+            and x[0] <= array.width() <= x[1]
+            and y[0] <= array.height() <= y[1]
+            and hit_ratio[0] <= array.hit_ratio <= hit_ratio[1]
+            and axis_ratio[0] <= array.axis_ratio <= axis_ratio[1]
+            and alpha[0] <= array.alpha <= alpha[1]
+            and c[0] <= array.column <= c[1]
+            and r[0] <= array.rosette <= r[1]]
+
+
+FILTERS = [{},
+           {"timespan": (36001, 36003)},
+           {"timespan": (0, 36001), "timeshift": -2},
+           {"x": (5, 64), "y": (5, 64)},
+           {"area_ratio": (100, 400), "hit_ratio": (0.3, 0.9)},
+           {"axis_ratio": (1.5, 1e9), "alpha": (-45, 45)}]
+
+
+class TestImagefile(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.filename = os.path.join(cls.directory, "Imagefile_synthetic")
+        write_imagefile(cls.filename, grayscale_buffers(random_particles(300, seed=7)))
+        cls.imagefile = oap.Imagefile(cls.filename, status=False)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def test_container(self):
+        filename = os.path.join(self.directory, "columns.oap")
+        columns = {"a": np.arange(10, dtype=np.int16), "b": np.ones((3, 4), dtype=np.float32),
+                   "empty": np.zeros(0, dtype=np.uint8)}
+        write_container(filename, columns, attributes={"name": "test"}, compression={"b": "zlib"})
+        container = Container(filename)
+        self.assertEqual(container.attributes, {"name": "test"})
+        self.assertEqual(container.names(), ["a", "b", "empty"])
+        for name, values in columns.items():
+            self.assertEqual(container[name].dtype, values.dtype)
+            self.assertTrue(np.array_equal(container[name], values))
+        self.assertFalse(container["a"].flags.writeable)
+        container.close()
+        self.assertTrue(container.closed)
+        with self.assertRaises(ValueError):
+            container["a"]
+        with self.assertRaises(ValueError):
+            write_container(filename, columns, compression="lz4")
+        self.assertFalse([name for name in os.listdir(self.directory) if name.endswith(".tmp")])
+        with Container(filename) as container:
+            self.assertEqual(container.attributes, {"name": "test"})
+        self.assertTrue(container.closed)
+
+    def test_save(self):
+        for compression in (None, "zlib"):
+            filename = os.path.join(self.directory, f"imagefile_{compression}.oap")
+            self.imagefile.save(filename, compression=compression)
+            loaded = oap.load_imagefile(filename)
+            self.assertIsNone(loaded._arrays)
+            self.assertEqual(len(loaded), len(self.imagefile))
+            self.assertEqual((loaded.min_time, loaded.max_time), (self.imagefile.min_time, self.imagefile.max_time))
+            self.assertEqual(loaded.filename, self.filename)
+            self.assertEqual(particle_tuples(loaded.arrays), particle_tuples(self.imagefile.arrays))
+
+    def test_save_to_source(self):
+        filename = os.path.join(self.directory, "source.oap")
+        self.imagefile.save(filename)
+        for compression in (None, "zlib", None):
+            loaded = oap.load_imagefile(filename)
+            loaded.save(filename, compression=compression)
+            self.assertIsNone(loaded._arrays)
+            self.assertEqual(particle_tuples(oap.load_imagefile(filename).arrays),
+                             particle_tuples(self.imagefile.arrays))
+            self.assertEqual(particle_tuples(loaded.arrays), particle_tuples(self.imagefile.arrays))
+            self.assertIsNone(loaded._container)
+        self.assertFalse([name for name in os.listdir(self.directory) if name.endswith(".tmp")])
+
+    def test_load_pickle(self):
+        filename = os.path.join(self.directory, "imagefile.pickle")
+        with open(filename, "wb") as file:
+            pickle.dump(self.imagefile, file)
+        loaded = oap.load_imagefile(filename)
+        self.assertEqual(particle_tuples(loaded.arrays), particle_tuples(self.imagefile.arrays))
+
+    def test_native_particles(self):
+        filename = os.path.join(self.directory, "native.oap")
+        self.imagefile.save(filename)
+        loaded = oap.load_imagefile(filename)
+        for imagefile in (self.imagefile, loaded):
+            records, pixels, offsets = imagefile._native_particles()
+            self.assertEqual(len(records), len(self.imagefile))
+            self.assertEqual(offsets[-1], len(pixels))
+            self.assertEqual(list(records["number"]), [a.number for a in self.imagefile.arrays])
+            self.assertEqual([pixels[offsets[i]:offsets[i+1]].tobytes() for i in range(len(records))],
+                             [a.bytes() for a in self.imagefile.arrays])
+        self.assertIsNone(loaded._arrays)
+
+        # Referenced columns keep the memory map open, after the arrays were loaded.
+        self.assertEqual(particle_tuples(loaded.arrays), particle_tuples(self.imagefile.arrays))
+        self.assertIsNone(loaded._container)
+        self.assertEqual(offsets[-1], len(pixels))
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_arrow(self):
+        arrays = self.imagefile.arrays
+        for images in ("list", "binary"):
+            table = self.imagefile.to_arrow(images=images)
+            self.assertEqual(table.num_rows, len(arrays))
+            self.assertEqual(table.column("number").to_pylist(), [a.number for a in arrays])
+            self.assertEqual([bytes(image) for image in table.column("image").to_pylist()],
+                             [a.bytes() for a in arrays])
+
+        import pyarrow.parquet as pq
+        filename = os.path.join(self.directory, "particles.parquet")
+        self.imagefile.to_parquet(filename, row_group_size=100)
+        table = pq.read_table(filename)
+        self.assertEqual(table.column("second").to_pylist(), [a.second for a in arrays])
+        self.assertEqual(pq.ParquetFile(filename).metadata.num_row_groups, -(-len(arrays) // 100))
+
+    def test_get_arrays(self):
+        arrays = self.imagefile.arrays
+        for kwargs in FILTERS:
+            expected = reference_arrays(arrays, **kwargs)
+            self.assertTrue(0 < len(expected) < len(arrays) or not kwargs, kwargs)
+            self.assertEqual(self.imagefile.get_arrays(**kwargs), expected)
+
+            x, y = self.imagefile.counts_per_second(**kwargs)
+            timeshift = kwargs.get("timeshift", 0)
+            counts = dict.fromkeys(range(arrays[0].second+timeshift, arrays[-1].second+timeshift+1), 0)
+            for array in expected:
+                counts[array.second+timeshift] += 1
+            self.assertEqual(list(x), list(counts.keys()))
+            self.assertEqual(list(y), list(counts.values()))
+
+    def test_metadata_cache(self):
+        imagefile = oap.Imagefile(self.filename, status=False)
+        self.assertEqual(len(imagefile.get_arrays(c=(0.5, 1))), 0)
+        imagefile.arrays[0].column = 0.75
+        self.assertEqual(imagefile.get_arrays(c=(0.5, 1)), [imagefile.arrays[0]])
+        self.assertEqual(imagefile.counts(c=(0.5, 1))[1].sum(), 1)
+        imagefile.arrays[0].column = 0.25
+        self.assertEqual(imagefile.get_arrays(c=(0.5, 1)), [])
+        self.assertEqual(imagefile.counts(c=(0.5, 1))[1].sum(), 0)
+
+        # Replaced particles are only detected by invalidate.
+        last = imagefile.arrays[-1]
+        last.column = 0.75
+        self.assertEqual(imagefile.get_arrays(c=(0.5, 1)), [last])
+        imagefile.arrays[0] = last
+        imagefile.invalidate()
+        self.assertEqual(imagefile.get_arrays(c=(0.5, 1)), [last, last])
+        last.column = 0
+        imagefile.arrays = imagefile.arrays[1:]
+        self.assertEqual(len(imagefile.get_arrays(c=(0.5, 1))), 0)
+
+        # In-place changes of the length are detected without invalidate.
+        first = imagefile.arrays[0]
+        self.assertEqual(imagefile.get_arrays(x=(0, 64))[0], first)
+        del imagefile.arrays[0]
+        self.assertEqual(imagefile.get_arrays(x=(0, 64)), reference_arrays(imagefile.arrays, x=(0, 64)))
+        imagefile.arrays.insert(0, first)
+        imagefile.arrays.pop()
+        self.assertEqual(imagefile.get_arrays(x=(0, 64)), reference_arrays(imagefile.arrays, x=(0, 64)))
+        self.assertEqual(imagefile.get_indices(x=(0, 64))[-1], len(imagefile.arrays) - 1)
+        counts = imagefile.counts(timespan=(0, 86400))[1].sum()
+        imagefile.arrays.append(imagefile.arrays[-1])
+        self.assertEqual(imagefile.counts(timespan=(0, 86400))[1].sum(), counts + 1)
+
+    def test_time_slicing(self):
+        arrays = self.imagefile.arrays
+        time = [a.second + a.millisecond / 1e3 + a.microsecond / 1e6 for a in arrays]
+        start, stop = time[len(time) // 4], time[len(time) // 2] + 0.0005
+        subset = self.imagefile[start:stop]
+        expected = [a for a, t in sorted(zip(arrays, time), key=lambda item: round(item[1] * 1e6))
+                    if round(start * 1e6) <= round(t * 1e6) < round(stop * 1e6)]
+        self.assertTrue(expected)
+        self.assertEqual(len(subset), len(expected))
+        self.assertTrue(all(a is b for a, b in zip(subset.arrays, expected)))
+        self.assertEqual(subset.get_arrays(x=(5, 64)), reference_arrays(expected, x=(5, 64)))
+
+        self.assertEqual(len(self.imagefile[:]), len(arrays))
+        self.assertEqual(len(self.imagefile[stop:start]), 0)
+        self.assertEqual(len(self.imagefile[:start]) + len(self.imagefile[start:]), len(arrays))
+        self.assertEqual(len(self.imagefile[36001:36002]), len(reference_arrays(arrays, timespan=(36001, 36001))))
+        with self.assertRaises(TypeError):
+            self.imagefile[0]
+
+        ordered = oap.Imagefile()
+        ordered.arrays = list(expected)
+        ordered.number_of_particles = len(expected)
+        self.assertIsNone(ordered._time_index()[1])
+        self.assertEqual(ordered[:stop].arrays, expected)
+        self.assertTrue(np.shares_memory(ordered[start:]._metadata()["second"], ordered._metadata()["second"]))
+        self.assertEqual(ordered.get_arrays(timespan=(36001, 36002)),
+                         reference_arrays(expected, timespan=(36001, 36002)))
+
+        reverse = oap.Imagefile()
+        reverse.arrays = arrays[::-1]
+        reverse.number_of_particles = len(arrays)
+        self.assertEqual(reverse.get_arrays(timespan=(36001, 36002)),
+                         reference_arrays(arrays[::-1], timespan=(36001, 36002)))
+
+    def test_counts(self):
+        imagefile = oap.Imagefile(self.filename, status=False)
+        for kwargs in FILTERS:
+            x, y = imagefile.counts_per_second(**kwargs)
+            self.assertIs(imagefile.counts_per_second(**kwargs)[1], y)
+            self.assertFalse(y.flags.writeable)
+            for resolution in (10, 60, 600):
+                bins, counts = imagefile.counts(resolution, **kwargs)
+                self.assertEqual(counts.sum(), y.sum())
+                self.assertTrue(np.all(bins % resolution == 0))
+                self.assertEqual(list(counts), [y[(x >= b) & (x < b + resolution)].sum() for b in bins])
+        with self.assertRaises(ValueError):
+            imagefile.counts(5)
+
+        y = imagefile.counts_per_second(c=(0.5, 1))[1]
+        self.assertEqual(y.sum(), 0)
+        imagefile.arrays = imagefile.arrays[:10]
+        self.assertEqual(imagefile.counts_per_second()[1].sum(), 10)
+
+    def test_follow(self):
+        with open(self.filename, "rb") as file:
+            data = file.read()
+        n_buffers = len(data) // oap.core.BUFFER_SIZE
+        self.assertGreater(n_buffers, 3)
+
+        # The probe is detected, once the first buffer is complete.
+        filename = os.path.join(self.directory, "Imagefile_growing")
+        with open(filename, "wb") as file:
+            file.write(data[:100])
+        self.assertEqual(oap.Imagefile.follow(filename)._follow["probe"], "auto")
+        with open(filename, "wb") as file:
+            file.write(data[:oap.core.BUFFER_SIZE + 100])
+        imagefile = oap.Imagefile.follow(filename, x_sizes=[(5, 64)])
+        self.assertEqual(imagefile.checkpoint, oap.core.BUFFER_SIZE)
+        self.assertEqual(imagefile._follow["probe"], "grayscale")
+        first = len(imagefile)
+        self.assertGreater(first, 0)
+        self.assertEqual(imagefile.update(), 0)
+
+        # The metadata columns are extended with the particles of the new buffers.
+        imagefile.get_arrays()
+        imagefile.counts_per_second()
+        with open(filename, "ab") as file:
+            file.write(data[oap.core.BUFFER_SIZE + 100:3 * oap.core.BUFFER_SIZE])
+        self.assertGreater(imagefile.update(), 0)
+        with open(filename, "ab") as file:
+            file.write(data[3 * oap.core.BUFFER_SIZE:])
+        imagefile.update()
+        self.assertEqual(imagefile.checkpoint, len(data))
+
+        expected = oap.Imagefile(self.filename, x_sizes=[(5, 64)], status=False)
+        self.assertEqual(len(imagefile), len(expected))
+        self.assertEqual(particle_tuples(imagefile.arrays), particle_tuples(expected.arrays))
+        self.assertEqual(imagefile.max_time, expected.max_time)
+        for kwargs in FILTERS:
+            self.assertEqual(particle_tuples(imagefile.get_arrays(**kwargs)),
+                             particle_tuples(expected.get_arrays(**kwargs)))
+            self.assertEqual(imagefile.counts_per_second(**kwargs)[1].tolist(),
+                             expected.counts_per_second(**kwargs)[1].tolist())
+        self.assertEqual(len(imagefile[36001:36003]), len(expected[36001:36003]))
+
+        # The checkpoint and the options are saved, so that the decoding can be resumed.
+        saved = os.path.join(self.directory, "growing.oap")
+        with open(filename, "wb") as file:
+            file.write(data[:2 * oap.core.BUFFER_SIZE])
+        imagefile = oap.Imagefile.follow(filename, x_sizes=[(5, 64)])
+        imagefile.save(saved)
+        with open(filename, "ab") as file:
+            file.write(data[2 * oap.core.BUFFER_SIZE:])
+        loaded = oap.load_imagefile(saved)
+        loaded.update()
+        self.assertEqual(particle_tuples(loaded.arrays), particle_tuples(expected.arrays))
+
+        with self.assertRaises(ValueError):
+            self.imagefile.update()